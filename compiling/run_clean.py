@@ -1,4 +1,7 @@
-import measury
+import multiprocessing
+from measury.__main__ import main
 
 if __name__ == "__main__":
-    measury.run()
+    # the worker processes of the batch mode start the executable again
+    multiprocessing.freeze_support()
+    main()
@@ -10,4 +10,12 @@ except ImportError:
 # for compiling the program
 measury_path = Path(__file__).parent.resolve()
 
-from .app import run
\ No newline at end of file
+
+
+def run(file_path=None, logger=None):
+    """Start Measury, see app.run."""
+    # PySide6, vispy and OpenCV are only imported when the GUI is started,
+    # so that `import measury` stays fast
+    from .app import run as run_app
+
+    run_app(file_path=file_path, logger=logger)
\ No newline at end of file
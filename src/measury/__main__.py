@@ -1,3 +1,33 @@
-from .app import run
+import sys
 
-run()
+
+def main(argv=None):
+    """Entry point of the measury command.
+
+        measury [file]              start the GUI, optionally with a file
+        measury batch ...           measure images without the GUI
+        measury --profile-startup   print the import times of the startup
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] == "batch":
+        from .batch import main as batch_main
+
+        return batch_main(argv[1:])
+
+    if argv and argv[0] == "--profile-startup":
+        from .startup_profile import profile_startup
+
+        profile_startup()
+        return 0
+
+    from .app import run
+
+    run()
+    return 0
+
+
+# the guard keeps worker processes of the batch mode from starting the GUI
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 # absolute imports
 from vispy.app import use_app
+from PySide6.QtCore import QTimer
 import sys
 import warnings
 
@@ -82,14 +83,19 @@ class App:
         Closes the application by quitting the Vispy app and
         closing the main window.
         """
+        self.main_window.vispy_canvas.cancel_image_decoding()
         self.vispy_app.quit()
         self.main_window.close()
 
 
 def run(file_path=None, logger=None):
     if len(sys.argv) > 1:
-        app = App(file_path=sys.argv[1], logger=logger)
-    else:
-        app = App(file_path=file_path, logger=logger)
-
+        file_path = sys.argv[1]
+
+    app = App(logger=logger)
+    # show the window first and open the file once the event loop is running
+    QTimer.singleShot(0, lambda: app.data_handler.open_file(file_path=file_path))
+    if file_path is None:
+        # the measurements of a session that crashed can be restored
+        QTimer.singleShot(0, app.main_window.offer_crashed_sessions)
     app.run()
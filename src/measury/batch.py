@@ -0,0 +1,212 @@
+"""
+Measure a folder of images without the GUI
+
+    python -m measury batch FOLDER --template template.msry [--microscope NAME]
+
+The scale bar of every image is found with the scale bar parameters
+of the template (or of the microscope), unless the metadata of the image
+gives its pixel size. The measurements of the template are evaluated
+with the scaling of each image. All results
+are written into one CSV table.
+"""
+
+# absolute imports
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from datetime import datetime
+import argparse
+import csv
+import logging
+import os
+import numpy as np
+import cv2
+
+# relative imports
+from .image_io import map_file, decode_image
+from .data.microscopes import load_microscopes
+from . import measurements, storage, metadata
+
+IMAGE_EXTENSIONS = (".tif", ".tiff", ".png", ".jpg", ".jpeg", ".bmp", ".npy")
+RESULT_FIELDS = ("image", "scale_bar_px", "structure", "object", "property", "value", "unit", "error")
+
+logger = logging.getLogger("Measury")
+
+
+def load_template(file_path: Path, microscope: str | None = None) -> dict:
+    """Read the measurements and scale bar parameters of a .msry file.
+
+    Args:
+        file_path (Path): path of the .msry template
+        microscope (str, optional): use the seed points, orientation and
+            threshold of this microscope instead of the ones of the template
+
+    Returns:
+        dict: the template
+    """
+    if not storage.is_storage_container(file_path):
+        raise ValueError(
+            f"{file_path} uses the old file format, open and save it again to use it as a template"
+        )
+    storage_file = storage.StorageFile(file_path)
+    scaling = storage_file.scaling or (None, None, None)
+
+    length = None
+    if len(scaling) > 1 and scaling[1] not in (None, ""):
+        length = float(scaling[1])
+    seed_points, relative, threshold, direction = None, True, None, None
+    if len(scaling) > 3 and scaling[3] is not None:
+        seed_points, relative, threshold, direction = scaling[3]
+
+    if microscope is not None:
+        micros_db = load_microscopes()
+        if microscope not in micros_db:
+            raise ValueError(f"unknown microscope: {microscope}")
+        microscope = micros_db[microscope]()
+        seed_points, relative = microscope.seed_points, True
+        threshold, direction = microscope.threshold, microscope.orientation
+
+    return dict(
+        structures=storage_file.structures,
+        length=length,
+        unit=scaling[2] if len(scaling) > 2 else None,
+        seed_points=seed_points,
+        relative=relative,
+        threshold=measurements.DEFAULT_THRESHOLD if threshold is None else threshold,
+        direction="horizontal" if direction is None else direction,
+    )
+
+
+def flatten(value) -> list[tuple[str, float]]:
+    """Split array values into one (suffix, value) pair per element."""
+    if np.ndim(value) == 0:
+        return [("", float(value))]
+    return [(f"[{i}]", float(v)) for i, v in enumerate(np.ravel(value))]
+
+
+def measure_image(file_path: Path, template: dict) -> list[dict]:
+    """Find the scaling of an image and evaluate the template on it.
+
+    Returns:
+        list[dict]: one row per property of every object
+    """
+    row = dict(image=str(file_path))
+    try:
+        byte_stream = map_file(file_path)
+        img_data = decode_image(byte_stream)
+
+        scaling_factor = None
+        pixel_size = metadata.read_metadata(byte_stream).pixel_size
+        unit_length = metadata.unit_length(template["unit"])
+        if pixel_size is not None and unit_length is not None:
+            scaling_factor = pixel_size / unit_length
+        elif template["seed_points"] is not None:
+            scale_px, _, _ = measurements.find_scale_bar_width(
+                img_data,
+                template["seed_points"],
+                relative=template["relative"],
+                threshold=template["threshold"],
+                direction=template["direction"],
+            )
+            row["scale_bar_px"] = scale_px
+            if template["length"] is not None:
+                scaling_factor = template["length"] / scale_px
+
+        rows = list()
+        for structure_name, objects in template["structures"].items():
+            for index, (obj_type, state) in enumerate(objects):
+                props = measurements.object_properties(obj_type, state)
+                for prop, (value, unit) in props.items():
+                    value, unit = measurements.scale_property(
+                        prop, value, unit, scaling_factor, template["unit"]
+                    )
+                    for suffix, element in flatten(value):
+                        rows.append(
+                            dict(row, structure=structure_name, object=index,
+                                 property=prop + suffix, value=element, unit=unit)
+                        )
+        return rows
+    except Exception as error:
+        return [dict(row, error=str(error))]
+
+
+def init_worker():
+    # every process measures one image at a time
+    cv2.setNumThreads(1)
+
+
+def find_images(folder: Path, recursive=False) -> list[Path]:
+    files = folder.rglob("*") if recursive else folder.glob("*")
+    return sorted(f for f in files if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def run_batch(image_paths, template: dict, output: Path, workers=None) -> int:
+    """Measure all images and write the results into a CSV file.
+
+    Args:
+        image_paths (list[Path]): the images
+        template (dict): the template, see load_template
+        output (Path): path of the CSV file
+        workers (int, optional): number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        int: number of images that could not be measured
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    measure = partial(measure_image, template=template)
+    failed = 0
+
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+
+        def write(rows):
+            nonlocal failed
+            if rows and rows[0].get("error"):
+                failed += 1
+                logger.warning(f"could not measure {rows[0]['image']}: {rows[0]['error']}")
+            writer.writerows(rows)
+
+        if workers == 1:
+            for rows in map(measure, image_paths):
+                write(rows)
+        else:
+            chunksize = max(1, len(image_paths) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                for rows in executor.map(measure, image_paths, chunksize=chunksize):
+                    write(rows)
+    return failed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="measury batch",
+        description="Measure all images of a folder with a measurement template.",
+    )
+    parser.add_argument("folder", type=Path, help="folder with the images")
+    parser.add_argument("-t", "--template", type=Path, required=True,
+                        help=".msry file with the scaling and the measurements")
+    parser.add_argument("-m", "--microscope", default=None,
+                        help="find the scale bar like this microscope")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="CSV file for the results")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of processes, defaults to the number of CPUs")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="include images of subfolders")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-10s %(message)s")
+    logger.setLevel(logging.INFO)
+
+    template = load_template(args.template, args.microscope)
+    image_paths = find_images(args.folder, args.recursive)
+    output = args.output
+    if output is None:
+        output = args.folder / f"measury_{datetime.now():%Y%m%d_%H%M%S}.csv"
+
+    logger.info(f"measuring {len(image_paths)} images from {args.folder}")
+    failed = run_batch(image_paths, template, output, workers=args.workers)
+    logger.info(f"results written to {output}")
+    return 1 if failed else 0
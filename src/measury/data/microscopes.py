@@ -1,17 +1,114 @@
-import inspect
-import sys
+import logging
+import os
 from abc import ABC
+from functools import lru_cache, partial
+from pathlib import Path
 from typing import Optional, Tuple
-import json
-import xml.etree.ElementTree as ET
-import io
 
+logger = logging.getLogger("Measury")
+
+# user profiles are read from .toml and .json files in these folders,
+# more folders can be given in MEASURY_MICROSCOPE_PATH
+PROFILE_DIRS = [Path.home() / ".measury" / "microscopes"]
+PROFILE_PATH_VARIABLE = "MEASURY_MICROSCOPE_PATH"
+# packages add Microscope subclasses or profile dicts to this group
+ENTRY_POINT_GROUP = "measury.microscopes"
+# the XML footer of an image is searched in chunks of this size,
+# lines longer than MAX_FOOTER_BYTES are not taken as a footer
+FOOTER_CHUNK_BYTES = 1 << 16
+MAX_FOOTER_BYTES = 1 << 24
+
+
+@lru_cache(maxsize=None)
+def load_microscopes() -> dict:
+    """All microscope profiles, found once and cached.
+
+    The profiles are the Microscope subclasses of this module, the profiles
+    of the user files in PROFILE_DIRS and the entry points of the group
+    "measury.microscopes". Later ones replace earlier ones of the same
+    name. Call load_microscopes.cache_clear() to find them again.
+
+    Returns:
+        dict: {name: callable that returns a Microscope}
+    """
+    microscopes = {cls.__name__: cls for cls in BUILTIN_MICROSCOPES}
+    for path in profile_files():
+        try:
+            profiles = read_profile_file(path, path.stat().st_mtime_ns)
+        except Exception as error:
+            logger.warning(f"Could not read microscope profiles from {path}: {error}")
+            continue
+        microscopes.update(profiles)
+    microscopes.update(entry_point_microscopes())
+    return dict(sorted(microscopes.items()))
+
+
+def profile_files() -> list[Path]:
+    folders = list(PROFILE_DIRS)
+    if os.environ.get(PROFILE_PATH_VARIABLE):
+        folders += [Path(p) for p in os.environ[PROFILE_PATH_VARIABLE].split(os.pathsep) if p]
+    files = list()
+    for folder in folders:
+        if folder.is_dir():
+            files += sorted(f for f in folder.iterdir() if f.suffix in (".toml", ".json"))
+    return files
+
+
+@lru_cache(maxsize=64)
+def read_profile_file(path: Path, mtime_ns: int) -> dict:
+    """Read the profiles of a .toml or .json file, a table per microscope:
+
+        [Hitachi_SU8230]
+        seed_points = [0.05, 0.95]
+        orientation = "horizontal"
+        threshold = 10
+        metadata = "text"  # or "xml_footer"
+
+    The parsed file is cached until it is modified (mtime_ns).
+
+    Returns:
+        dict: {name: callable that returns a Microscope}
+    """
+    if path.suffix == ".toml":
+        # tomllib is part of the standard library since Python 3.11
+        import tomllib
+
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    else:
+        import json
+
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+    return {name: profile_factory(profile) for name, profile in data.items()}
+
+
+def profile_factory(profile: dict):
+    """A callable that creates the Microscope of a profile dictionary."""
+    metadata = profile.get("metadata", "text")
+    if metadata not in METADATA_PARSERS:
+        raise ValueError(f"unknown metadata parser: {metadata}")
+    seed_points = profile.get("seed_points")
+    return partial(
+        ProfileMicroscope,
+        seed_points=None if seed_points is None else tuple(seed_points),
+        orientation=profile.get("orientation"),
+        threshold=profile.get("threshold"),
+        metadata=metadata,
+    )
+
+
+def entry_point_microscopes() -> dict:
+    from importlib.metadata import entry_points
 
-def load_microscopes():
     microscopes = dict()
-    for name, obj in inspect.getmembers(sys.modules[__name__]):
-        if inspect.isclass(obj) and issubclass(obj, Microscope) and obj != Microscope:
-            microscopes[name] = obj
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            obj = entry_point.load()
+        except Exception as error:
+            logger.warning(f"Could not load microscope {entry_point.name}: {error}")
+            continue
+        microscopes[entry_point.name] = profile_factory(obj) if isinstance(obj, dict) else obj
     return microscopes
 
 
@@ -41,10 +138,7 @@ class Microscope(ABC):
         :param file_path: The path to the file from which to extract metadata.
         :return: A string representing the metadata.
         """
-        if byte_stream is None:
-            return ""
-        else:
-            return byte_stream.decode("utf-8", errors="ignore")
+        return text_metadata(byte_stream)
 
 
 class Generic_Microscope(Microscope):
@@ -63,62 +157,117 @@ class Zeiss_Orion_Nanofab(Microscope):
         )
 
     def get_metadata(self, byte_stream=None) -> str:
+        return xml_footer_metadata(byte_stream)
 
-        values = self.get_xml(byte_stream)
+    def get_xml(self, byte_stream=None) -> dict:
+        return get_xml(byte_stream)
 
-        # check if values is a non-empty dictionary
-        if isinstance(values, dict):
-            return json.dumps(values, indent=4, ensure_ascii=False)
-        return Microscope().get_metadata(byte_stream)
 
-    def get_xml(self, byte_stream=None) -> dict:
-        # This only works for Zeiss Orion files yet
-        # first check if image was loaded
-        if byte_stream is None:
-            return None
+class ProfileMicroscope(Microscope):
+    """Microscope of a profile from a file or a dictionary entry point."""
 
-        # get last line of file
-        last_line = get_last_line(byte_stream)
+    def __init__(self, *args, metadata="text", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metadata = metadata
 
-        try:
-            root = ET.fromstring(last_line)
-        except ET.ParseError as e:
-            # return None
-            raise Exception(
-                "There was a problem parsing the XML string.\n"
-                "Problematic part of the XML string: "
-                f"'{last_line[max(0, e.position[1]-10):e.position[1]+10]}' "
-                "Are you sure this is a Zeiss Orion Nanofab file?"
-            )
-        # Create a dictionary to store the values
-        values = parse_element(root)
+    def get_metadata(self, byte_stream=None) -> str:
+        return METADATA_PARSERS[self.metadata](byte_stream)
+
+
+def text_metadata(byte_stream=None) -> str:
+    """The content of the image as text."""
+    if byte_stream is None:
+        return ""
+    # str() also accepts memory mapped files and other buffers
+    return str(byte_stream, "utf-8", errors="ignore")
+
+
+def xml_footer_metadata(byte_stream=None) -> str:
+    # the metadata is only read on demand, so json is imported here
+    import json
+
+    values = get_xml(byte_stream)
 
-        return values
+    # check if values is a non-empty dictionary
+    if isinstance(values, dict):
+        return json.dumps(values, indent=4, ensure_ascii=False)
+    return text_metadata(byte_stream)
+
+
+def get_xml(byte_stream=None) -> dict:
+    # This only works for Zeiss Orion files yet
+    # first check if image was loaded
+    if byte_stream is None:
+        return None
+    import xml.etree.ElementTree as ET
+
+    # get last line of file
+    last_line = get_last_line(byte_stream)
+
+    try:
+        values = parse_xml(last_line)
+    except ET.ParseError as e:
+        # return None
+        raise Exception(
+            "There was a problem parsing the XML string.\n"
+            "Problematic part of the XML string: "
+            f"'{last_line[max(0, e.position[1]-10):e.position[1]+10]}' "
+            "Are you sure this is a Zeiss Orion Nanofab file?"
+        )
+    return values
+
+
+# how the metadata of a profile is shown, see ProfileMicroscope
+METADATA_PARSERS = {
+    "text": text_metadata,
+    "xml_footer": xml_footer_metadata,
+}
 
 
 def get_last_line(byte_stream) -> str:
-    with io.BytesIO(byte_stream) as f:
-        # Go to the end of the file
-        f.seek(0, io.SEEK_END)
-        # Get the position (this is the size of the file in bytes)
-        position = f.tell()
-        line = b""
-        # we're now moving backwards through the file
-        while position >= 0:
-            f.seek(position)
-            next_char = f.read(1)
-            # Stop if a newline is found and line is not empty
-            if next_char == b"\n" and line:
+    """The XML footer in the last line of an image file.
+
+    The stream is searched backwards for the start of the line in chunks
+    of FOOTER_CHUNK_BYTES, only the footer is copied out of the stream.
+
+    Args:
+        byte_stream (bytes | mmap | memoryview): content of the image file
+
+    Returns:
+        str: the last line from its first '<' to its last '>' character,
+            empty if the line is longer than MAX_FOOTER_BYTES
+    """
+    with memoryview(byte_stream) as view:
+        size = len(view)
+        # a newline at the very end belongs to the line
+        end = start = size - 1
+        while start > 0:
+            if size - start > MAX_FOOTER_BYTES:
+                return ""
+            start = max(0, end - FOOTER_CHUNK_BYTES)
+            newline = bytes(view[start:end]).rfind(b"\n")
+            if newline != -1:
+                start += newline + 1
                 break
-            line = next_char + line
-            position -= 1
-        # remove last end character
-        last_line = line.decode(encoding="utf-8", errors="replace").strip()[:-1]
-        # remove all elements before the first '<' and the last '>' character
-        last_line = last_line[last_line.find("<"):last_line.rfind(">") + 1]
-        last_line.replace("\n", "")
-        
-        return last_line
+            end = start
+        line = bytes(view[max(start, 0):])
+    # remove last end character
+    last_line = line.decode(encoding="utf-8", errors="replace").strip()[:-1]
+    # remove all elements before the first '<' and the last '>' character
+    return last_line[last_line.find("<"):last_line.rfind(">") + 1]
+
+
+@lru_cache(maxsize=8)
+def parse_xml(xml_string: str) -> dict:
+    """Parse an XML string into a dictionary, see parse_element.
+
+    The results are cached by the content of the string, so the footer of
+    an image is only parsed once. The returned dictionary is shared and
+    must not be changed.
+    """
+    import xml.etree.ElementTree as ET
+
+    return parse_element(ET.fromstring(xml_string))
 
 
 def parse_element(element) -> dict:
@@ -170,6 +319,9 @@ class Jeol_JSM_6500F(Microscope):
         )
 
 
+BUILTIN_MICROSCOPES = [Generic_Microscope, Zeiss_Orion_Nanofab, Zeiss_Crossbeam_550L, Jeol_JSM_6500F]
+
+
 if __name__ == "__main__":
     microscopes = load_microscopes()
     for microscope in microscopes:
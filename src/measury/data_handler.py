@@ -4,27 +4,37 @@ from PySide6.QtWidgets import QFileDialog, QMessageBox
 from PySide6.QtGui import QGuiApplication, QUndoCommand, QImage
 import pickle
 import os
+import time
 from subprocess import Popen
 from sys import platform
-from copy import deepcopy
 import logging
 import numpy as np
 import cv2
 
 # you need this import as they are implicitly used
-from .drawable_objects import EditRectVisual, EditLineVisual, EditEllipseVisual
+from .drawable_objects import EditRectVisual, EditLineVisual, EditEllipseVisual, EditPolygonVisual
+from .drawable_objects import OBJECT_TYPES
 from .data.microscopes import load_microscopes
 from .windows import ImageWindow
+from .image_io import map_file, map_image, is_mapped
+from . import storage, measurements, export, metadata, journal
+from .object_store import ObjectStore
+from .results_table import ResultsTable
 
 
 class DataHandler:
-    img_data = None
+    _img_data = None
+    # the decoded image, it is shown rotated by img_rotation
+    raw_img_data = None
     img_byte_stream = None
+    # the .msry file the image is mapped from
+    storage_file: storage.StorageFile | None = None
     img_rotation = 0
     file_path: Path | None = None
+    # records the changes of the objects for the recovery after a crash
+    object_journal: journal.Journal | None = None
 
     main_window: dict | None = None
-    drawing_data: dict
 
     units: dict
     logger: logging.Logger | None = None
@@ -32,6 +42,8 @@ class DataHandler:
     def __init__(self, logger=None):
 
         self.micros_db = load_microscopes()
+        # grayscale and prefiltered versions of img_data for intensity profiles
+        self._image_cache = measurements.ImageCache()
 
         if logger is not None:
             self.logger = logger
@@ -49,56 +61,129 @@ class DataHandler:
         #   'object 2': [measured_circle, measured_circle, ...],
         #   ...
         # }
-        self.drawing_data = dict()
-        self.units = dict(
-            fm=1e-15,
-            pm=1e-12,
-            Å=1e-10,
-            nm=1e-9,
-            µm=1e-6,
-            mm=1e-3,
-            cm=1e-2,
-            m=1,
-            km=1e3,
-        )
-
-    def save_object(self, structure_name, object):
+        # it is kept by the object store, which indexes the objects
+        self.object_store = ObjectStore()
+        # measurements of all objects, updated with the changed objects
+        self.results_table = ResultsTable()
+        self.object_store.observers.append(self.results_table)
+        self.units = dict(metadata.LENGTH_UNITS)
+        # instrument and pixel size found in the metadata of the image
+        self.img_metadata = metadata.ImageMetadata()
+
+    @property
+    def img_data(self):
+        """The image as it is shown, rotated by img_rotation. The rotated
+        pixels are only created when they are used, e.g. by the flood fill
+        of the scale bar."""
+        if self._img_data is None and self.raw_img_data is not None:
+            self._img_data = measurements.rotate_image_data(self.raw_img_data, self.img_rotation)
+        return self._img_data
+
+    @img_data.setter
+    def img_data(self, img_data):
+        # a new image, it is not rotated
+        self.raw_img_data = img_data
+        self.img_rotation = 0
+        self._img_data = img_data
+
+    def set_raw_img_data(self, raw_img_data):
+        """Replace the pixels of the current image by the same pixels from
+        another buffer, the rotation of the image is kept."""
+        self.raw_img_data = raw_img_data
+        self._img_data = None
+        self._image_cache.set_image(None)
+        self.main_window.vispy_canvas.draw_image()
+
+    @property
+    def img_shape(self) -> tuple[int, int]:
+        """Height and width of the image as it is shown."""
+        height, width = self.raw_img_data.shape[:2]
+        if self.img_rotation % 180:
+            return width, height
+        return height, width
+
+    def set_img_rotation(self, img_rotation):
+        """Rotate the image clockwise, the rotated image is created on the
+        next use of img_data."""
+        if (img_rotation - self.img_rotation) % 360:
+            self._img_data = None
+        self.img_rotation = img_rotation
+
+    @property
+    def image_cache(self) -> measurements.ImageCache:
+        # every new, rotated or imported image invalidates the derived data
+        if self._image_cache.img_data is not self.img_data:
+            self._image_cache.set_image(self.img_data)
+        return self._image_cache
+
+    @property
+    def drawing_data(self) -> dict:
+        return self.object_store.structures
+
+    @drawing_data.setter
+    def drawing_data(self, drawing_data: dict):
+        self.object_store.rebuild(drawing_data)
+
+    def save_object(self, structure_name, object, index=None):
         """save object into storage structure
 
         Args:
-            structure_name (string): _description_
-            object_data (_type_): _description_
+            structure_name (string): name of the structure
+            object (EditVisual): the object
+            index (int, optional): position in the structure, appended if None
         """
-        if structure_name == "" or structure_name.isspace():
-            structure_name = self.generate_output_name()
+        structure_name = self.valid_structure_name(structure_name)
 
-        # if not in output dict then add an empty list
-        if structure_name not in self.drawing_data.keys():
-            self.drawing_data[structure_name] = list()
-        self.drawing_data[structure_name].append(object)
+        self.object_store.add(object, structure_name, index)
         self.logger.info(f"object {object} saved in {structure_name} in drawing_data")
 
         return structure_name
 
+    def save_objects(self, structure_name, objects):
+        """Add several objects to a structure at once.
+
+        Args:
+            structure_name (string): name of the structure
+            objects (list[EditVisual]): the objects
+
+        Returns:
+            str: the name of the structure, see valid_structure_name
+        """
+        structure_name = self.valid_structure_name(structure_name)
+        for object in objects:
+            self.object_store.add(object, structure_name)
+        self.logger.info(f"{len(objects)} objects saved in {structure_name} in drawing_data")
+        return structure_name
+
+    def delete_objects(self, objects):
+        """Remove several objects from the storage dict at once."""
+        structures = set()
+        for object in objects:
+            try:
+                structures.add(self.object_store.remove(object)[0])
+            except LookupError:
+                continue
+        for object_name in structures - self.drawing_data.keys():
+            self.main_window.main_ui.remove_from_structure_dd(object_name)
+            if self.main_window.main_ui.structure_dd.currentText() == object_name:
+                self.main_window.main_ui.structure_dd.setCurrentText("")
+
     def delete_object(self, object):
         """delete object from the storage dict
 
         Args:
-            object_data (class:object): the object that should be deleted
+            object (EditVisual | ControlPoints): the object that should be deleted
         """
-        for object_name, object_list in list(self.drawing_data.items()):
-            if object in object_list:
-                object_list.remove(object)
-            # in case it is the controlpoints
-            if object.parent in object_list:
-                object_list.remove(object.parent)
-                object = object.parent
-            # If the list is empty after removal, delete the key from the dictionary
-            if not object_list:
-                self.main_window.main_ui.remove_from_structure_dd(object_name)
-                del self.drawing_data[object_name]
-                if self.main_window.main_ui.structure_dd.currentText() == object_name:
-                    self.main_window.main_ui.structure_dd.setCurrentText("")
+        try:
+            # this also works for the control points of an object
+            object_name, _ = self.object_store.remove(object)
+        except LookupError:
+            return
+        # If the structure is empty after removal, remove it from the dropdown
+        if object_name not in self.drawing_data:
+            self.main_window.main_ui.remove_from_structure_dd(object_name)
+            if self.main_window.main_ui.structure_dd.currentText() == object_name:
+                self.main_window.main_ui.structure_dd.setCurrentText("")
 
     def delete_all_objects(self):
         self.main_window.vispy_canvas.unselect()
@@ -116,18 +201,27 @@ class DataHandler:
 
     def find_object(self, object):
         if self.drawing_data:
-            for k, val in self.drawing_data.items():
-                if object in val:
-                    return k, val.index(object)
-            raise LookupError("Object could not be found in drawing_data")
+            return self.object_store.locate(object)
 
-    def generate_output_name(self):
+    def generate_output_name(self, taken=()):
         # return string that is not in the drawing_data keys and increases each time
         i = 1
-        while f"structure_{i:03d}" in self.drawing_data.keys():
+        while f"structure_{i:03d}" in self.drawing_data.keys() or f"structure_{i:03d}" in taken:
             i += 1
         return f"structure_{i:03d}"
 
+    def valid_structure_name(self, structure_name, taken=()):
+        """The name of a structure, empty names are replaced by a generated one.
+
+        Args:
+            structure_name (str): the name
+            taken (Iterable[str], optional): names of structures that are not
+                in drawing_data yet. Defaults to ().
+        """
+        if structure_name == "" or structure_name.isspace():
+            structure_name = self.generate_output_name(taken)
+        return structure_name
+
     def open_file_location(self, path: Path):
         try:
             if path is not None:
@@ -156,44 +250,78 @@ class DataHandler:
         if filename:
             return filename
 
-    def save_storage_file(self, save_image=True, **kwargs):
-        
+    def save_storage_file(self, save_image=True):
 
         filename = self.save_file_dialog(
             file_name=str(self.file_path.with_suffix(".msry"))
         )
         if filename is None:
             return
-        
-        self.file_path = Path(filename)
-        
-        self.logger.info(f"saving storage file: {filename}")
+
+        self.write_storage_file(filename, save_image=save_image)
+
+        self.main_window.main_ui.save_window.close()
+        self.main_window.vispy_canvas.update_file_path()
+
+    def write_storage_file(self, file_path, save_image=True):
+        """write the measurements and optionally the image into a .msry file
+
+        Args:
+            file_path (str | Path): path of the .msry file
+            save_image (bool, optional): store the image and its scaling. Defaults to True.
+        """
+        self.file_path = Path(file_path)
+        self.logger.info(f"saving storage file: {file_path}")
+
+        # the image is mapped from the file that is overwritten
+        source = None
+        in_place = False
+        if (
+            self.storage_file is not None
+            and self.storage_file.file_path.resolve() == self.file_path.resolve()
+        ):
+            # the map can only be closed once no pixels point into it anymore
+            in_place = is_mapped(self.raw_img_data)
+            if save_image:
+                source = self.storage_file
+                if in_place:
+                    self.set_raw_img_data(np.array(self.raw_img_data))
+            else:
+                # the new file does not contain the image anymore
+                self.img_byte_stream = bytes(self.img_byte_stream)
+                if in_place:
+                    self.set_raw_img_data(map_image(self.img_byte_stream))
+                self.storage_file.close()
+                self.storage_file = None
 
         structure_data = dict()
         for key, val in self.drawing_data.items():
-            structure_data[key] = [[obj.__class__, deepcopy(obj.save())] for obj in val]
+            structure_data[key] = [(type(obj).__name__, obj.save()) for obj in val]
 
         if save_image:
-            scaling = (
-                self.main_window.main_ui.pixel_edit.text(),
-                self.main_window.main_ui.length_edit.text(),
-                self.main_window.main_ui.units_dd.currentText(),
-                self.main_window.vispy_canvas.scale_bar_params,
+            storage.write_storage_file(
+                file_path,
+                structure_data,
+                img_byte_stream=self.img_byte_stream,
+                scaling=(
+                    self.main_window.main_ui.pixel_edit.text(),
+                    self.main_window.main_ui.length_edit.text(),
+                    self.main_window.main_ui.units_dd.currentText(),
+                    self.main_window.vispy_canvas.scale_bar_params,
+                ),
+                origin=self.main_window.vispy_canvas.origin,
+                img_rotation=self.img_rotation % 360,
+                source=source,
             )
-            output = (self.img_byte_stream, structure_data, scaling, 
-                      self.main_window.vispy_canvas.origin, 
-                      self.main_window.data_handler.img_rotation % 360)
+            if source is not None:
+                self.storage_file = storage.StorageFile(file_path)
+                self.img_byte_stream = self.storage_file.read_image()
+                if in_place:
+                    # map the pixels from the new file instead of the copy
+                    self.set_raw_img_data(map_image(self.img_byte_stream))
         else:
-            output = (None, structure_data, None)
-
-        # save to file
-        with open(filename, "wb") as save_file:
-            pickle.dump(output, save_file, pickle.HIGHEST_PROTOCOL, **kwargs)
+            storage.write_storage_file(file_path, structure_data)
 
-        self.main_window.main_ui.save_window.close()
-        self.main_window.vispy_canvas.update_file_path()
-
-        
     def load_into_view(self, drawing_data, vispy_instance):
         """
         Loads the drawing data into the view and the drawing_data dictionary.
@@ -220,14 +348,37 @@ class DataHandler:
             obj = unpickler.load()
         return obj
 
-    def load_storage_file(self, file_path:Path):
-        """load .msry data from a file and update the view"""
+    def read_storage_file(self, file_path: Path):
+        """read a .msry file of the current container format or an old pickled one
 
-        loaded_data = self.load_from_pickle(file_path)
-        # only 3 elements are default, as it becomes 4 when loaded from file 
+        Returns:
+            tuple: image byte stream, structure data, scaling, origin, rotation and
+                the StorageFile the image is mapped from (None for old files)
+                where structure data is {structure_name: [(object class, state), ...]}
+        """
+        # only 3 elements are default, as it becomes 4 when loaded from file
         scaling = (None, None, None) # pixel, length, unit
         origin = np.zeros(2)
         img_rotation = 0
+
+        if storage.is_storage_container(file_path):
+            self.logger.info(f"opened storage file: {file_path}")
+            storage_file = storage.StorageFile(file_path)
+            img_byte_stream = storage_file.read_image()
+            if storage_file.scaling is not None:
+                scaling = storage_file.scaling
+            origin = storage_file.origin
+            img_rotation = storage_file.img_rotation
+            structure_data = dict()
+            for key, val in storage_file.structures.items():
+                structure_data[key] = list()
+                for obj_type, obj_data in val:
+                    if obj_type not in OBJECT_TYPES:
+                        raise ValueError(f"unknown object type: {obj_type}")
+                    structure_data[key].append((OBJECT_TYPES[obj_type], obj_data))
+            return img_byte_stream, structure_data, scaling, origin, img_rotation, storage_file
+
+        loaded_data = self.load_from_pickle(file_path)
         if len(loaded_data) == 2:
             img_byte_stream, structure_data = loaded_data
         elif len(loaded_data) == 3:
@@ -236,18 +387,31 @@ class DataHandler:
             img_byte_stream, structure_data, scaling, origin = loaded_data
         elif len(loaded_data) == 5:
             img_byte_stream, structure_data, scaling, origin, img_rotation = loaded_data
+        return img_byte_stream, structure_data, scaling, origin, img_rotation, None
+
+    def load_storage_file(self, file_path:Path, restore_journal=False):
+        """load .msry data from a file and update the view
+
+        Args:
+            file_path (Path): the .msry file
+            restore_journal (bool, optional): restore the measurements of a
+                crashed session of the file without asking. Defaults to False.
+        """
+
+        img_byte_stream, structure_data, scaling, origin, img_rotation, storage_file = (
+            self.read_storage_file(file_path)
+        )
 
-        
         question = None
 
-        if self.img_data is None and img_byte_stream is None:
+        if self.raw_img_data is None and img_byte_stream is None:
             self.main_window.raise_error(
                 "You can't load measurements without loading an image first."
             )
             return
 
         # there is an image with measurements
-        if self.drawing_data and self.img_data is not None:
+        if self.drawing_data and self.raw_img_data is not None:
             if img_byte_stream is None:
                 if structure_data:
                     # only measurments / no image
@@ -277,7 +441,8 @@ class DataHandler:
             self.delete_all_objects()
             self.file_path = file_path
             if img_byte_stream is not None:
-                if isinstance(img_byte_stream, bytes):
+                self.use_storage_file(storage_file)
+                if not isinstance(img_byte_stream, np.ndarray):
                     self.img_byte_stream = img_byte_stream
                 else:  # for old file format where just the pixel matrix is stored
                     # Step 1: Encode the image data to a specific format
@@ -293,16 +458,11 @@ class DataHandler:
                 self.logger.debug(
                     "set data_handler.img_byte_stream to loaded file data"
                 )
+                # a scaling stored in the file replaces the one of the metadata
+                self.read_metadata()
 
             if structure_data:
-                for key, val in structure_data.items():
-                    for obj_type, obj_data in val:
-                        new_object = obj_type(
-                            settings=self.main_window.settings,
-                            **obj_data,
-                            parent=self.main_window.vispy_canvas.view.scene,
-                        )
-                        self.main_window.vispy_canvas.create_new_object(new_object, structure_name=key)
+                self.load_objects(structure_data)
 
             if scaling is not None and scaling[0] is not None:
                 self.main_window.main_ui.pixel_edit.setText(str(scaling[0]))
@@ -316,26 +476,167 @@ class DataHandler:
                     )
                 else:
                     self.main_window.main_ui.units_dd.setCurrentIndex(index)
-                if len(scaling) > 3:
-                    self.main_window.vispy_canvas.find_scale_bar_width(*scaling[3])
                 
                 self.main_window.main_ui.units_changed()
             
 
             self.main_window.main_ui.update_structure_dd()
+
+            def image_loaded():
+                # rotate image if necessary
+                self.logger.debug("image rotation {}".format(img_rotation))
+                self.main_window.vispy_canvas.set_image_rotation(img_rotation)
+                self.main_window.vispy_canvas.set_origin(origin, move_objects=False)
+
+                # the scale bar can only be found once the image is decoded
+                if scaling is not None and len(scaling) > 3:
+                    self.main_window.vispy_canvas.find_scale_bar_width(*scaling[3])
             
             # this reads the image from the byte stream
-            self.main_window.vispy_canvas.update_image()
-                
-            # rotate image if necessary
-            for i in range(round(img_rotation % 360 / 90)):
-                self.logger.debug("image rotation {}".format(img_rotation))
-                self.main_window.vispy_canvas.rotate_image(rotate_objects=False)
-                
-            self.main_window.vispy_canvas.set_origin(origin, move_objects=False)
+            self.main_window.vispy_canvas.update_image(on_loaded=image_loaded)
+            self.start_journal(restore_journal)
+
+        elif storage_file is not None:
+            storage_file.close()
+
+    def use_storage_file(self, storage_file: storage.StorageFile | None):
+        """Keep the storage file the image is mapped from, the one of the
+        previous image is closed. Pixels that are mapped from it are dropped
+        before, they are replaced by the new image anyway."""
+        if self.storage_file is not None and self.storage_file is not storage_file:
+            if is_mapped(self.raw_img_data):
+                self.set_raw_img_data(None)
+            self.storage_file.close()
+        self.storage_file = storage_file
+
+    def load_objects(self, structure_data):
+        """Create the objects of a storage file and add them to drawing_data
+        in one step. The objects are built before they are put into the
+        scene and the ui is not updated while they are loaded.
+
+        Args:
+            structure_data (dict): structure -> list of (object type, state)
+        """
+        start = time.perf_counter()
+        canvas = self.main_window.vispy_canvas
+        main_ui = self.main_window.main_ui
+        main_ui.setUpdatesEnabled(False)
+        try:
+            structures = dict()
+            for key, val in structure_data.items():
+                objects = [
+                    obj_type(settings=self.main_window.settings, **obj_data)
+                    for obj_type, obj_data in val
+                ]
+                canvas.add_to_scene(objects)
+                key = self.valid_structure_name(key, structures)
+                structures.setdefault(key, list()).extend(objects)
+            # all structures are registered at once
+            self.drawing_data = {**self.drawing_data, **structures}
+        finally:
+            main_ui.setUpdatesEnabled(True)
+
+        seconds = time.perf_counter() - start
+        n_objects = sum(len(objects) for objects in structures.values())
+        self.logger.info(
+            f"loaded {n_objects} objects in {seconds:.2f} s "
+            f"({n_objects / max(seconds, 1e-9):.0f} objects/s)"
+        )
+
+    def view_state(self) -> dict:
+        """Origin and rotation of the image, as they are journaled."""
+        return dict(
+            origin=np.asarray(self.main_window.vispy_canvas.origin, dtype=np.float64).tolist(),
+            rotation=int(self.img_rotation),
+        )
+
+    def start_journal(self, restore=False):
+        """Journal the measurements of the open file. The measurements of a
+        crashed session of the file are offered to be restored, its journal
+        is only replaced once the user decided.
+
+        Args:
+            restore (bool, optional): restore them without asking. Defaults to False.
+        """
+        self.close_journal()
+        path = journal.journal_path(self.file_path)
+        recovered = journal.read_journal(path) if journal.is_crashed(path) else None
+        if recovered is None or not recovered.structures:
+            self.open_journal()
+        elif restore:
+            self.restore_journal(recovered)
+        else:
+            self.main_window.offer_recovery(recovered)
+
+    def open_journal(self):
+        """Start a new journal of the open file, it replaces an old one."""
+        try:
+            self.object_journal = journal.Journal(self.object_store, self.file_path, self.view_state())
+        except OSError as error:
+            self.logger.warning(f"The measurements cannot be journaled: {error}")
+
+    def flush_journal(self):
+        """Write the changes of the last command to the journal."""
+        if self.object_journal is not None:
+            self.object_journal.flush(self.view_state())
+
+    def close_journal(self):
+        """Remove the journal, the session of the file ended normally."""
+        if self.object_journal is not None:
+            self.object_journal.close()
+            self.object_journal = None
+
+    def restore_journal(self, state: journal.JournalState):
+        """Replace the measurements with the ones of a journal. The journal
+        is kept if they can not be restored.
+
+        Args:
+            state (JournalState): the measurements read from the journal
+        """
+        try:
+            structure_data = dict()
+            for structure, objects in state.structures.items():
+                structure_data[structure] = list()
+                for type_name, obj_data in objects:
+                    if type_name not in OBJECT_TYPES:
+                        raise ValueError(f"unknown object type: {type_name}")
+                    structure_data[structure].append((OBJECT_TYPES[type_name], obj_data))
+
+            canvas = self.main_window.vispy_canvas
+            # the stored origin and rotation are set once the image is decoded
+            canvas.wait_for_image()
+            self.delete_all_objects()
+            self.load_objects(structure_data)
+            if self.raw_img_data is not None:
+                canvas.set_image_rotation(state.rotation)
+            if state.origin is not None:
+                canvas.set_origin(state.origin, move_objects=False)
+            self.main_window.main_ui.update_structure_dd()
+            self.main_window.reset_undo_stack()
+        except Exception as error:
+            self.main_window.raise_error(
+                f"Could not restore the measurements of {state.path}: {error}"
+            )
+            return
+        self.logger.info(f"restored the measurements of {state.file}")
+        # the restored measurements are the snapshot of the new journal
+        self.open_journal()
+
+    def discard_journal(self, state: journal.JournalState):
+        """Remove the journal of a crashed session and start a new one."""
+        self.logger.info(f"discarded the measurements of {state.path}")
+        if state.path is not None:
+            state.path.unlink(missing_ok=True)
+        self.open_journal()
 
-    def open_file(self, file_path: str | Path | None):
+    def open_file(self, file_path: str | Path | None, restore_journal=False):
+        """Open an image or a storage file.
 
+        Args:
+            file_path (str | Path | None): the file
+            restore_journal (bool, optional): restore the measurements of a
+                crashed session of the file without asking. Defaults to False.
+        """
         try:
             if file_path:
                 file_path = Path(file_path)
@@ -344,12 +645,12 @@ class DataHandler:
                 if file_path.suffix in self.main_window.settings.value(
                     "misc/file_extensions"
                 ):
-                    self.load_storage_file(file_path)
+                    self.load_storage_file(file_path, restore_journal)
 
                 # just assume it is an image file
                 else:
                     reply = QMessageBox.StandardButton.Yes
-                    if self.img_data is not None:
+                    if self.raw_img_data is not None:
                         reply = QMessageBox.warning(
                             self.main_window.main_ui,
                             "Warning",
@@ -361,14 +662,39 @@ class DataHandler:
 
                     if reply == QMessageBox.StandardButton.Yes:
                         self.file_path = file_path
-                        self.img_byte_stream = file_path.read_bytes()
+                        # the file is mapped instead of read so that
+                        # uncompressed images are only paged in when used
+                        self.use_storage_file(None)
+                        self.img_byte_stream = map_file(file_path)
                         self.delete_all_objects()
                         self.main_window.main_ui.reset_scaling()
+                        self.read_metadata()
                         self.main_window.vispy_canvas.update_image()
+                        self.start_journal(restore_journal)
 
         except Exception as error:
             self.main_window.raise_error(f"Could not open file: {file_path}: {error}")
 
+    def read_metadata(self, set_scaling=True):
+        """Find the microscope and the pixel size in the metadata of the
+        image, they are applied to the ui right away.
+
+        Args:
+            set_scaling (bool, optional): set the scaling to the pixel size.
+                Defaults to True.
+        """
+        try:
+            self.img_metadata = metadata.read_metadata(self.img_byte_stream)
+        except Exception as error:
+            self.logger.warning(f"Could not read the metadata of the image: {error}")
+            self.img_metadata = metadata.ImageMetadata()
+            return
+        self.logger.info(
+            f"metadata: instrument {self.img_metadata.instrument}, "
+            f"pixel size {self.img_metadata.pixel_size} m ({self.img_metadata.source})"
+        )
+        self.main_window.main_ui.apply_metadata(self.img_metadata, set_scaling=set_scaling)
+
     def open_image_editor(self, image:QImage):
         image_editor = ImageWindow(image, parent=self.main_window)
         # image_editor.show()
@@ -390,7 +716,7 @@ class DataHandler:
         # otherwise open the image as an image
         reply = QMessageBox.StandardButton.Yes
         try:
-            if self.img_data is not None:
+            if self.raw_img_data is not None:
                 reply = QMessageBox.warning(
                     self.main_window.main_ui,
                     "Warning",
@@ -402,8 +728,11 @@ class DataHandler:
             if reply == QMessageBox.StandardButton.Yes:
 
                 self.file_path = Path("clipboard")
+                # there is no file to restore the measurements with
+                self.close_journal()
                 self.delete_all_objects()
                 self.main_window.main_ui.reset_scaling()
+                self.img_metadata = metadata.ImageMetadata()
 
                 clipboard_data = clipboard.image()
                 width = clipboard_data.width()
@@ -430,6 +759,7 @@ class DataHandler:
 
                 if success:
                     # Step 2: Convert the encoded image to a byte stream
+                    self.use_storage_file(None)
                     self.img_byte_stream = encoded_image.tobytes()
 
                     self.main_window.vispy_canvas.update_image()
@@ -444,62 +774,10 @@ class DataHandler:
         """calculate the average and standard deviation of
         the measurements for each structure in drawing_data
         """
-
-        results = dict()
-        for structure_name, object_list in self.drawing_data.items():
-            results[structure_name] = dict()
-            
-            # test if it is a multiline
-            if isinstance(object_list[0], EditLineVisual):
-                num_points = [len(obj.coords) for obj in object_list]
-                # check if all are the same
-                if not all(n == num_points[0] for n in num_points):
-                    results[structure_name]["lines have different number of points: "] = (np.mean(num_points), np.std(num_points), "")
-                    continue
-                # elif num_points[0] == 0 or num_points[0] > 3:
-                #     results[structure_name][""] = (num_points[0], None, "")
-                #     continue
-                
-            props = object_list[0].output_properties()
-            for prop, value in props.items():
-                data = [obj.output_properties()[prop][0] for obj in object_list]
-                unit = value[1]
-                
-                if self.main_window.main_ui.scaling_factor is not None:
-                    if prop in [
-                        "length",
-                        "area",
-                        "radius",
-                        "width",
-                        "height",
-                        "center",
-                    ]:
-                        exponent_string = ""
-                        exponent = 1
-                        if unit[-1] == "²":
-                            exponent = 2
-                            exponent_string = unit[-1]
-                        if unit[-1] == "³":
-                            exponent = 3
-                            exponent_string = unit[-1]
-                            
-                        data = [
-                            d * self.main_window.main_ui.scaling_factor**exponent for d in data
-                        ]
-                        
-                        unit = (
-                            self.main_window.main_ui.units_dd.currentText() + exponent_string
-                        )
-
-                if len(data) == 1:
-                    results[structure_name][prop] = (np.mean(data, axis=0), None, unit)
-                else:
-                    results[structure_name][prop] = (
-                        np.mean(data, axis=0),
-                        np.std(data, axis=0) / np.sqrt(len(object_list)),
-                        unit,
-                    )
-        return results
+        return self.results_table.results(
+            scaling_factor=self.main_window.main_ui.scaling_factor,
+            length_unit=self.main_window.main_ui.units_dd.currentText(),
+        )
 
     def calculate_results_string(self):
         results = self.calculate_results()
@@ -539,34 +817,66 @@ class DataHandler:
             # write to text file
             save_file.write(self.calculate_results_string().encode("utf-8"))
 
+    def export_measurements_table(self):
+        """Export the properties of all objects with one row per object."""
+        if self.file_path is None:
+            self.main_window.raise_error("No image loaded")
+            return
+
+        file_path = self.save_file_dialog(
+            file_name=str(self.file_path.with_suffix(".csv")),
+            extensions="CSV (*.csv);;Parquet (*.parquet);;HDF5 (*.h5 *.hdf5)",
+        )
+        if file_path is None:
+            return
+
+        try:
+            blocks = export.measurement_blocks(
+                self.results_table,
+                self.object_store.locations,
+                scaling_factor=self.main_window.main_ui.scaling_factor,
+                length_unit=self.main_window.main_ui.units_dd.currentText(),
+            )
+            self.logger.info(f"Exporting measurements to {file_path}")
+            export.export_measurements(file_path, blocks, image=self.file_path.name)
+        except (ImportError, ValueError, OSError) as error:
+            self.logger.error(f"Could not export measurements:\n{error}")
+            self.main_window.raise_error(f"Could not export measurements: {error}")
+
     def rename_structure(self, structure, new_structure):
         if new_structure in self.drawing_data:
             self.main_window.raise_error("This structure already exists!")
         elif new_structure == "" or new_structure.isspace():
             self.main_window.raise_error("This name is not valid")
         else:
-            self.drawing_data[new_structure] = self.drawing_data[structure]
-            del self.drawing_data[structure]
+            self.object_store.rename(structure, new_structure)
             return True
 
         return False
 
 
 class DeleteAllObjectsCommand(QUndoCommand):
+    """Deletes all objects. The objects are kept as their saved states
+    instead of the visuals and are created again on undo, with the uids
+    of the deleted objects (see VispyCanvas.restore_objects)."""
+
     def __init__(self, data_handler: DataHandler):
         super().__init__()
         self.data_handler = data_handler
         self.main_window = self.data_handler.main_window
-        self.old_drawing_data = dict(data_handler.drawing_data)  # Save the old state
+        # Save the old state
+        self.old_states = {
+            structure_name: self.main_window.vispy_canvas.saved_states(objects)
+            for structure_name, objects in data_handler.drawing_data.items()
+        }
 
     def undo(self):
         # Restore the old state
         self.data_handler.logger.info("Undoing delete all objects")
-        self.data_handler.drawing_data = self.old_drawing_data
+        vispy_canvas = self.main_window.vispy_canvas
+        for structure_name, states in self.old_states.items():
+            vispy_canvas.create_objects(vispy_canvas.restore_objects(states), structure_name)
         self.main_window.main_ui.update_structure_dd()
-        self.data_handler.load_into_view(
-            self.data_handler.drawing_data, self.main_window.vispy_canvas
-        )
         self.data_handler.logger.info("Restored all measurements")
 
     def redo(self):
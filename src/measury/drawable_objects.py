@@ -1,9 +1,81 @@
+from typing import NamedTuple
+import weakref
 import numpy as np
-from scipy.ndimage import map_coordinates
+import cv2
 
 from vispy.scene.visuals import Compound, Markers, Rectangle, Ellipse, Line, Arrow, Polygon
 from vispy.visuals.transforms import MatrixTransform, linear
 
+from . import measurements
+
+
+class ControlPoint(NamedTuple):
+    """A control point, given by the control points it belongs to and
+    its index in their coordinates."""
+
+    parent: "ControlPoints | LineControlPoints"
+    index: int
+
+
+def control_point_at(coords, pos, tolerance):
+    """Return the index of the point closest to pos within the tolerance."""
+    if len(coords) == 0:
+        return None
+    distances = np.linalg.norm(np.asarray(coords)[:, :2] - pos[:2], axis=1)
+    index = int(np.argmin(distances))
+    if distances[index] > tolerance:
+        return None
+    return index
+
+
+def set_marker_positions(markers, pos, **kwargs):
+    """Move all control points of a Markers visual at once.
+
+    Markers.set_data resets the style that is not passed, so the style of
+    the control points is passed along with the positions.
+    """
+    markers.set_data(pos=np.asarray(pos, dtype=np.float32), **kwargs)
+
+
+def box_corners(center, width, height, angle) -> np.ndarray:
+    """Corners of rotated boxes in the order of ControlPoints.coords,
+    all arguments may be arrays of many boxes.
+
+    Returns:
+        np.ndarray: corners of shape (..., 4, 2)
+    """
+    # corners relative to the center before the rotation
+    local = np.array([[-0.5, 0.5], [0.5, 0.5], [0.5, -0.5], [-0.5, -0.5]])
+    local = local * np.stack((width, height), axis=-1)[..., np.newaxis, :]
+    cos = np.cos(angle)[..., np.newaxis]
+    sin = np.sin(angle)[..., np.newaxis]
+    center = np.asarray(center)[..., np.newaxis, :]
+    return np.stack(
+        (
+            center[..., 0] + cos * local[..., 0] + sin * local[..., 1],
+            center[..., 1] - sin * local[..., 0] + cos * local[..., 1],
+        ),
+        axis=-1,
+    )
+
+
+def polygon_distance(polygon, pos) -> float:
+    """Signed distance of pos to a closed polygon, positive inside."""
+    contour = np.asarray(polygon, dtype=np.float32).reshape(-1, 1, 2)
+    return cv2.pointPolygonTest(contour, (float(pos[0]), float(pos[1])), True)
+
+
+def polyline_distance(coords, pos) -> float:
+    """Distance of pos to an open polyline."""
+    coords = np.asarray(coords, dtype=np.float64)[:, :2]
+    if len(coords) == 1:
+        return float(np.linalg.norm(coords[0] - pos[:2]))
+    starts, segments = coords[:-1], np.diff(coords, axis=0)
+    lengths = np.einsum("ij,ij->i", segments, segments)
+    t = np.einsum("ij,ij->i", pos[:2] - starts, segments) / np.where(lengths > 0, lengths, 1)
+    closest = starts + np.clip(t, 0, 1)[:, np.newaxis] * segments
+    return float(np.min(np.linalg.norm(closest - pos[:2], axis=1)))
+
 
 # Compound from vispy.scene.visuals
 class ControlPoints(Compound):
@@ -22,109 +94,63 @@ class ControlPoints(Compound):
         self.face_color = (1, 1, 1, 0.2)
         self.marker_size = 8
 
-        # Markers from vispy.scene.visuals
-        self.control_points = [Markers(parent=self) for i in range(0, 4)]
-        self.coords = np.zeros((len(self.control_points), 1, 2),
-                               dtype=np.float32)
-
-        for i, c in enumerate(self.control_points):
-            c.set_data(
-                pos=self.coords[i],
-                edge_color=self.edge_color,
-                face_color=self.face_color,
-                size=self.marker_size,
-            )
-            c.interactive = True
+        self.coords = np.zeros((4, 1, 2), dtype=np.float32)
+        # one Markers visual from vispy.scene.visuals for all control points
+        self.markers = Markers(parent=self)
+        self.markers.set_data(
+            pos=self.coords[:, 0, :],
+            edge_color=self.edge_color,
+            face_color=self.face_color,
+            size=self.marker_size,
+        )
 
         self.transform = linear.STTransform(translate=(0, 0, -2))
 
         self.freeze()
 
-    def update_bounds(self):
-        self._center = np.array(
-            [
-                0.5 * (self.parent.bounds(0)[1] + self.parent.bounds(0)[0]),
-                0.5 * (self.parent.bounds(1)[1] + self.parent.bounds(1)[0]),
-            ],
-            dtype=np.float64,
-        )
-        self._width = abs(self.parent.bounds(0)[1] - self.parent.bounds(0)[0])
-        self._height = abs(self.parent.bounds(1)[1] - self.parent.bounds(1)[0])
+    def set_box(self, center, width, height):
+        """Set the box of the shape, it is taken as given and not
+        from the bounds of the visual, which are only single precision."""
+        self._center = np.array(center[:2], dtype=np.float64)
+        self._width = abs(float(width))
+        self._height = abs(float(height))
         self.update_points()
 
+    def update_corners(self):
+        # center-+, center++, center+-, center--
+        self.coords[:, 0, :] = box_corners(self._center, self._width, self._height, self._angle)
+
     def update_points(self):
-        # center-+
-        self.coords[0] = np.array(
-            [
-                [
-                    self._center[0]
-                    - 0.5 * np.cos(self._angle) * self._width
-                    + 0.5 * np.sin(self._angle) * self._height,
-                    self._center[1]
-                    + 0.5 * np.sin(self._angle) * self._width
-                    + 0.5 * np.cos(self._angle) * self._height,
-                ]
-            ]
-        )
-        # center++
-        self.coords[1] = np.array(
-            [
-                [
-                    self._center[0]
-                    + 0.5 * np.cos(self._angle) * self._width
-                    + 0.5 * np.sin(self._angle) * self._height,
-                    self._center[1]
-                    - 0.5 * np.sin(self._angle) * self._width
-                    + 0.5 * np.cos(self._angle) * self._height,
-                ]
-            ]
-        )
-        # center+-
-        self.coords[2] = np.array(
-            [
-                [
-                    self._center[0]
-                    + 0.5 * np.cos(self._angle) * self._width
-                    - 0.5 * np.sin(self._angle) * self._height,
-                    self._center[1]
-                    - 0.5 * np.sin(self._angle) * self._width
-                    - 0.5 * np.cos(self._angle) * self._height,
-                ]
-            ]
+        self.update_corners()
+        set_marker_positions(
+            self.markers,
+            self.coords[:, 0, :],
+            edge_color=self.edge_color,
+            face_color=self.face_color,
+            size=self.marker_size,
         )
-        # center--
-        self.coords[3] = np.array(
-            [
-                [
-                    self._center[0]
-                    - 0.5 * np.cos(self._angle) * self._width
-                    - 0.5 * np.sin(self._angle) * self._height,
-                    self._center[1]
-                    + 0.5 * np.sin(self._angle) * self._width
-                    - 0.5 * np.cos(self._angle) * self._height,
-                ]
-            ]
-        )
-        for i, c in enumerate(self.control_points):
-            c.set_data(
-                pos=self.coords[i],
-                edge_color=self.edge_color,
-                face_color=self.face_color,
-                size=self.marker_size,
-            )
+        self.parent.geometry_changed()
+
+    def control_point(self, index):
+        return ControlPoint(self, index % len(self.coords))
+
+    def control_point_at(self, pos, tolerance):
+        """Return the control point closest to pos within the tolerance,
+        if the control points are shown."""
+        if not self.markers.visible:
+            return None
+        index = control_point_at(self.coords[:, 0, :], pos, tolerance)
+        return None if index is None else ControlPoint(self, index)
 
     def select(self, val, obj=None):
         self.visible(val)
         self.selected_cp = None
         self.opposed_cp = None
 
-        if obj is not None:
-            n_cp = len(self.control_points)
-            for i in range(0, n_cp):
-                c = self.control_points[i]
-                if c == obj:
-                    self.selected_cp = c
-                    self.opposed_cp = self.control_points[int((i + n_cp / 2)) % n_cp]
+        if isinstance(obj, ControlPoint) and obj.parent is self:
+            n_cp = len(self.coords)
+            self.selected_cp = obj.index
+            self.opposed_cp = (obj.index + n_cp // 2) % n_cp
 
     def start_move(self, start):
         self.parent.start_move(start)
@@ -154,7 +180,7 @@ class ControlPoints(Compound):
 
             # normal scaling mode where one corner is fixed
             else:
-                opp_index = self.control_points.index(self.opposed_cp)
+                opp_index = self.opposed_cp
 
                 opp = self.coords[opp_index, 0, :]
                 diag = end - opp
@@ -239,14 +265,14 @@ class ControlPoints(Compound):
 
     def rotate(self, angle):
         if self.parent.editable:
-            # if self.control_points.index(self.selected_cp)%2 == 0:
+            # if self.selected_cp % 2 == 0:
             self._angle = angle - self.parent.drag_reference_angle
             self.update_points()
             self.parent.update_transform()
 
     def visible(self, v):
-        for c in self.control_points:
-            c.visible = v
+        self.markers.visible = v
+        self.parent.collection_changed()
 
     def get_center(self):
         return self._center
@@ -278,6 +304,16 @@ class ControlPoints(Compound):
 
 # from vispy.scene.visuals
 class EditVisual(Compound):
+    # unique id given by the ObjectStore
+    uid = None
+    # called with the object when its control points change, see ObjectStore
+    on_geometry_change = None
+    # ShapeCollection that draws the object while it is not selected
+    collection = None
+    # the outline is closed
+    closed = True
+    # the geometry was changed without the visuals, see ObjectStore.transform_all
+    visuals_outdated = False
 
     def __init__(
         self,
@@ -301,6 +337,8 @@ class EditVisual(Compound):
         self._on_select_callback = on_select_callback
         self._callback_argument = callback_argument
         self.settings = settings
+        # hidden by the user, visible is also False while in a collection
+        self.shown = True
 
         match control_points:
             case ("LineControlPoints", int(), _):
@@ -330,7 +368,7 @@ class EditVisual(Compound):
 
     @property
     def selected(self):
-        return self.control_points.control_points[0].visible
+        return self.control_points.markers.visible
 
     def start_move(self, start):
         self.drag_reference = start[0:2] - self.control_points.get_center()
@@ -380,11 +418,13 @@ class EditVisual(Compound):
         self._selectable = val
 
     def set_visibility(self, v):
+        self.shown = v
         self.visible = v
         # only make controlpoint not visible but never visible
         # that part is already done by the clicking architecture
         if not v:
             self.control_points.visible(v)
+        self.collection_changed()
 
     @property
     def angle(self):
@@ -432,11 +472,64 @@ class EditVisual(Compound):
         self.control_points.set_center(val[0:2])
 
     def select_creation_controlpoint(self):
-        self.control_points.select(True, self.control_points.control_points[1])
+        self.control_points.select(True, self.control_points.control_point(1))
 
     def output_properties(self):
         None
 
+    def geometry_changed(self):
+        if self.on_geometry_change is not None:
+            self.on_geometry_change(self)
+        self.collection_changed()
+
+    def collection_changed(self):
+        """Draw the object by itself only while it is selected,
+        otherwise its collection draws it."""
+        if self.collection is not None:
+            self.visible = self.shown and self.selected
+            if self.visible:
+                self.update_visuals()
+            self.collection.mark_dirty(self)
+
+    def anchor_points(self) -> np.ndarray:
+        """Points that are moved by ObjectStore.transform_all."""
+        return self.control_points.center[np.newaxis, :]
+
+    def set_anchor_points(self, points, angle):
+        """Take the transformed anchor points without updating the visuals.
+
+        Args:
+            points (np.ndarray): the transformed anchor points
+            angle (float): rotation of the transform in radians
+        """
+        control_points = self.control_points
+        control_points._center = np.array(points[0], dtype=np.float64)
+        control_points._angle += angle
+        control_points.update_corners()
+        self.visuals_outdated = True
+
+    def update_visuals(self):
+        """Bring the visuals up to date after set_anchor_points."""
+        if self.visuals_outdated:
+            self.visuals_outdated = False
+            self.control_points.update_points()
+            self.update_from_controlpoints()
+
+    def outline(self):
+        """Points of the outline of the object."""
+        return self.control_points.coords[:, 0, :]
+
+    def extent(self):
+        """Bounding box (min, max) of the object or None if it has no points."""
+        coords = np.reshape(self.control_points.coords, (-1, 2))
+        if len(coords) == 0:
+            return None
+        return coords.min(axis=0), coords.max(axis=0)
+
+    def contains(self, pos, tolerance=0.0) -> bool:
+        """Check if pos is on the shape, up to the tolerance."""
+        return polygon_distance(self.outline(), pos) >= -tolerance
+
     def delete(self):
         self.parent = None
 
@@ -450,6 +543,10 @@ class EditVisual(Compound):
         return None
 
 class EditRectVisual(EditVisual):
+    # rectangles that show their arrow, so that hiding all arrows
+    # does not have to look at every rectangle
+    shown_arrows = weakref.WeakSet()
+
     def __init__(
         self,
         center=np.array([0, 0], dtype=np.float64),
@@ -463,9 +560,7 @@ class EditRectVisual(EditVisual):
         EditVisual.__init__(self, *args, **kwargs)
         self.unfreeze()
 
-        
-        arrow_color = self.settings.value("graphics/object_border_color").getRgb()
-        border_color = tuple([value / 255 for value in arrow_color]),
+        border_color = self.settings.snapshot.object_border_color
         self.arrow = Arrow(
             pos=np.array([center - np.array([width / 3, 0]), center + np.array([width / 3, 0])]),
             color=border_color,
@@ -491,14 +586,13 @@ class EditRectVisual(EditVisual):
         
         self.arrow.visible = False
 
-        color = self.settings.value("graphics/object_color").getRgb()
-        self.form.color = tuple([value / 255 for value in color])
+        self.form.color = self.settings.snapshot.object_color
         self.form.border_color = border_color
 
         self.freeze()
         self.add_subvisual(self.form)
         self.add_subvisual(self.arrow)
-        self.control_points.update_bounds()
+        self.control_points.set_box(center, width, height)
         self.rotate(self.angle)
         
     def move(self, end, *args, **kwargs):
@@ -508,9 +602,11 @@ class EditRectVisual(EditVisual):
         
     def hide_arrow(self):
         self.arrow.visible = False
+        EditRectVisual.shown_arrows.discard(self)
         
     def show_arrow(self):
         self.arrow.visible = True
+        EditRectVisual.shown_arrows.add(self)
         
     def update_arrow(self):
         self.arrow.set_data(pos=np.array([self.center - np.array([self.width / 3, 0]), self.center + np.array([self.width / 3, 0])]),
@@ -542,12 +638,9 @@ class EditRectVisual(EditVisual):
 
     def output_properties(self):
 
-        return dict(
-            center=(self.form.center, "px"),
-            width=(self.form.width, "px"),
-            height=(self.form.height, "px"),
-            area=(self.form.height * self.form.width, "px²"),
-            angle=(np.rad2deg(self.control_points._angle), "°"),
+        # the control points are up to date even if the visuals are not
+        return measurements.rectangle_properties(
+            self.center, abs(self.width), abs(self.height), self.control_points._angle
         )
 
     def update_property(self, prop, val, scaling_factor=None):
@@ -569,9 +662,9 @@ class EditRectVisual(EditVisual):
 
     def save(self):
         return dict(
-            center=self.form.center,
-            width=self.form.width,
-            height=self.form.height,
+            center=np.array(self.center),
+            width=abs(self.width),
+            height=abs(self.height),
             angle=self.angle,
         )
 
@@ -589,24 +682,11 @@ class EditRectVisual(EditVisual):
         if self.control_points._width < 0:
             starts, ends = ends, starts
 
-        # Initialize an empty array to hold the intensity profiles
-        intensity_profile_line = np.zeros(n_x)
-        evaluation_coords = np.empty((n_y, n_x, 2))
-        img = np.sum(image, axis=2)
-        # Iterate over all lines
-        for i, (start, end) in enumerate(zip(starts, ends)):
-            # Compute the coordinates along the line
-            x_coords = np.linspace(start[0], end[0], n_x)
-            y_coords = np.linspace(start[1], end[1], n_x)
-
-            evaluation_coords[i, :, :] = np.column_stack((x_coords, y_coords))
-            # Stack the coordinates into a 2D array
-            eval_coords = np.vstack([y_coords, x_coords])
-
-            # Compute the intensity profile for the line
-            intensity_profile_line += map_coordinates(
-                img, eval_coords, mode="constant", **kwargs
-            )
+        # all points of all lines are sampled at once
+        evaluation_coords = measurements.sample_lines(starts, ends, n_x)
+        intensity_profile_line = measurements.summed_profile(
+            image, evaluation_coords, **kwargs
+        )
 
         return intensity_profile_line, evaluation_coords
 
@@ -634,16 +714,15 @@ class EditEllipseVisual(EditVisual):
 
         self.form = Ellipse(center=center, radius=radius, border_width=2, parent=self)
 
-        color = self.settings.value("graphics/object_color").getRgb()
-        self.form.color = tuple([value / 255 for value in color])
-        border_color = self.settings.value("graphics/object_border_color").getRgb()
-        self.form.border_color = tuple([value / 255 for value in border_color])
+        self.form.color = self.settings.snapshot.object_color
+        self.form.border_color = self.settings.snapshot.object_border_color
 
         self.form.interactive = True
 
         self.freeze()
         self.add_subvisual(self.form)
-        self.control_points.update_bounds()
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), 2)
+        self.control_points.set_box(center, 2 * radius[0], 2 * radius[1])
         self.rotate(self.angle)
 
     def set_center(self, val):
@@ -671,17 +750,19 @@ class EditEllipseVisual(EditVisual):
         except ValueError:
             None
 
+    def outline(self, n=64):
+        coords = self.control_points.coords[:, 0, :].astype(np.float64)
+        # semi-axes from the corners of the bounding box
+        center = coords.mean(axis=0)
+        a = 0.5 * (coords[1] - coords[0])
+        b = 0.5 * (coords[0] - coords[3])
+        t = np.linspace(0, 2 * np.pi, n, endpoint=False)[:, np.newaxis]
+        return center + np.cos(t) * a + np.sin(t) * b
+
     def output_properties(self):
 
-        if self.form.radius[0] == self.form.radius[1]:
-            radius = self.form.radius[0]
-        else:
-            radius = self.form.radius
-        return dict(
-            center=(self.form.center, "px"),
-            radius=(radius, "px"),
-            area=(np.prod(self.form.radius) * np.pi, "px²"),
-            angle=(np.rad2deg(self.control_points._angle), "°"),
+        return measurements.ellipse_properties(
+            self.center, 0.5 * np.abs([self.width, self.height]), self.control_points._angle
         )
 
     def update_property(self, prop, val, scaling_factor=None):
@@ -702,8 +783,8 @@ class EditEllipseVisual(EditVisual):
 
     def save(self):
         return dict(
-            center=self.form.center,
-            radius=np.array(self.form.radius),
+            center=np.array(self.center),
+            radius=0.5 * np.abs([self.width, self.height]),
             angle=self.angle,
         )
 
@@ -735,16 +816,15 @@ class LineControlPoints(Compound):
             
         self.selected_cp = None
 
-        self.control_points = [Markers(parent=self) for i in range(0, len(self.coords))]
-        for cpoint, coord in zip(self.control_points, self.coords):
-            cpoint.set_data(
-                pos=np.array([coord], dtype=np.float32),
-                edge_color=self.edge_color,
-                face_color=self.face_color,
-                size=self.marker_size,
-            )
-            cpoint.interactive = True
-        
+        # one Markers visual from vispy.scene.visuals for all control points
+        self.markers = Markers(parent=self)
+        self.markers.set_data(
+            pos=np.asarray(self.coords, dtype=np.float32),
+            edge_color=self.edge_color,
+            face_color=self.face_color,
+            size=self.marker_size,
+        )
+
         self.transform = linear.STTransform(translate=(0, 0, -2))
 
         self.freeze()
@@ -761,26 +841,21 @@ class LineControlPoints(Compound):
         """Adds a new control point to the list of control points at index, 
         or after selected_cp if no index is given."""
         
-        if (len(self.control_points) < self.num_points 
+        if (len(self.coords) < self.num_points 
             or self.num_points == 0):
             # index of current cp to insert new point after it
             if index is None:
                 index = self.get_selected_index()+1
             self.coords = np.vstack((self.coords[:index], point, self.coords[index:]))
-            c_point = Markers(parent=self,
-                                pos=np.array([point], dtype=np.float32),
-                                edge_color=self.edge_color,
-                                face_color=self.face_color,
-                                size=self.marker_size,
-            )
-            c_point.interactive = True
-            self.control_points.insert(index, c_point)
             
             # make the new marker the selected
             if select:
-                self.select(True, c_point)
+                self.select(True, ControlPoint(self, index))
             else:
-                c_point.visible = show
+                # the selected point keeps its position in the line
+                if self.selected_cp is not None and self.selected_cp >= index:
+                    self.selected_cp += 1
+                self.markers.visible = show
 
         else:
             # self.coords[-1] = point
@@ -795,40 +870,47 @@ class LineControlPoints(Compound):
         """
         # select the proper control point by index
         if index is not None:
-            self.selected_cp = self.control_points[index]
+            self.selected_cp = index
         # check if there are more than 2 control points
-        if self.selected_cp is not None and len(self.control_points) > 2:
+        if self.selected_cp is not None and len(self.coords) > 2:
             index = self.get_selected_index()
-            self.selected_cp.parent = None
-            self.selected_cp = self.control_points[index - 1]
-            # remove control point and corresponding coordinate
-            del self.control_points[index]
+            # select the previous point, the last one for the first point
+            self.selected_cp = (index - 1) % (len(self.coords) - 1)
             self.coords = np.delete(self.coords, index, axis=0)
         
         self.update_points()
         self.parent.update_from_controlpoints()
 
     def get_selected_index(self):
-        return self.control_points.index(self.selected_cp)
+        return self.selected_cp
 
     def update_points(self):
+        set_marker_positions(
+            self.markers,
+            self.coords,
+            edge_color=self.edge_color,
+            face_color=self.face_color,
+            size=self.marker_size,
+        )
+        self.parent.geometry_changed()
 
-        for cpoint, coord in zip(self.control_points, self.coords):
-            cpoint.set_data(
-                pos=np.array([coord]),
-                edge_color=self.edge_color,
-                face_color=self.face_color,
-                size=self.marker_size,
-            )
+    def control_point(self, index):
+        return ControlPoint(self, index % len(self.coords))
+
+    def control_point_at(self, pos, tolerance):
+        """Return the control point closest to pos within the tolerance,
+        if the control points are shown."""
+        if not self.markers.visible:
+            return None
+        index = control_point_at(self.coords, pos, tolerance)
+        return None if index is None else ControlPoint(self, index)
 
     def select(self, val, obj=None):
         self.visible(val)
         self.selected_cp = None
 
-        if obj is not None:
-            index = self.control_points.index(obj)
-            if index != -1:
-                self.selected_cp = self.control_points[index]
+        if isinstance(obj, ControlPoint) and obj.parent is self:
+            self.selected_cp = obj.index
 
     def start_move(self, start):
         self.parent.start_move(start)
@@ -838,15 +920,14 @@ class LineControlPoints(Compound):
         if not self.parent.editable:
             return
         if self.selected_cp is not None:
-            index = self.control_points.index(self.selected_cp)
-            self.coords[index] = end[0:2]
+            self.coords[self.selected_cp] = end[0:2]
 
             self.update_points()
             self.parent.update_from_controlpoints()
 
     def visible(self, v):
-        for c in self.control_points:
-            c.visible = v
+        self.markers.visible = v
+        self.parent.collection_changed()
 
     def set_coords(self, coords):
         self.coords = coords
@@ -871,6 +952,7 @@ class LineControlPoints(Compound):
 
 
 class EditLineVisual(EditVisual):
+    closed = False
 
     def __init__(self, num_points=2, coords=None, *args, **kwargs):
 
@@ -880,8 +962,7 @@ class EditLineVisual(EditVisual):
         self.unfreeze()
 
         self.num_points = num_points
-        border_color = self.settings.value("graphics/object_border_color").getRgb()
-        self.line_color = tuple([value / 255 for value in border_color])
+        self.line_color = self.settings.snapshot.object_border_color
         self.line_width = 3
 
         # this is to allow loading of structures
@@ -908,16 +989,18 @@ class EditLineVisual(EditVisual):
 
     @property
     def angles(self):
-        diff = np.diff(self.control_points.coords, axis=0)
-        if len(diff) > 0:
-            diff[0] *= -1
-            angles = np.rad2deg(np.arctan2(-diff[:, 1], diff[:, 0]))
-            return angles
-        return [0]
+        return measurements.line_angles(self.control_points.coords)
     @property
     def angle(self):
         return self.angles[0]
 
+    def outline(self):
+        return self.coords
+
+    def contains(self, pos, tolerance=0.0) -> bool:
+        # the line is a few pixels wide
+        return polyline_distance(self.coords, pos) <= tolerance + 0.5 * self.line_width
+
     def start_move(self, start):
         self.drag_reference = start[:2] - self.control_points.get_center()
 
@@ -958,20 +1041,10 @@ class EditLineVisual(EditVisual):
         self._selectable = val
 
     def select_creation_controlpoint(self):
-        self.control_points.select(True, self.control_points.control_points[0])
+        self.control_points.select(True, self.control_points.control_point(0))
 
     def output_properties(self):
-        if len(self.control_points.control_points) < 2:
-            return dict()
-        if len(self.control_points.control_points) == 2:
-            angle = self.angles
-        else:
-            angle = np.abs(np.diff(self.angles))
-            for i, a in enumerate(angle):
-                if a > 180:
-                    angle[i] = 360 - a
-
-        return dict(length=[self.length, "px"], angle=[angle[0], "°"])
+        return measurements.line_properties(self.control_points.coords)
 
     def update_property(self, prop, val, scaling_factor=None):
         if scaling_factor is None:
@@ -1000,6 +1073,17 @@ class EditLineVisual(EditVisual):
     def get_modifiable_properties(self):
         return ["length"]
 
+    def update_colors(self, color, border_color):
+        self.line_color = border_color
+        self.update_from_controlpoints()
+
+    def anchor_points(self) -> np.ndarray:
+        return self.coords
+
+    def set_anchor_points(self, points, angle):
+        self.control_points.coords = np.asarray(points, dtype=np.float64)
+        self.visuals_outdated = True
+
     def save(self):
         return dict(coords=self.coords, num_points=self.num_points)
 
@@ -1020,8 +1104,9 @@ class EditLineVisual(EditVisual):
         intensity_profiles = np.empty(length)
         evaluation_coords = np.empty((length, 2))
 
-        # Convert the image to grayscale
-        img = np.sum(image, axis=2)
+        # the grayscale image is cached by the ImageCache
+        if not isinstance(image, measurements.ImageCache):
+            image = measurements.ImageCache(image)
 
         count = 0
         for index, m in enumerate(num_points):
@@ -1038,9 +1123,7 @@ class EditLineVisual(EditVisual):
             evaluation_coords[count : count + m] = eval_coords.T[:, ::-1]
 
             # Get the intensity profile along the line segment
-            intensity_profile = map_coordinates(
-                img, eval_coords, mode="constant", **kwargs
-            )
+            intensity_profile = image.map_coordinates(eval_coords, **kwargs)
 
             # Append the intensity profile to full array
             intensity_profiles[count : count + m] = intensity_profile
@@ -1090,10 +1173,8 @@ class EditPolygonVisual(EditLineVisual):
                 parent=self,
             )
             
-            color = self.settings.value("graphics/object_color").getRgb()
-            self.form.color = tuple([value / 255 for value in color])
-            border_color = self.settings.value("graphics/object_border_color").getRgb()
-            self.form.border_color = tuple([value / 255 for value in border_color])
+            self.form.color = self.settings.snapshot.object_color
+            self.form.border_color = self.settings.snapshot.object_border_color
         else:
             self.form.parent = None
             
@@ -1101,6 +1182,11 @@ class EditPolygonVisual(EditLineVisual):
         self.add_subvisual(self.form) 
         self.form.interactive = True
         
+    def contains(self, pos, tolerance=0.0) -> bool:
+        if len(self.coords) < 3:
+            return super().contains(pos, tolerance)
+        return polygon_distance(self.coords, pos) >= -tolerance
+
     def corrected_coords(self):
         """check if two consecutive points are the same and return a view without them"""
         mask = np.any(self.coords[1:] != self.coords[:-1], axis=1)
@@ -1116,6 +1202,20 @@ class EditPolygonVisual(EditLineVisual):
         else:
             self.form.pos = self.corrected_coords()
                                     
+    def update_colors(self, color, border_color):
+        self.line_color = border_color
+        if isinstance(self.form, Polygon):
+            self.form.color = color
+            self.form.border_color = border_color
+        else:
+            super().update_colors(color, border_color)
+
     def intensity_profile(self, image, n=100, origin=np.zeros(2), **kwargs):
         pass
-        
\ No newline at end of file
+        
+
+# class names of the objects, as they are stored in files
+OBJECT_TYPES = {
+    obj_type.__name__: obj_type
+    for obj_type in (EditRectVisual, EditLineVisual, EditEllipseVisual, EditPolygonVisual)
+}
@@ -0,0 +1,171 @@
+"""
+Export the measurements of all objects with one row per object
+
+The table has the columns image, structure and object (index in the
+structure) followed by one column per property, like "width [px]".
+Properties with a length unit are also given in the unit of the
+scaling, like "width [nm]". Array properties get one column per
+element, like "center[0] [px]". The rows are written in blocks of
+one structure, to CSV or to Parquet and HDF5 if pyarrow or h5py are
+installed.
+"""
+
+# absolute imports
+from pathlib import Path
+import numpy as np
+
+# relative imports
+from . import measurements
+
+# rows that are formatted at once when writing CSV files
+CSV_CHUNK_ROWS = 65536
+
+
+def column_names(prop, values, unit) -> list[str]:
+    """Names of the columns of a property with one row per object."""
+    if values.ndim == 1:
+        return [f"{prop} [{unit}]"]
+    return [f"{prop}[{i}] [{unit}]" for i in range(values[0].size)]
+
+
+def measurement_blocks(results_table, locations, scaling_factor=None, length_unit=None) -> list:
+    """The measurements of all objects in blocks of objects of one
+    structure with the same number of points.
+
+    Args:
+        results_table (ResultsTable): the measurements
+        locations (dict): uid -> (structure, index) of the objects
+        scaling_factor (float, optional): length per pixel. Defaults to None.
+        length_unit (str, optional): unit of the scaling. Defaults to None.
+
+    Returns:
+        list[tuple[str, np.ndarray, dict]]: structure, object indices and
+            the columns of each block
+    """
+    results_table.refresh()
+    blocks = list()
+    for structure, tables in results_table.structures.items():
+        for table in tables.values():
+            indices = np.array([locations[uid][1] for uid in table.uids], dtype=np.int64)
+            order = np.argsort(indices)
+            columns = dict()
+            for prop in table.columns:
+                values = table.column(prop)[order]
+                unit = table.units[prop]
+                flat = values.reshape(len(values), -1)
+                columns.update(zip(column_names(prop, values, unit), flat.T))
+                if scaling_factor is not None and prop in measurements.SCALED_PROPERTIES:
+                    scaled, scaled_unit = measurements.scale_property(
+                        prop, flat, unit, scaling_factor, length_unit
+                    )
+                    columns.update(zip(column_names(prop, values, scaled_unit), scaled.T))
+            blocks.append((structure, indices[order], columns))
+    return blocks
+
+
+def header(blocks) -> list[str]:
+    """Names of the property columns of all blocks in order of appearance."""
+    names = dict()
+    for _, _, columns in blocks:
+        names.update(dict.fromkeys(columns))
+    return list(names)
+
+
+def block_values(columns, names, n) -> np.ndarray:
+    """Values of a block with NaN for the columns it does not have."""
+    values = np.full((n, len(names)), np.nan)
+    for i, name in enumerate(names):
+        if name in columns:
+            values[:, i] = columns[name]
+    return values
+
+
+def csv_field(text) -> str:
+    text = str(text)
+    if any(c in text for c in ',"\n'):
+        text = '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def write_csv(file_path, blocks, image=""):
+    names = header(blocks)
+    with open(file_path, "w", encoding="utf-8", newline="") as file:
+        file.write(",".join(csv_field(name) for name in ["image", "structure", "object"] + names) + "\n")
+        for structure, indices, columns in blocks:
+            # the image and the structure are the same for the whole block
+            prefix = f"{csv_field(image)},{csv_field(structure)},".replace("%", "%%")
+            fmt = prefix + ",".join(["%d"] + ["%.10g"] * len(names))
+            for start in range(0, len(indices), CSV_CHUNK_ROWS):
+                stop = start + CSV_CHUNK_ROWS
+                chunk = {name: column[start:stop] for name, column in columns.items()}
+                values = block_values(chunk, names, len(indices[start:stop]))
+                np.savetxt(file, np.column_stack((indices[start:stop], values)), fmt=fmt)
+
+
+def write_parquet(file_path, blocks, image=""):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError("Exporting to Parquet needs pyarrow (pip install pyarrow)") from error
+
+    names = header(blocks)
+    schema = pa.schema(
+        [("image", pa.string()), ("structure", pa.string()), ("object", pa.int64())]
+        + [(name, pa.float64()) for name in names]
+    )
+    with pq.ParquetWriter(file_path, schema) as writer:
+        for structure, indices, columns in blocks:
+            n = len(indices)
+            values = block_values(columns, names, n)
+            arrays = [
+                pa.array([image] * n, pa.string()),
+                pa.array([structure] * n, pa.string()),
+                pa.array(indices),
+            ] + [pa.array(values[:, i]) for i in range(len(names))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_hdf5(file_path, blocks, image=""):
+    try:
+        import h5py
+    except ImportError as error:
+        raise ImportError("Exporting to HDF5 needs h5py (pip install h5py)") from error
+
+    names = header(blocks)
+    string = h5py.string_dtype()
+    with h5py.File(file_path, "w") as file:
+        datasets = [
+            file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=True)
+            for name, dtype in [("image", string), ("structure", string), ("object", np.int64)]
+            + [(name, np.float64) for name in names]
+        ]
+        for structure, indices, columns in blocks:
+            n = len(indices)
+            values = block_values(columns, names, n)
+            start = len(datasets[0])
+            for i, data in enumerate([[image] * n, [structure] * n, indices] + list(values.T)):
+                datasets[i].resize((start + n,))
+                datasets[i][start:] = data
+
+
+EXPORT_FORMATS = {
+    ".csv": write_csv,
+    ".parquet": write_parquet,
+    ".h5": write_hdf5,
+    ".hdf5": write_hdf5,
+}
+
+
+def export_measurements(file_path, blocks, image=""):
+    """Write the measurement blocks in the format given by the file extension.
+
+    Args:
+        file_path (Path): .csv, .parquet, .h5 or .hdf5 file
+        blocks (list): blocks of measurement_blocks
+        image (str, optional): name of the measured image
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format: {suffix}")
+    EXPORT_FORMATS[suffix](file_path, blocks, image)
@@ -0,0 +1,313 @@
+# absolute imports
+from pathlib import Path
+import io
+import mmap
+import struct
+import numpy as np
+import cv2
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+# TIFF field types: struct format and size in bytes
+TIFF_TYPES = {
+    1: ("B", 1),  # BYTE
+    2: ("s", 1),  # ASCII
+    3: ("H", 2),  # SHORT
+    4: ("I", 4),  # LONG
+    5: ("I", 8),  # RATIONAL (two LONGs)
+    6: ("b", 1),  # SBYTE
+    7: ("s", 1),  # UNDEFINED
+    8: ("h", 2),  # SSHORT
+    9: ("i", 4),  # SLONG
+    10: ("i", 8),  # SRATIONAL (two SLONGs)
+    11: ("f", 4),  # FLOAT
+    12: ("d", 8),  # DOUBLE
+    16: ("Q", 8),  # LONG8 (BigTIFF)
+    17: ("q", 8),  # SLONG8 (BigTIFF)
+    18: ("Q", 8),  # IFD8 (BigTIFF)
+}
+
+# (SampleFormat, BitsPerSample) -> dtype of uncompressed TIFF samples
+TIFF_DTYPES = {
+    (1, 8): np.uint8,
+    (1, 16): np.uint16,
+    (1, 32): np.uint32,
+    (2, 8): np.int8,
+    (2, 16): np.int16,
+    (2, 32): np.int32,
+    (3, 32): np.float32,
+    (3, 64): np.float64,
+}
+
+
+def map_file(file_path: Path):
+    """Map a file read-only into memory. Pages of the file are only
+    read from disk when they are accessed.
+
+    Args:
+        file_path (Path): path to the file
+
+    Returns:
+        mmap.mmap | bytes: the file content
+    """
+    with open(file_path, "rb") as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            return file.read()
+
+
+def read_tiff_ifd(buffer) -> tuple[str, dict] | None:
+    """Read the tags of the first image file directory of a (Big)TIFF file.
+
+    Args:
+        buffer (bytes-like): the file content
+
+    Returns:
+        tuple[str, dict] | None: byte order and a dictionary mapping the tag
+            number to its value or None if it is not a TIFF file.
+            ASCII values are returned as strings, UNDEFINED values as bytes
+            and all other values as tuples.
+    """
+    header = bytes(buffer[:16])
+    if header[:2] == b"II":
+        endian = "<"
+    elif header[:2] == b"MM":
+        endian = ">"
+    else:
+        return None
+
+    version = struct.unpack(endian + "H", header[2:4])[0]
+    if version == 42:
+        ifd_offset = struct.unpack(endian + "I", header[4:8])[0]
+        count_format, entry_format, field_size = "H", "HHI", 4
+    elif version == 43:
+        ifd_offset = struct.unpack(endian + "Q", header[8:16])[0]
+        count_format, entry_format, field_size = "Q", "HHQ", 8
+    else:
+        return None
+
+    count_size = struct.calcsize(count_format)
+    entry_size = struct.calcsize(endian + entry_format) + field_size
+    n_entries = struct.unpack(
+        endian + count_format, buffer[ifd_offset : ifd_offset + count_size]
+    )[0]
+
+    tags = dict()
+    for i in range(n_entries):
+        start = ifd_offset + count_size + i * entry_size
+        field_start = start + entry_size - field_size
+        tag, field_type, count = struct.unpack(
+            endian + entry_format, buffer[start:field_start]
+        )
+        if field_type not in TIFF_TYPES:
+            continue
+        value_format, value_size = TIFF_TYPES[field_type]
+        size = value_size * count
+        # small values are stored directly in the entry
+        if size <= field_size:
+            data = bytes(buffer[field_start : field_start + size])
+        else:
+            value_offset = struct.unpack(
+                endian + ("I" if field_size == 4 else "Q"),
+                buffer[field_start : field_start + field_size],
+            )[0]
+            data = bytes(buffer[value_offset : value_offset + size])
+
+        if field_type == 2:
+            tags[tag] = data.rstrip(b"\0").decode("latin-1")
+        elif field_type == 7:
+            tags[tag] = data
+        elif field_type in (5, 10):
+            values = struct.unpack(f"{endian}{2 * count}{value_format}", data)
+            tags[tag] = tuple(
+                num / den if den else 0.0 for num, den in zip(values[::2], values[1::2])
+            )
+        else:
+            tags[tag] = struct.unpack(f"{endian}{count}{value_format}", data)
+
+    return endian, tags
+
+
+def read_tiff_tags(buffer) -> dict | None:
+    """Read the tags of the first image of a TIFF file, see read_tiff_ifd."""
+    ifd = read_tiff_ifd(buffer)
+    return None if ifd is None else ifd[1]
+
+
+def map_tiff(buffer) -> np.ndarray | None:
+    """Create a read-only view onto the pixels of an uncompressed TIFF.
+
+    This works for grayscale and RGB(A) images whose strips (or tiles
+    spanning the full width) are stored consecutively.
+
+    Args:
+        buffer (bytes-like): the file content
+
+    Returns:
+        np.ndarray | None: the pixel data or None if the image can not be mapped
+    """
+    ifd = read_tiff_ifd(buffer)
+    if ifd is None:
+        return None
+    endian, tags = ifd
+    try:
+        width = tags[256][0]
+        height = tags[257][0]
+        bits = set(tags.get(258, (1,)))
+        compression = tags.get(259, (1,))[0]
+        photometric = tags.get(262, (None,))[0]
+        samples = tags.get(277, (1,))[0]
+        planar = tags.get(284, (1,))[0]
+        sample_format = tags.get(339, (1,))[0]
+        if 322 in tags:
+            # tiled image
+            chunk_width, chunk_height = tags[322][0], tags[323][0]
+            offsets = tags[324]
+        else:
+            chunk_width, chunk_height = width, tags.get(278, (height,))[0]
+            offsets = tags[273]
+    except (KeyError, IndexError):
+        return None
+
+    # only uncompressed, interleaved BlackIsZero or RGB images can be mapped
+    if compression != 1 or planar != 1 or len(bits) != 1:
+        return None
+    if not (photometric == 1 and samples == 1 or photometric == 2 and samples in (3, 4)):
+        return None
+    dtype = TIFF_DTYPES.get((sample_format, bits.pop()))
+    if dtype is None:
+        return None
+    dtype = np.dtype(dtype).newbyteorder(endian)
+    # multibyte samples of the other byte order would have to be swapped
+    if dtype.itemsize > 1 and not dtype.isnative:
+        return None
+    # the chunks need to span the full width and follow each other without gaps
+    if chunk_width < width:
+        return None
+    chunk_bytes = chunk_height * chunk_width * samples * dtype.itemsize
+    if offsets != tuple(offsets[0] + i * chunk_bytes for i in range(len(offsets))):
+        return None
+    n_values = height * chunk_width * samples
+    if offsets[0] + n_values * dtype.itemsize > len(buffer):
+        return None
+
+    img_data = np.frombuffer(buffer, dtype=dtype, count=n_values, offset=offsets[0])
+    img_data = img_data.reshape((height, chunk_width, samples))[:, :width]
+    return as_rgb(img_data)
+
+
+def map_npy(buffer) -> np.ndarray | None:
+    """Create a read-only view onto the array of a raw .npy dump.
+
+    Args:
+        buffer (bytes-like): the file content
+
+    Returns:
+        np.ndarray | None: the pixel data or None if it is not a .npy file
+    """
+    if bytes(buffer[:6]) != b"\x93NUMPY":
+        return None
+    header = io.BytesIO(bytes(buffer[:65536]))
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    if dtype.hasobject or len(shape) not in (2, 3):
+        return None
+
+    img_data = np.frombuffer(
+        buffer, dtype=dtype, count=int(np.prod(shape)), offset=header.tell()
+    )
+    img_data = img_data.reshape(shape, order="F" if fortran_order else "C")
+    if img_data.ndim == 2:
+        img_data = img_data[:, :, np.newaxis]
+    if img_data.shape[2] not in (1, 3, 4):
+        return None
+    return as_rgb(img_data)
+
+
+def as_rgb(img_data: np.ndarray) -> np.ndarray:
+    """Turn a (height, width, channels) view into an RGB view without copying.
+    Grayscale is broadcast onto three channels and alpha is dropped like
+    it happens when decoding with OpenCV."""
+    if img_data.shape[2] == 1:
+        return np.broadcast_to(img_data, img_data.shape[:2] + (3,))
+    return img_data[:, :, :3]
+
+
+def is_mapped(img_data: np.ndarray | None) -> bool:
+    """Check if the pixels are a view onto a byte stream, e.g. the ones
+    of map_image, and not an array of their own."""
+    base = img_data
+    while isinstance(base, np.ndarray):
+        base = base.base
+    return img_data is not None and base is not None
+
+
+def map_image(byte_stream) -> np.ndarray | None:
+    """Return a read-only view onto the pixels of an uncompressed image
+    or None if the format needs to be decoded."""
+    for mapper in (map_npy, map_tiff):
+        try:
+            img_data = mapper(byte_stream)
+        except (struct.error, ValueError, IndexError, TypeError):
+            # malformed headers are left to OpenCV
+            img_data = None
+        if img_data is not None:
+            return img_data
+    return None
+
+
+def decode_image(byte_stream) -> np.ndarray:
+    """Decode an encoded image into an RGB(A) pixel array.
+
+    Uncompressed TIFFs and .npy files are not decoded but mapped
+    as a read-only view onto the byte stream.
+
+    Args:
+        byte_stream (bytes-like): the image file content
+
+    Returns:
+        np.ndarray: the decoded pixel data
+    """
+    img_data = map_image(byte_stream)
+    if img_data is not None:
+        return img_data
+
+    # opencv reads images in BGR format,
+    # so we need to convert it to RGB
+    BGR_img = cv2.imdecode(
+        np.frombuffer(byte_stream, dtype=np.uint8),
+        cv2.IMREAD_UNCHANGED,
+    )
+    if BGR_img is None:
+        raise ValueError("Unsupported or corrupted image data")
+    return cv2.cvtColor(BGR_img, cv2.COLOR_BGR2RGB)
+
+
+class ImageDecodeSignals(QObject):
+    """Signals of the ImageDecodeWorker. They carry the generation of
+    the request so that results of cancelled requests can be dropped."""
+
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+
+class ImageDecodeWorker(QRunnable):
+    """Decodes an image byte stream on a thread of a QThreadPool."""
+
+    def __init__(self, byte_stream, generation: int):
+        super().__init__()
+        self.byte_stream = byte_stream
+        self.generation = generation
+        self.signals = ImageDecodeSignals()
+
+    def run(self):
+        try:
+            img_data = decode_image(self.byte_stream)
+        except Exception as error:
+            self.signals.failed.emit(self.generation, str(error))
+        else:
+            self.signals.finished.emit(self.generation, img_data)
@@ -0,0 +1,357 @@
+"""
+Journal of the measurements to recover them after a crash
+
+While a file is open, the changes of its objects are appended to a
+journal next to the file, like 'image.tif.msry-journal'. Every line is
+one JSON record:
+
+    {"op": "session", "file": "/path/image.tif", "pid": 1234}
+    {"op": "add", "uid": 3, "structure": "s1", "index": 0, "type": "EditLineVisual", "state": {...}}
+    {"op": "update", "uid": 3, "state": {...}}
+    {"op": "remove", "uid": 3, "structure": "s1"}
+    {"op": "rename", "structure": "s1", "new_structure": "s2"}
+    {"op": "clear"}
+    {"op": "view", "origin": [0.0, 0.0], "rotation": 90}
+    {"op": "snapshot", "structures": {"s1": [[3, "EditLineVisual", {...}], ...]}}
+
+The journal observes the ObjectStore and only writes when `flush` is
+called, after every command of the undo stack, so an edit writes the
+objects it changed and nothing else. After COMPACT_RECORDS records the
+journal is rewritten as one snapshot. The journal is removed when the
+session ends normally, a journal that is left over belongs to a session
+that crashed. It is left untouched until the user decided to restore
+or to discard it, only then a new journal replaces it. Journals are also
+listed in SESSIONS_DIR, so that crashed sessions are found on startup.
+"""
+
+# absolute imports
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+
+JOURNAL_SUFFIX = ".msry-journal"
+# the journal is rewritten as a snapshot after this many records
+COMPACT_RECORDS = 1000
+# one file per open journal, removed when the session ends
+SESSIONS_DIR = Path.home() / ".measury" / "sessions"
+
+
+class JournalState(NamedTuple):
+    """The measurements recorded in a journal."""
+
+    # file the session had opened
+    file: Path | None
+    # structure -> list of (object type name, state)
+    structures: dict
+    origin: np.ndarray | None = None
+    rotation: int = 0
+    # the journal that was read
+    path: Path | None = None
+
+
+def journal_path(file_path) -> Path:
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + JOURNAL_SUFFIX)
+
+
+def to_json(value):
+    """Make the state of an object JSON serializable."""
+    if isinstance(value, dict):
+        return {key: to_json(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(val) for val in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def from_json(state: dict) -> dict:
+    """State of an object as it is passed to its constructor."""
+    return {
+        key: np.array(val, dtype=np.float64) if isinstance(val, list) else val
+        for key, val in state.items()
+    }
+
+
+def process_alive(pid) -> bool:
+    """Check if the process of a session is still running."""
+    if pid == os.getpid():
+        return True
+    if sys.platform == "win32":
+        import ctypes
+
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_session(path) -> dict | None:
+    """The session record at the start of a journal."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            record = json.loads(file.readline())
+    except (OSError, ValueError):
+        return None
+    return record if record.get("op") == "session" else None
+
+
+def is_crashed(path) -> bool:
+    """Check if a journal was left over by a session that is not running."""
+    session = read_session(path)
+    return session is not None and not process_alive(session.get("pid"))
+
+
+def read_journal(path) -> JournalState | None:
+    """Replay the records of a journal.
+
+    Args:
+        path (Path): the journal
+
+    Returns:
+        JournalState | None: the recorded measurements, None if there is no journal
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+
+    session = dict()
+    structures = dict()  # structure -> uids
+    objects = dict()  # uid -> [type name, state]
+    view = dict()
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # the last record may be cut off by the crash
+            break
+        match record["op"]:
+            case "session":
+                session = record
+            case "snapshot":
+                structures = {
+                    structure: [uid for uid, _, _ in entries]
+                    for structure, entries in record["structures"].items()
+                }
+                objects = {
+                    uid: [type_name, state]
+                    for entries in record["structures"].values()
+                    for uid, type_name, state in entries
+                }
+            case "add":
+                uid = record["uid"]
+                for uids in structures.values():
+                    if uid in uids:
+                        uids.remove(uid)
+                objects[uid] = [record["type"], record["state"]]
+                structures.setdefault(record["structure"], []).insert(record["index"], uid)
+            case "update":
+                if record["uid"] in objects:
+                    objects[record["uid"]][1] = record["state"]
+            case "remove":
+                # the structure may have been renamed in the same flush
+                for structure in [record["structure"], *structures]:
+                    uids = structures.get(structure, [])
+                    if record["uid"] in uids:
+                        uids.remove(record["uid"])
+                        if not uids:
+                            del structures[structure]
+                        break
+                objects.pop(record["uid"], None)
+            case "rename":
+                if record["structure"] in structures:
+                    structures[record["new_structure"]] = structures.pop(record["structure"])
+            case "clear":
+                structures, objects = dict(), dict()
+            case "view":
+                view.update(record)
+
+    return JournalState(
+        file=Path(session["file"]) if session.get("file") else None,
+        structures={
+            structure: [(objects[uid][0], from_json(objects[uid][1])) for uid in uids]
+            for structure, uids in structures.items()
+            if uids
+        },
+        origin=np.array(view["origin"], dtype=np.float64) if "origin" in view else None,
+        rotation=view.get("rotation", 0),
+        path=Path(path),
+    )
+
+
+def pointer_path(path) -> Path:
+    """The file in SESSIONS_DIR that lists a journal."""
+    return SESSIONS_DIR / (
+        hashlib.sha1(str(Path(path).resolve()).encode()).hexdigest()[:16] + ".txt"
+    )
+
+
+def remove_journal(path):
+    """Remove a journal and the file that lists it in SESSIONS_DIR."""
+    for file in (Path(path), pointer_path(path)):
+        try:
+            file.unlink()
+        except OSError:
+            pass
+
+
+def crashed_sessions() -> list[Path]:
+    """Journals of SESSIONS_DIR whose session is not running anymore."""
+    journals = list()
+    if not SESSIONS_DIR.is_dir():
+        return journals
+    for pointer in SESSIONS_DIR.glob("*.txt"):
+        try:
+            path = Path(pointer.read_text(encoding="utf-8").strip())
+            if not path.exists():
+                pointer.unlink()
+            elif is_crashed(path):
+                journals.append(path)
+        except OSError:
+            continue
+    return journals
+
+
+class Journal:
+    """Appends the changes of the objects of an ObjectStore to a journal,
+    see the module docstring. It is an observer of the store."""
+
+    def __init__(self, object_store, file_path, view=None):
+        self.object_store = object_store
+        self.file_path = Path(file_path)
+        self.path = journal_path(file_path)
+        self.pointer = pointer_path(self.path)
+        # uid -> (operation, object, structure) of the changes since the last flush
+        self.pending = dict()
+        # records of renamed structures and cleared stores, in order
+        self.staged = list()
+        self.view = None
+        self.n_records = 0
+        self.file = None
+        self.compact(view)
+        try:
+            SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+            self.pointer.write_text(str(self.path.resolve()), encoding="utf-8")
+        except OSError:
+            # the journal still works, the session is only not found on startup
+            pass
+        object_store.observers.append(self)
+
+    # called by the ObjectStore
+
+    def object_added(self, obj, structure):
+        self.pending[obj.uid] = ("add", obj, structure)
+
+    def object_changed(self, obj):
+        if obj.uid not in self.pending:
+            self.pending[obj.uid] = ("update", obj, None)
+
+    def object_removed(self, obj, structure):
+        if self.pending.get(obj.uid, ("",))[0] == "add":
+            # it was never written
+            del self.pending[obj.uid]
+        else:
+            self.pending[obj.uid] = ("remove", obj, structure)
+
+    def structure_renamed(self, structure, new_structure):
+        # pending objects are added with the structure they have when flushed
+        self.staged.append(dict(op="rename", structure=structure, new_structure=new_structure))
+
+    def cleared(self):
+        self.pending.clear()
+        self.staged.append(dict(op="clear"))
+
+    # records
+
+    def stage(self):
+        """Turn the pending changes into records, with the current states."""
+        locations = self.object_store.locations
+        adds = list()
+        for uid, (operation, obj, structure) in self.pending.items():
+            if operation == "remove":
+                self.staged.append(dict(op="remove", uid=uid, structure=structure))
+            elif uid not in locations:
+                continue
+            elif operation == "add":
+                structure, index = locations[uid]
+                adds.append(
+                    dict(
+                        op="add", uid=uid, structure=structure, index=index,
+                        type=type(obj).__name__, state=to_json(obj.save()),
+                    )
+                )
+            else:
+                self.staged.append(dict(op="update", uid=uid, state=to_json(obj.save())))
+        # inserting in the order of the indices gives the order of the structure
+        self.staged.extend(sorted(adds, key=lambda record: record["index"]))
+        self.pending.clear()
+
+    def flush(self, view=None):
+        """Write the changes since the last flush.
+
+        Args:
+            view (dict, optional): origin and rotation of the image,
+                written if they changed. Defaults to None.
+        """
+        if self.file is None:
+            return
+        self.stage()
+        if view is not None and view != self.view:
+            self.staged.append(dict(op="view", **view))
+            self.view = view
+        if not self.staged:
+            return
+        self.file.write("".join(json.dumps(record) + "\n" for record in self.staged))
+        self.file.flush()
+        self.n_records += len(self.staged)
+        self.staged.clear()
+        if self.n_records >= COMPACT_RECORDS:
+            self.compact(self.view)
+
+    def compact(self, view=None):
+        """Rewrite the journal as a snapshot of all objects."""
+        self.pending.clear()
+        self.staged.clear()
+        if self.file is not None:
+            self.file.close()
+        structures = {
+            structure: [[obj.uid, type(obj).__name__, to_json(obj.save())] for obj in objects]
+            for structure, objects in self.object_store.structures.items()
+        }
+        records = [dict(op="session", file=str(self.file_path), pid=os.getpid())]
+        if view is not None:
+            records.append(dict(op="view", **view))
+        records.append(dict(op="snapshot", structures=structures))
+        # the old journal is replaced only once the snapshot is complete
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in records))
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.view = view
+        self.n_records = 0
+
+    def close(self, remove=True):
+        """Stop recording, the journal is removed if the session ends normally."""
+        if self in self.object_store.observers:
+            self.object_store.observers.remove(self)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if remove:
+            remove_journal(self.path)
@@ -30,13 +30,14 @@ import re
 # relative imports
 from .windows import SaveWindow
 from .data.microscopes import Microscope
+from . import measurements, metadata
 
 
 class MainUI(QWidget):
 
     main_window = None
     update_full_table = False
-    DEFAULT_THRESHOLD = 10
+    DEFAULT_THRESHOLD = measurements.DEFAULT_THRESHOLD
 
     def __init__(self, main_window, parent=None):
 
@@ -271,7 +272,7 @@ class MainUI(QWidget):
         self.setLayout(self.layout)
         
     def set_selected_object_table_columns(self):
-        if self.main_window.settings.value("ui/show_both_scaling", type=bool):
+        if self.main_window.settings.snapshot.show_both_scaling:
             self.selected_object_table.setColumnCount(5)
         else:
             self.selected_object_table.setColumnCount(3)
@@ -317,7 +318,7 @@ class MainUI(QWidget):
                 self.selected_object_table.setItem(i, 2, QTableWidgetItem(unit))
 
             # if setting selected that pixels should be shown too
-            if self.main_window.settings.value("ui/show_both_scaling", type=bool) and self.scaling_factor is not None:
+            if self.main_window.settings.snapshot.show_both_scaling and self.scaling_factor is not None:
                 self.selected_object_table.setItem(i, 3, QTableWidgetItem(str(value)))
                 self.selected_object_table.setItem(i, 4, QTableWidgetItem(unit))
             else:
@@ -402,6 +403,11 @@ class MainUI(QWidget):
     def automatic_scaling(self):
         # only when image is loaded
         if not self.vispy_canvas.start_state:
+            # the pixel size of the metadata makes the scale bar unnecessary
+            pixel_size = self.data_handler.img_metadata.pixel_size
+            if pixel_size is not None:
+                self.set_pixel_size(pixel_size)
+                return
             # get seedPoint from micros_db
             try:
                 seed_points = self.get_microscope().seed_points
@@ -420,6 +426,23 @@ class MainUI(QWidget):
                     + str(e)
                 )
 
+    def apply_metadata(self, img_metadata, set_scaling=True):
+        """Select the microscope and set the scaling found in the metadata
+        of the image, see metadata.read_metadata."""
+        name = metadata.match_microscope(img_metadata.instrument, self.data_handler.micros_db)
+        if name is not None:
+            self.dd_select_micop.setCurrentText(name)
+        if set_scaling and img_metadata.pixel_size is not None:
+            self.set_pixel_size(img_metadata.pixel_size)
+
+    def set_pixel_size(self, pixel_size):
+        """Set the scaling to the length of one pixel in meters."""
+        length, unit = metadata.pixel_size_in_unit(pixel_size, self.data_handler.units)
+        self.units_dd.setCurrentText(unit)
+        self.pixel_edit.setText("1")
+        self.length_edit.setText(f"{length:.6g}")
+        self.units_changed()
+
     def update_scaling(self):
         length = self.length_edit.text()
         pixels = self.pixel_edit.text()
@@ -11,15 +11,17 @@ from PySide6.QtWidgets import (
     QToolButton,
     QSizePolicy,
     QStyle,
+    QProgressBar,
 )
 from PySide6.QtCore import Qt, QTimer
 from sys import modules as sys_modules
 import numpy as np
 import traceback
+from pathlib import Path
 
 
 # relative imports
-from . import measury_path
+from . import measury_path, journal
 from .main_ui import MainUI
 from .right_ui import RightUI
 from .vispy_canvas import VispyCanvas
@@ -68,6 +70,9 @@ class MainWindow(QMainWindow):
 
         # create undo stack
         self.undo_stack = QUndoStack(self)
+        self.update_undo_limit()
+        # every command, undo and redo is written to the journal
+        self.undo_stack.indexChanged.connect(lambda index: self.data_handler.flush_journal())
 
         self.initUI()
 
@@ -202,6 +207,34 @@ class MainWindow(QMainWindow):
         exportCoordsAction.triggered.connect(self.export_object_coords)
 
 
+        # detect particles actions
+
+        detectEllipsesAction = QAction("Detect Particles", self)
+        detectEllipsesAction.setStatusTip(
+            "Add an ellipse for every particle in the image or in the selected rectangle"
+        )
+        detectEllipsesAction.triggered.connect(
+            lambda: self.vispy_canvas.detect_particles(shape="ellipse")
+        )
+
+        detectPolygonsAction = QAction("Detect Particles as Polygons", self)
+        detectPolygonsAction.setStatusTip(
+            "Add a polygon for every particle in the image or in the selected rectangle"
+        )
+        detectPolygonsAction.triggered.connect(
+            lambda: self.vispy_canvas.detect_particles(shape="polygon")
+        )
+
+        # export measurements action
+
+        exportMeasurementsAction = QAction(
+            self.style().standardIcon(QStyle.StandardPixmap.SP_DialogSaveButton),
+            "Export Measurements",
+            self,
+        )
+        exportMeasurementsAction.setStatusTip("Export the properties of all objects as a table")
+        exportMeasurementsAction.triggered.connect(self.data_handler.export_measurements_table)
+
         delete_all_objects_action = QAction(
             self.style().standardIcon(QStyle.StandardPixmap.SP_DialogDiscardButton),
             "Delete all Objects",
@@ -230,6 +263,10 @@ class MainWindow(QMainWindow):
         measurementsMenu = menuBar.addMenu("&Measurements")
         measurementsMenu.addAction(measurementAction)
         measurementsMenu.addAction(exportCoordsAction)
+        measurementsMenu.addAction(exportMeasurementsAction)
+        measurementsMenu.addSeparator()
+        measurementsMenu.addAction(detectEllipsesAction)
+        measurementsMenu.addAction(detectPolygonsAction)
         viewMenu = menuBar.addMenu("&View")
         viewMenu.addAction(centerAction)
         viewMenu.addAction(hideAction)
@@ -267,6 +304,13 @@ class MainWindow(QMainWindow):
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
 
+        # busy indicator for long running tasks like decoding images
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setMaximumWidth(150)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+
     def open_about_page(self):
         self.about_window = AboutWindow(parent=self)
         self.about_window.show()
@@ -285,8 +329,63 @@ class MainWindow(QMainWindow):
             self.data_window.activateWindow()
 
     def closeEvent(self, event):
+        self.data_handler.close_journal()
         QApplication.closeAllWindows()
 
+    def offer_recovery(self, state):
+        """Ask if the measurements of a crashed session of the open file
+        should be restored, without blocking the file from loading."""
+        n_objects = sum(len(objects) for objects in state.structures.values())
+        self.recovery_box = QMessageBox(
+            QMessageBox.Icon.Question,
+            "Restore Measurements",
+            f"Measury was not closed properly while {state.file.name} was open.\n\n"
+            f"Do you want to restore its {n_objects} measurements?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            self,
+        )
+
+        def finished(result):
+            # another file was opened in the meantime
+            if self.data_handler.file_path != state.file or self.data_handler.object_journal is not None:
+                return
+            if result == QMessageBox.StandardButton.Yes:
+                self.data_handler.restore_journal(state)
+            else:
+                self.data_handler.discard_journal(state)
+
+        self.recovery_box.finished.connect(finished)
+        self.recovery_box.open()
+
+    def offer_crashed_sessions(self):
+        """Offer to open the file of the last crashed session on startup."""
+        journals = journal.crashed_sessions()
+        if not journals:
+            return
+        path = max(journals, key=lambda path: path.stat().st_mtime)
+        session = journal.read_session(path)
+        file_path = Path(session["file"])
+
+        self.recovery_box = QMessageBox(
+            QMessageBox.Icon.Question,
+            "Restore Measurements",
+            f"Measury was not closed properly while {file_path.name} was open.\n\n"
+            "Do you want to open it and restore the measurements?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            self,
+        )
+
+        def finished(result):
+            if result == QMessageBox.StandardButton.Yes and file_path.exists():
+                self.data_handler.open_file(file_path, restore_journal=True)
+            else:
+                # do not ask again for this session,
+                # the other crashed sessions are offered next time
+                journal.remove_journal(path)
+
+        self.recovery_box.finished.connect(finished)
+        self.recovery_box.open()
+
     def raise_error(self, error:Exception):
         self.data_handler.logger.error(str(error).replace("\n", " "))
         if "pytest" in sys_modules:
@@ -295,8 +394,37 @@ class MainWindow(QMainWindow):
             self.data_handler.logger.debug("Error-Traceback: " + traceback.format_exc())
             QMessageBox.critical(self, "Error", str(error))
 
+    def show_progress(self, message):
+        """Show the busy indicator with a message in the status bar."""
+        self.statusBar().showMessage(message)
+        self.progress_bar.show()
+
+    def hide_progress(self):
+        self.statusBar().clearMessage()
+        self.progress_bar.hide()
+
     def reset_undo_stack(self):
         self.undo_stack.clear()
+        self.update_undo_limit()
+
+    def update_undo_limit(self) -> bool:
+        """Apply the number of undo steps of the settings, the oldest
+        steps are dropped when it is reached.
+
+        Returns:
+            bool: False if the undo history has to be cleared before,
+                Qt only allows to change the limit while it is empty
+        """
+        undo_limit = self.settings.value("misc/undo_limit", type=int)
+        if undo_limit == self.undo_stack.undoLimit():
+            return True
+        if self.undo_stack.count():
+            self.data_handler.logger.info(
+                "The undo limit is applied once the undo history is cleared"
+            )
+            return False
+        self.undo_stack.setUndoLimit(undo_limit)
+        return True
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Delete:
@@ -386,4 +514,5 @@ class DropEnabledQOpenGLWidget(QOpenGLWidget):
     def dropEvent(self, event):
         if len(event.mimeData().urls()) == 1:
             img_path = event.mimeData().urls()[0].toLocalFile()
+            # opening the dropped file cancels an image that is still decoding
             self.vispy_canvas.data_handler.open_file(img_path)
@@ -0,0 +1,546 @@
+# absolute imports
+import numpy as np
+import cv2
+
+# the measurement logic without any dependency on Qt or vispy,
+# it is shared by the GUI and the batch processing
+
+DEFAULT_THRESHOLD = 10
+# properties that have a length unit and are converted by the scaling
+SCALED_PROPERTIES = ("length", "area", "radius", "width", "height", "center")
+
+
+def seed_pixel(shape, seed_points, relative=True) -> tuple[int, int]:
+    """Return the pixel (x, y) of a seed point.
+
+    Args:
+        shape (tuple): shape of the image
+        seed_points (tuple): seed point as (x, y)
+        relative (bool, optional): whether the seed point is given as a fraction
+            of the image size. Defaults to True.
+    """
+    if relative:
+        return round(seed_points[0] * shape[1]), round(seed_points[1] * shape[0])
+    seed_point_x, seed_point_y = seed_points
+    return int(seed_point_x), int(seed_point_y)
+
+
+def fill_scale_bar(
+    img_data: np.ndarray,
+    seed_points,
+    relative=True,
+    threshold=DEFAULT_THRESHOLD,
+    crop_size=256,
+) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    """Flood fill an area of similar pixels, starting at the seed point.
+
+    Only a crop around the seed point is filled. If the filled area
+    reaches the border of the crop, the crop is enlarged and filled again.
+
+    Args:
+        img_data (np.ndarray): RGB image
+        seed_points (tuple): seed point as (x, y)
+        relative (bool, optional): seed point as a fraction of the image size. Defaults to True.
+        threshold (int, optional): maximum difference of neighbouring pixels. Defaults to DEFAULT_THRESHOLD.
+        crop_size (int, optional): initial distance of the crop border to the seed point. Defaults to 256.
+
+    Returns:
+        tuple[np.ndarray, tuple]: mask of the filled pixels inside of their
+            bounding rectangle and the rectangle (x, y, width, height)
+    """
+    height, width = img_data.shape[:2]
+    x, y = seed_pixel(img_data.shape, seed_points, relative)
+    if not (0 <= x < width and 0 <= y < height):
+        raise ValueError(f"The seed point ({x}, {y}) is outside of the image")
+
+    size = crop_size
+    while True:
+        x_start, x_stop = max(x - size, 0), min(x + size + 1, width)
+        y_start, y_stop = max(y - size, 0), min(y + size + 1, height)
+        crop = np.ascontiguousarray(img_data[y_start:y_stop, x_start:x_stop])
+        mask = np.zeros((y_stop - y_start + 2, x_stop - x_start + 2), dtype=np.uint8)
+        # only the mask is filled, the image stays untouched
+        _, _, mask, (r_x, r_y, r_width, r_height) = cv2.floodFill(
+            crop,
+            mask,
+            (x - x_start, y - y_start),
+            newVal=(0, 0, 0),
+            loDiff=[threshold] * 3,
+            upDiff=[threshold] * 3,
+            flags=4 | cv2.FLOODFILL_MASK_ONLY | (1 << 8),
+        )
+        touches_border = (
+            r_x == 0 and x_start > 0
+            or r_y == 0 and y_start > 0
+            or r_x + r_width == x_stop - x_start and x_stop < width
+            or r_y + r_height == y_stop - y_start and y_stop < height
+        )
+        if not touches_border:
+            break
+        size *= 2
+
+    # the mask has a border of one pixel
+    mask = mask[1 + r_y : 1 + r_y + r_height, 1 + r_x : 1 + r_x + r_width].astype(bool)
+    return mask, (x_start + r_x, y_start + r_y, r_width, r_height)
+
+
+def find_scale_bar_width(
+    img_data: np.ndarray,
+    seed_points,
+    relative=True,
+    threshold=DEFAULT_THRESHOLD,
+    direction="horizontal",
+) -> tuple[int, np.ndarray, tuple[int, int, int, int]]:
+    """Find the width of the scale bar by flood filling an area of
+    similar pixels, starting at the seed point.
+
+    Args:
+        img_data (np.ndarray): RGB image
+        seed_points (tuple): seed point as (x, y)
+        relative (bool, optional): seed point as a fraction of the image size. Defaults to True.
+        threshold (int, optional): maximum difference of neighbouring pixels. Defaults to DEFAULT_THRESHOLD.
+        direction (str, optional): "horizontal" or "vertical". Defaults to "horizontal".
+
+    Returns:
+        tuple[int, np.ndarray, tuple]: width of the scale bar in pixels,
+            the mask of the scale bar and its bounding rectangle, see fill_scale_bar
+    """
+    mask, rect = fill_scale_bar(img_data, seed_points, relative, threshold)
+    if direction == "horizontal":
+        scale_px = rect[2]
+    else:
+        scale_px = rect[3]
+    return scale_px, mask, rect
+
+
+# cv2.rotate codes of the clockwise rotations in degrees
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def rotate_image_data(img_data: np.ndarray, rotation: int) -> np.ndarray:
+    """Rotate an image clockwise by a multiple of 90 degrees."""
+    rotation %= 360
+    if rotation == 0:
+        return img_data
+    return cv2.rotate(img_data, ROTATE_CODES[rotation])
+
+
+def rotation_matrix(rotation: int, shape) -> np.ndarray:
+    """Affine matrix that maps pixel coordinates (x, y) of an image to the
+    image rotated clockwise by a multiple of 90 degrees, like rotate_image_data.
+
+    Args:
+        rotation (int): rotation in degrees
+        shape (tuple): height and width of the image before the rotation
+
+    Returns:
+        np.ndarray: 3x3 matrix for homogeneous column vectors (x, y, 1)
+    """
+    height, width = shape[:2]
+    return {
+        0: np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]]),
+        90: np.array([[0, -1, height], [1, 0, 0], [0, 0, 1]]),
+        180: np.array([[-1, 0, width], [0, -1, height], [0, 0, 1]]),
+        270: np.array([[0, 1, 0], [-1, 0, width], [0, 0, 1]]),
+    }[rotation % 360].astype(np.float64)
+
+
+def translation_matrix(vector) -> np.ndarray:
+    """Affine matrix that moves pixel coordinates (x, y) by a vector."""
+    matrix = np.eye(3)
+    matrix[:2, 2] = vector[:2]
+    return matrix
+
+
+def grayscale_uint8(img_data: np.ndarray) -> np.ndarray:
+    """8 bit grayscale version of an image, as needed for Otsu's threshold."""
+    if img_data.ndim == 3:
+        if img_data.shape[2] == 4:
+            img_data = img_data[..., :3]
+        img_data = cv2.cvtColor(np.ascontiguousarray(img_data), cv2.COLOR_RGB2GRAY)
+    if img_data.dtype != np.uint8:
+        img_data = cv2.normalize(img_data, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    return img_data
+
+
+def detect_particles(
+    img_data: np.ndarray,
+    roi=None,
+    threshold=None,
+    dark=None,
+    min_area=20,
+    shape="ellipse",
+    epsilon=1.0,
+    exclude_border=True,
+) -> list[tuple[str, dict]]:
+    """Find particles by thresholding the image and fit an ellipse or a
+    polygon to the outer contour of each particle.
+
+    Args:
+        img_data (np.ndarray): the image
+        roi (tuple, optional): only search in (x, y, width, height). Defaults to None.
+        threshold (int, optional): gray value that separates particles from the
+            background. Otsu's threshold is used if None. Defaults to None.
+        dark (bool, optional): the particles are darker than the background. If None,
+            the particles are the pixels on the side of the threshold that covers
+            less of the image. Defaults to None.
+        min_area (int, optional): smaller particles in pixels are ignored. Defaults to 20.
+        shape (str, optional): "ellipse" or "polygon". Defaults to "ellipse".
+        epsilon (float, optional): maximum distance of the polygon to the contour. Defaults to 1.0.
+        exclude_border (bool, optional): ignore particles that touch the border
+            of the image or the roi. Defaults to True.
+
+    Returns:
+        list[tuple[str, dict]]: class name and state (in pixel coordinates)
+            of every particle, like the structures of a storage file
+    """
+    gray = grayscale_uint8(img_data)
+    x_0, y_0 = 0, 0
+    if roi is not None:
+        x_0, y_0, width, height = (int(round(v)) for v in roi)
+        # the far edges stay where they are when the roi starts outside the image
+        x_1, y_1 = x_0 + width, y_0 + height
+        x_0, y_0 = max(x_0, 0), max(y_0, 0)
+        gray = gray[y_0 : max(y_1, y_0), x_0 : max(x_1, x_0)]
+    if gray.size == 0:
+        return list()
+
+    mode = cv2.THRESH_BINARY_INV if dark else cv2.THRESH_BINARY
+    if threshold is None:
+        _, mask = cv2.threshold(gray, 0, 255, mode | cv2.THRESH_OTSU)
+    else:
+        _, mask = cv2.threshold(gray, threshold, 255, mode)
+    if dark is None and np.count_nonzero(mask) > mask.size // 2:
+        mask = cv2.bitwise_not(mask)
+    # remove single noisy pixels
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    particles = list()
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        if exclude_border and (
+            x == 0 or y == 0 or x + w == mask.shape[1] or y + h == mask.shape[0]
+        ):
+            continue
+
+        if shape == "ellipse":
+            if len(contour) < 5:
+                continue
+            (c_x, c_y), (d_1, d_2), angle = cv2.fitEllipse(contour)
+            # the angle of the objects turns in the other direction
+            particles.append(("EditEllipseVisual", dict(
+                center=np.array([c_x + x_0, c_y + y_0]),
+                radius=np.array([0.5 * d_1, 0.5 * d_2]),
+                angle=(-np.deg2rad(angle)) % (2 * np.pi),
+            )))
+        elif shape == "polygon":
+            polygon = cv2.approxPolyDP(contour, epsilon, True)[:, 0, :]
+            if len(polygon) < 3:
+                continue
+            particles.append(("EditPolygonVisual", dict(
+                coords=polygon.astype(np.float64) + (x_0, y_0), num_points=0,
+            )))
+        else:
+            raise ValueError(f"unknown shape: {shape}")
+    return particles
+
+
+def rectangle_properties(center, width, height, angle) -> dict:
+    """Properties of a rectangle, the angle is given in radians."""
+    return dict(
+        center=(center, "px"),
+        width=(width, "px"),
+        height=(height, "px"),
+        area=(height * width, "px²"),
+        angle=(np.rad2deg(angle), "°"),
+    )
+
+
+def ellipse_properties(center, radius, angle) -> dict:
+    """Properties of an ellipse, the angle is given in radians."""
+    if radius[0] == radius[1]:
+        radius_value = radius[0]
+    else:
+        radius_value = radius
+    return dict(
+        center=(center, "px"),
+        radius=(radius_value, "px"),
+        area=(np.prod(radius) * np.pi, "px²"),
+        angle=(np.rad2deg(angle), "°"),
+    )
+
+
+def line_angles(coords) -> np.ndarray:
+    """Angles of the segments of a line, the first one is measured
+    from the first point and all others from their end point."""
+    diff = np.diff(coords, axis=0)
+    if len(diff) > 0:
+        diff[0] *= -1
+        return np.rad2deg(np.arctan2(-diff[:, 1], diff[:, 0]))
+    return [0]
+
+
+def line_length(coords):
+    """Lengths of the segments of a line or a single value for one segment."""
+    length = np.abs(np.linalg.norm(np.diff(coords, axis=0), axis=1))
+    if len(length) == 1:
+        return length[0]
+    return length
+
+
+def line_properties(coords) -> dict:
+    """Properties of a line or a polygon given by its points."""
+    coords = np.asarray(coords)
+    if len(coords) < 2:
+        return dict()
+    if len(coords) == 2:
+        angle = line_angles(coords)
+    else:
+        angle = np.abs(np.diff(line_angles(coords)))
+        for i, a in enumerate(angle):
+            if a > 180:
+                angle[i] = 360 - a
+
+    return dict(length=[line_length(coords), "px"], angle=[angle[0], "°"])
+
+
+def object_properties(obj_type: str, state: dict) -> dict:
+    """Properties of a stored object without creating its visual.
+
+    Args:
+        obj_type (str): class name of the object
+        state (dict): the state returned by the save() method of the object
+    """
+    match obj_type:
+        case "EditRectVisual":
+            return rectangle_properties(
+                np.asarray(state["center"]), state["width"], state["height"], state.get("angle", 0)
+            )
+        case "EditEllipseVisual":
+            return ellipse_properties(
+                np.asarray(state["center"]), np.asarray(state["radius"]), state.get("angle", 0)
+            )
+        case "EditLineVisual" | "EditPolygonVisual":
+            return line_properties(state["coords"])
+    raise ValueError(f"unknown object type: {obj_type}")
+
+
+def scale_property(prop, value, unit, scaling_factor=None, length_unit=None):
+    """Convert a property from pixels into the length unit of the scaling.
+
+    Returns:
+        tuple: the scaled value and its unit
+    """
+    if scaling_factor is None or prop not in SCALED_PROPERTIES:
+        return value, unit
+
+    exponent_string = ""
+    exponent = 1
+    if unit[-1] == "²":
+        exponent = 2
+        exponent_string = unit[-1]
+    if unit[-1] == "³":
+        exponent = 3
+        exponent_string = unit[-1]
+
+    return value * scaling_factor**exponent, length_unit + exponent_string
+
+
+def calculate_results(
+    structure_properties: dict, scaling_factor=None, length_unit=None, point_counts=None
+) -> dict:
+    """calculate the average and standard error of the
+    measurements for each structure
+
+    Args:
+        structure_properties (dict): {structure_name: [properties of each object]}
+        scaling_factor (float, optional): length per pixel. Defaults to None.
+        length_unit (str, optional): unit of the scaling. Defaults to None.
+        point_counts (dict, optional): {structure_name: [number of points of each line]}
+            for structures of lines. Defaults to None.
+
+    Returns:
+        dict: {structure_name: {property: (mean, standard error, unit)}}
+    """
+    if point_counts is None:
+        point_counts = dict()
+
+    results = dict()
+    for structure_name, properties in structure_properties.items():
+        results[structure_name] = dict()
+
+        # lines can only be averaged if they have the same number of points
+        if structure_name in point_counts:
+            num_points = point_counts[structure_name]
+            # check if all are the same
+            if not all(n == num_points[0] for n in num_points):
+                results[structure_name]["lines have different number of points: "] = (np.mean(num_points), np.std(num_points), "")
+                continue
+
+        for prop, value in properties[0].items():
+            data = [props[prop][0] for props in properties]
+            unit = value[1]
+            if scaling_factor is not None and prop in SCALED_PROPERTIES:
+                data = [scale_property(prop, d, unit, scaling_factor, length_unit)[0] for d in data]
+                unit = scale_property(prop, 1, unit, scaling_factor, length_unit)[1]
+
+            if len(data) == 1:
+                results[structure_name][prop] = (np.mean(data, axis=0), None, unit)
+            else:
+                results[structure_name][prop] = (
+                    np.mean(data, axis=0),
+                    np.std(data, axis=0) / np.sqrt(len(properties)),
+                    unit,
+                )
+    return results
+
+
+def sample_lines(starts, ends, n) -> np.ndarray:
+    """Evenly spaced points on several lines.
+
+    Args:
+        starts (np.ndarray): start points of the lines with shape (lines, 2)
+        ends (np.ndarray): end points of the lines with shape (lines, 2)
+        n (int): number of points per line
+
+    Returns:
+        np.ndarray: points (x, y) with shape (lines, n, 2)
+    """
+    starts = np.asarray(starts, dtype=np.float64)[:, np.newaxis, :]
+    ends = np.asarray(ends, dtype=np.float64)[:, np.newaxis, :]
+    steps = np.linspace(0, 1, n)[np.newaxis, :, np.newaxis]
+    return starts + (ends - starts) * steps
+
+
+def interpolation_weights(coordinates, size, order):
+    """Indices and weights of the pixels that contribute to a spline of
+    order 0 or 1 at coordinates that lie inside of [0, size - 1]."""
+    if order == 0:
+        index = np.floor(coordinates + 0.5).astype(np.intp)
+        return (index,), (np.ones(len(index)),)
+    index = np.minimum(np.floor(coordinates).astype(np.intp), size - 2)
+    fraction = coordinates - index
+    return (index, index + 1), (1 - fraction, fraction)
+
+
+def axis_aligned_profile(gray: np.ndarray, grid: np.ndarray, order: int, tol=1e-6):
+    """Sum of the interpolated values of all lines of an axis aligned grid.
+
+    As linear interpolation is separable, the lines are summed up with
+    one weighted sum over the image rows (or columns) of the box and
+    then interpolated along the lines.
+
+    Returns:
+        np.ndarray | None: the summed profile or None if the grid is not
+            axis aligned or leaves the image
+    """
+    if order > 1 or min(gray.shape) < 2:
+        return None
+    x, y = grid[..., 0], grid[..., 1]
+    if np.ptp(y, axis=1).max() < tol and np.ptp(x, axis=0).max() < tol:
+        # horizontal lines stacked in y
+        across, along, image = y[:, 0], x[0], gray
+    elif np.ptp(x, axis=1).max() < tol and np.ptp(y, axis=0).max() < tol:
+        # vertical lines stacked in x
+        across, along, image = x[:, 0], y[0], gray.T
+    else:
+        return None
+    if (
+        min(across.min(), along.min()) < 0
+        or across.max() > image.shape[0] - 1
+        or along.max() > image.shape[1] - 1
+    ):
+        return None
+
+    # weight of every image row summed over all lines
+    indices, weights = interpolation_weights(across, image.shape[0], order)
+    row_weights = sum(
+        np.bincount(i, weights=w, minlength=image.shape[0]) for i, w in zip(indices, weights)
+    )
+    rows = np.nonzero(row_weights)[0]
+    indices, weights = interpolation_weights(along, image.shape[1], order)
+    cols = slice(min(i.min() for i in indices), max(i.max() for i in indices) + 1)
+
+    profile = row_weights[rows] @ image[rows, cols]
+    return sum(w * profile[i - cols.start] for i, w in zip(indices, weights))
+
+
+def summed_profile(image, grid: np.ndarray, order=3) -> np.ndarray:
+    """Interpolate the grayscale image on a grid of lines and sum up the lines.
+
+    Args:
+        image (ImageCache | np.ndarray): the image
+        grid (np.ndarray): points (x, y) with shape (lines, n, 2), see sample_lines
+        order (int, optional): order of the spline interpolation. Defaults to 3.
+
+    Returns:
+        np.ndarray: the summed intensity along the lines
+    """
+    if not isinstance(image, ImageCache):
+        image = ImageCache(image)
+    profile = axis_aligned_profile(image.gray, grid, order)
+    if profile is not None:
+        return profile
+    # map_coordinates expects (row, column) coordinates
+    coordinates = grid[..., ::-1].reshape(-1, 2).T
+    values = image.map_coordinates(coordinates, order=order)
+    return values.reshape(grid.shape[:2]).sum(axis=0)
+
+
+class ImageCache:
+    """Data derived from an image that is needed by the intensity profiles.
+
+    The grayscale image and its spline coefficients are computed when
+    they are first used and kept until a new image is set.
+    """
+
+    def __init__(self, img_data: np.ndarray | None = None):
+        self.set_image(img_data)
+
+    def set_image(self, img_data: np.ndarray | None):
+        self.img_data = img_data
+        self.clear()
+
+    def clear(self):
+        self._gray = None
+        self._coefficients = dict()
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Sum of all color channels of the image."""
+        if self._gray is None:
+            self._gray = np.sum(self.img_data, axis=2, dtype=np.float64)
+        return self._gray
+
+    def spline_coefficients(self, order: int) -> np.ndarray:
+        """Spline prefiltered grayscale image, for orders below 2 this is the image itself."""
+        if order <= 1:
+            return self.gray
+        if order not in self._coefficients:
+            # scipy.ndimage is slow to import and only needed for intensity profiles
+            from scipy.ndimage import spline_filter
+
+            self._coefficients[order] = spline_filter(
+                self.gray, order, output=np.float64, mode="constant"
+            )
+        return self._coefficients[order]
+
+    def map_coordinates(self, coordinates, order=3) -> np.ndarray:
+        """Interpolate the grayscale image at the (row, column) coordinates,
+        the same as scipy.ndimage.map_coordinates with mode="constant"."""
+        from scipy.ndimage import map_coordinates
+
+        return map_coordinates(
+            self.spline_coefficients(order),
+            coordinates,
+            order=order,
+            mode="constant",
+            prefilter=False,
+        )
@@ -0,0 +1,231 @@
+"""
+Find the microscope and the pixel size in the metadata of an image
+
+Detectors look at the TIFF tags and the XML footer of an image and
+return the instrument and the pixel size they found. The detectors of
+DETECTORS are tried in order, the first instrument and the first pixel
+size that are found are used. More detectors are added with
+`register_detector`.
+"""
+
+# absolute imports
+import re
+from typing import Callable, NamedTuple
+
+# relative imports
+from .image_io import read_tiff_tags
+from .data.microscopes import get_last_line, parse_xml
+
+# length of the units in meters
+LENGTH_UNITS = dict(
+    fm=1e-15,
+    pm=1e-12,
+    Å=1e-10,
+    nm=1e-9,
+    µm=1e-6,
+    mm=1e-3,
+    cm=1e-2,
+    m=1,
+    km=1e3,
+)
+# other spellings of the units, the keyword µm above is normalized
+# to the greek letter mu (U+03BC) by Python
+UNIT_ALIASES = {
+    "um": "\u03bcm",
+    "\u00b5m": "\u03bcm",
+    "micron": "\u03bcm",
+    "microns": "\u03bcm",
+    "A": "Å",
+}
+
+# profile of microscopes without their own profile
+GENERIC_PROFILE = "Generic_Microscope"
+
+# TIFF tags
+IMAGE_DESCRIPTION = 270
+X_RESOLUTION = 282
+FEI_SFEG = 34680
+FEI_HELIOS = 34682
+CZ_SEM = 34118
+
+
+class Detection(NamedTuple):
+    """What a detector found in the metadata of an image."""
+
+    instrument: str | None = None
+    # length of a pixel in meters
+    pixel_size: float | None = None
+
+
+class ImageMetadata(NamedTuple):
+    instrument: str | None = None
+    pixel_size: float | None = None
+    # name of the detector that found the pixel size
+    source: str | None = None
+    tags: dict | None = None
+
+
+def unit_length(unit) -> float | None:
+    """Length of a unit in meters, None for unknown units."""
+    return LENGTH_UNITS.get(UNIT_ALIASES.get(unit, unit))
+
+
+def length_in_meters(value, unit) -> float | None:
+    if unit_length(unit) is None:
+        return None
+    return float(value) * unit_length(unit)
+
+
+def detect_fei(byte_stream, tags) -> Detection | None:
+    """FEI and Thermo Fisher microscopes store an INI text in their own tag,
+    the pixel size is given in meters."""
+    text = tags.get(FEI_HELIOS) or tags.get(FEI_SFEG)
+    if not isinstance(text, str):
+        return None
+    pixel_width = re.search(r"^PixelWidth=([-+\d.eE]+)", text, re.MULTILINE)
+    system = re.search(r"^SystemType=(.+?)\s*$", text, re.MULTILINE)
+    return Detection(
+        instrument=system.group(1) if system else "FEI",
+        pixel_size=float(pixel_width.group(1)) if pixel_width else None,
+    )
+
+
+def detect_zeiss_sem(byte_stream, tags) -> Detection | None:
+    """Zeiss SEMs store lines like 'Image Pixel Size = 2.4 nm' in their own tag."""
+    text = tags.get(CZ_SEM)
+    if isinstance(text, bytes):
+        text = text.decode("latin-1")
+    if not isinstance(text, str):
+        return None
+    pixel_size = re.search(r"Image Pixel Size = ([-+\d.eE]+)\s*(\S+)", text)
+    return Detection(
+        instrument="Zeiss SEM",
+        pixel_size=length_in_meters(*pixel_size.groups()) if pixel_size else None,
+    )
+
+
+def detect_imagej(byte_stream, tags) -> Detection | None:
+    """ImageJ stores the unit in the image description and the number
+    of pixels per unit as the resolution."""
+    description = tags.get(IMAGE_DESCRIPTION)
+    if not isinstance(description, str) or not description.startswith("ImageJ="):
+        return None
+    unit = re.search(r"^unit=(.+?)\s*$", description, re.MULTILINE)
+    resolution = tags.get(X_RESOLUTION)
+    if unit is None or not resolution or not resolution[0]:
+        return None
+    return Detection(pixel_size=length_in_meters(1 / resolution[0], unit.group(1)))
+
+
+def find_pixel_size(values) -> float | None:
+    """Search the parsed XML for a pixel size given as text like '1.5 nm'."""
+    if isinstance(values, list):
+        values = dict(enumerate(values))
+    if not isinstance(values, dict):
+        return None
+    for key, value in values.items():
+        if isinstance(value, str) and re.fullmatch(r"pixel_?(size|width)", str(key), re.IGNORECASE):
+            match = re.fullmatch(r"\s*([-+\d.eE]+)\s*(\S+)\s*", value)
+            if match is not None and length_in_meters(*match.groups()) is not None:
+                return length_in_meters(*match.groups())
+        pixel_size = find_pixel_size(value)
+        if pixel_size is not None:
+            return pixel_size
+    return None
+
+
+def detect_xml_footer(byte_stream, tags) -> Detection | None:
+    """Zeiss Orion NanoFab images end with a line of XML."""
+    footer = get_last_line(byte_stream)
+    if not footer.startswith("<"):
+        return None
+    try:
+        values = parse_xml(footer)
+    except Exception:
+        return None
+    return Detection(instrument="Zeiss Orion NanoFab", pixel_size=find_pixel_size(values))
+
+
+DETECTORS: list[Callable] = [detect_fei, detect_zeiss_sem, detect_imagej, detect_xml_footer]
+
+
+def register_detector(detector, first=False):
+    """Add a detector, a function (byte_stream, tags) -> Detection | None.
+
+    Args:
+        detector (Callable): the detector
+        first (bool, optional): try it before the others. Defaults to False.
+    """
+    if first:
+        DETECTORS.insert(0, detector)
+    else:
+        DETECTORS.append(detector)
+
+
+def read_metadata(byte_stream) -> ImageMetadata:
+    """Run the detectors on the content of an image file.
+
+    Args:
+        byte_stream (bytes | mmap): content of the image file
+
+    Returns:
+        ImageMetadata: instrument and pixel size, None if they were not found
+    """
+    if byte_stream is None:
+        return ImageMetadata()
+    try:
+        tags = read_tiff_tags(byte_stream) or dict()
+    except Exception:
+        tags = dict()
+
+    instrument = pixel_size = source = None
+    for detector in DETECTORS:
+        detection = detector(byte_stream, tags)
+        if detection is None:
+            continue
+        if instrument is None:
+            instrument = detection.instrument
+        if pixel_size is None and detection.pixel_size:
+            pixel_size, source = detection.pixel_size, detector.__name__
+        if instrument is not None and pixel_size is not None:
+            break
+    return ImageMetadata(instrument, pixel_size, source, tags)
+
+
+def normalize(name) -> str:
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+
+def match_microscope(instrument, names) -> str | None:
+    """The microscope profile of an instrument. A profile matches when its
+    name without the vendor (like 'Orion_Nanofab' of 'Zeiss_Orion_Nanofab')
+    is part of the instrument name, the longest match is used. The generic
+    profile matches every microscope, so it is never matched.
+
+    Args:
+        instrument (str | None): instrument found in the metadata
+        names (Iterable[str]): names of the microscope profiles
+
+    Returns:
+        str | None: name of the matching profile
+    """
+    if not instrument:
+        return None
+    instrument = normalize(instrument)
+    best, best_length = None, 0
+    for name in names:
+        if name == GENERIC_PROFILE:
+            continue
+        model = normalize(name.partition("_")[2])
+        if model and model in instrument and len(model) > best_length:
+            best, best_length = name, len(model)
+    return best
+
+
+def pixel_size_in_unit(pixel_size, units=LENGTH_UNITS) -> tuple[float, str]:
+    """Express a pixel size in meters in the largest unit it is at least one of."""
+    unit = min(units, key=units.get)
+    for name, length in units.items():
+        if units[unit] < length <= pixel_size:
+            unit = name
+    return pixel_size / units[unit], unit
@@ -0,0 +1,261 @@
+# absolute imports
+from collections import defaultdict
+from itertools import count
+import numpy as np
+
+
+class ObjectStore:
+    """Registry of all measured objects.
+
+    The objects are kept in lists per structure, like
+
+        {
+          'structure 1': [measured_line, measured_line, ...],
+          'structure 2': [measured_circle, measured_circle, ...],
+          ...
+        }
+
+    Every object gets a unique id that maps to its structure and index.
+    The bounds of the objects are kept in a uniform grid, so that objects
+    at a point or inside a rectangle are found without looking at all
+    objects. Objects report changes of their geometry through
+    `on_geometry_change` and are reindexed before the next query.
+
+    Observers (like the ResultsTable) are told about added, changed and
+    removed objects, renamed structures and when the store is cleared.
+
+    `transform_all` moves or rotates all objects at once. It needs the
+    objects to give their points with `anchor_points` and to take the
+    transformed ones with `set_anchor_points`.
+    """
+
+    def __init__(self, cell_size=128, max_cells=256):
+        self.cell_size = cell_size
+        # objects covering more cells are not put into the grid
+        self.max_cells = max_cells
+        self._uids = count(1)
+        self._versions = count(1)
+        self.observers = list()
+        self.clear()
+
+    def clear(self):
+        """Forget all objects, the structure lists are left untouched."""
+        self.structures = dict()
+        self.objects = dict()  # uid -> object
+        self.locations = dict()  # uid -> (structure, index)
+        self.cells = defaultdict(set)  # (cell x, cell y) -> uids
+        self.object_cells = dict()  # uid -> cells of the object
+        self.object_bounds = dict()  # uid -> (min, max)
+        self.large = set()  # uids of objects that are too large for the grid
+        self.types = defaultdict(set)  # object type -> uids
+        self.dirty = set()
+        # changes whenever objects are added to or removed from a structure
+        self.versions = dict()  # structure -> version
+        self.notify("cleared")
+
+    def notify(self, event, *args):
+        for observer in self.observers:
+            getattr(observer, event)(*args)
+
+    def rebuild(self, structures: dict):
+        """Use a new dictionary of structure lists and index all its objects."""
+        self.clear()
+        self.structures = structures
+        for structure, objects in structures.items():
+            self.versions[structure] = next(self._versions)
+            for index, obj in enumerate(objects):
+                self.register(obj, structure, index)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects.values())
+
+    def register(self, obj, structure, index):
+        if obj.uid is None:
+            obj.uid = next(self._uids)
+        self.objects[obj.uid] = obj
+        self.locations[obj.uid] = (structure, index)
+        self.types[type(obj)].add(obj.uid)
+        obj.on_geometry_change = self.mark_dirty
+        self.index_bounds(obj)
+        self.notify("object_added", obj, structure)
+
+    def add(self, obj, structure, index=None) -> int:
+        """Add an object to a structure.
+
+        Args:
+            obj (EditVisual): the object
+            structure (str): name of the structure
+            index (int, optional): position in the structure, appended if None
+
+        Returns:
+            int: the index of the object
+        """
+        objects = self.structures.setdefault(structure, list())
+        if index is None or index >= len(objects):
+            index = len(objects)
+            objects.append(obj)
+        else:
+            objects.insert(index, obj)
+            self.reindex(structure, start=index + 1)
+        self.versions[structure] = next(self._versions)
+        self.register(obj, structure, index)
+        return index
+
+    def remove(self, obj) -> tuple[str, int]:
+        """Remove an object or the object of control points,
+        empty structures are removed as well.
+
+        Returns:
+            tuple[str, int]: structure and index the object had
+        """
+        structure, index = self.locate(obj)
+        obj = self.structures[structure].pop(index)
+        self.reindex(structure, start=index)
+        self.versions[structure] = next(self._versions)
+        if not self.structures[structure]:
+            del self.structures[structure]
+            del self.versions[structure]
+
+        del self.objects[obj.uid]
+        del self.locations[obj.uid]
+        self.types[type(obj)].discard(obj.uid)
+        self.unindex_bounds(obj.uid)
+        self.dirty.discard(obj.uid)
+        obj.on_geometry_change = None
+        self.notify("object_removed", obj, structure)
+        return structure, index
+
+    def reindex(self, structure, start=0):
+        for index, obj in enumerate(self.structures[structure][start:], start):
+            self.locations[obj.uid] = (structure, index)
+
+    def rename(self, structure, new_structure):
+        self.structures[new_structure] = self.structures.pop(structure)
+        del self.versions[structure]
+        self.versions[new_structure] = next(self._versions)
+        self.reindex(new_structure)
+        self.notify("structure_renamed", structure, new_structure)
+
+    def transform_all(self, matrix):
+        """Apply an affine transform, a rotation and a translation, to all
+        objects. The points of all objects are transformed at once, the
+        objects do not update their visuals (see EditVisual.update_visuals).
+
+        Args:
+            matrix (np.ndarray): 3x3 matrix for homogeneous column vectors (x, y, 1)
+        """
+        objects = list(self.objects.values())
+        if not objects:
+            return
+        points = [np.reshape(obj.anchor_points(), (-1, 2)) for obj in objects]
+        counts = np.array([len(p) for p in points])
+        matrix = np.asarray(matrix, dtype=np.float64)
+        transformed = np.concatenate(points) @ matrix[:2, :2].T + matrix[:2, 2]
+        angle = np.arctan2(matrix[1, 0], matrix[0, 0])
+        for obj, new_points in zip(objects, np.split(transformed, np.cumsum(counts)[:-1])):
+            obj.set_anchor_points(new_points, angle)
+        self.dirty.update(obj.uid for obj in objects)
+        for obj in objects:
+            self.notify("object_changed", obj)
+
+    def locate(self, obj) -> tuple[str, int]:
+        """Return structure and index of an object or of the object of control points."""
+        uid = getattr(obj, "uid", None)
+        if uid is None and getattr(obj, "parent", None) is not None:
+            uid = getattr(obj.parent, "uid", None)
+        if uid not in self.locations:
+            raise LookupError("Object could not be found in drawing_data")
+        return self.locations[uid]
+
+    def __contains__(self, obj):
+        return getattr(obj, "uid", None) in self.objects
+
+    def objects_of_type(self, obj_type) -> list:
+        """All objects of a type, the other objects are not looked at."""
+        return [self.objects[uid] for uid in self.types.get(obj_type, ())]
+
+    # spatial index
+
+    def mark_dirty(self, obj):
+        self.dirty.add(obj.uid)
+        self.notify("object_changed", obj)
+
+    def refresh(self):
+        """Reindex the bounds of all objects that changed since the last query."""
+        for uid in self.dirty:
+            if uid in self.objects:
+                self.unindex_bounds(uid)
+                self.index_bounds(self.objects[uid])
+        self.dirty.clear()
+
+    def cell_range(self, lower, upper):
+        first = np.floor(np.asarray(lower) / self.cell_size).astype(int)
+        last = np.floor(np.asarray(upper) / self.cell_size).astype(int)
+        return first, last
+
+    def index_bounds(self, obj):
+        bounds = obj.extent()
+        if bounds is None:
+            # objects without points are always checked
+            self.large.add(obj.uid)
+            return
+        self.object_bounds[obj.uid] = bounds
+        first, last = self.cell_range(*bounds)
+        if np.prod(last - first + 1) > self.max_cells:
+            self.large.add(obj.uid)
+            return
+        cells = [
+            (x, y)
+            for x in range(first[0], last[0] + 1)
+            for y in range(first[1], last[1] + 1)
+        ]
+        for cell in cells:
+            self.cells[cell].add(obj.uid)
+        self.object_cells[obj.uid] = cells
+
+    def unindex_bounds(self, uid):
+        for cell in self.object_cells.pop(uid, ()):
+            self.cells[cell].discard(uid)
+            if not self.cells[cell]:
+                del self.cells[cell]
+        self.object_bounds.pop(uid, None)
+        self.large.discard(uid)
+
+    def query(self, lower, upper) -> list:
+        """Return the objects whose bounds intersect a rectangle, ordered
+        from the last to the first created one (top to bottom).
+
+        Args:
+            lower (array_like): lower corner (x, y) of the rectangle
+            upper (array_like): upper corner (x, y) of the rectangle
+        """
+        self.refresh()
+        lower, upper = np.minimum(lower, upper), np.maximum(lower, upper)
+        first, last = self.cell_range(lower, upper)
+        candidates = set(self.large)
+        if np.prod(last - first + 1) > len(self.cells):
+            for (x, y), uids in self.cells.items():
+                if first[0] <= x <= last[0] and first[1] <= y <= last[1]:
+                    candidates |= uids
+        else:
+            for x in range(first[0], last[0] + 1):
+                for y in range(first[1], last[1] + 1):
+                    candidates |= self.cells.get((x, y), set())
+
+        found = list()
+        for uid in sorted(candidates, reverse=True):
+            bounds = self.object_bounds.get(uid)
+            if bounds is None or (
+                np.all(bounds[0] <= upper) and np.all(bounds[1] >= lower)
+            ):
+                found.append(self.objects[uid])
+        return found
+
+    def hit_test(self, pos, tolerance=0.0) -> list:
+        """Return the objects whose bounds are closer to a point than the
+        tolerance, ordered from top to bottom."""
+        pos = np.asarray(pos, dtype=np.float64)[:2]
+        return self.query(pos - tolerance, pos + tolerance)
@@ -0,0 +1,33 @@
+# absolute imports
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+# relative imports
+from . import measurements
+
+
+class ParticleDetectionSignals(QObject):
+    """Signals of the ParticleDetectionWorker. They carry the generation
+    of the request so that results of outdated requests can be dropped."""
+
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+
+class ParticleDetectionWorker(QRunnable):
+    """Detects particles (see measurements.detect_particles) on a thread
+    of a QThreadPool."""
+
+    def __init__(self, img_data, generation: int, **kwargs):
+        super().__init__()
+        self.img_data = img_data
+        self.generation = generation
+        self.kwargs = kwargs
+        self.signals = ParticleDetectionSignals()
+
+    def run(self):
+        try:
+            particles = measurements.detect_particles(self.img_data, **self.kwargs)
+        except Exception as error:
+            self.signals.failed.emit(self.generation, str(error))
+        else:
+            self.signals.finished.emit(self.generation, particles)
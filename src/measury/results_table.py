@@ -0,0 +1,211 @@
+# absolute imports
+import numpy as np
+
+# relative imports
+from . import measurements
+
+
+class RunningStats:
+    """Running mean and variance of values (or arrays of values)
+    after Welford, values can be added and removed again."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (value - self.mean)
+
+    def remove(self, value):
+        if self.count <= 1:
+            self.__init__()
+            return
+        mean = (self.count * self.mean - value) / (self.count - 1)
+        self.m2 = np.maximum(self.m2 - (value - self.mean) * (value - mean), 0)
+        self.mean = mean
+        self.count -= 1
+
+    @property
+    def std(self):
+        """Standard deviation of the values (like np.std)."""
+        return np.sqrt(self.m2 / self.count)
+
+
+class PropertyTable:
+    """Properties of objects with one array per property and running
+    statistics of every property. Rows are removed by moving the last
+    row into their place."""
+
+    def __init__(self):
+        self.rows = dict()  # uid -> row
+        self.uids = list()
+        self.columns = dict()  # property -> array with one row per object
+        self.units = dict()
+        self.stats = dict()
+
+    def __len__(self):
+        return len(self.uids)
+
+    def add(self, uid, properties: dict):
+        """Add a row, the table is not changed if a value does not fit."""
+        row = len(self.uids)
+        # all values are converted before the first column is written
+        new_columns = dict()
+        for prop, (value, unit) in properties.items():
+            value = np.asarray(value, dtype=np.float64)
+            column = self.columns.get(prop)
+            if column is None:
+                column = np.empty((8,) + value.shape)
+            else:
+                column, value = self.match_shape(prop, column, value)
+            new_columns[prop] = (column, value, unit)
+
+        for prop, (column, value, unit) in new_columns.items():
+            if prop not in self.columns:
+                self.units[prop] = unit
+                self.stats[prop] = RunningStats()
+            elif row == len(column):
+                column = np.concatenate((column, np.empty_like(column)))
+            column[row] = value
+            self.columns[prop] = column
+            self.stats[prop].add(value)
+        self.rows[uid] = row
+        self.uids.append(uid)
+
+    @staticmethod
+    def match_shape(prop, column, value):
+        """A scalar is used for every component of a vector property, like
+        the one radius of a circle for both radii of an ellipse.
+
+        Returns:
+            tuple: the column and the value with the same shape
+        """
+        shape = column.shape[1:]
+        if value.shape == shape:
+            return column, value
+        if value.ndim == 0:
+            return column, np.broadcast_to(value, shape)
+        if not shape:
+            widened = np.broadcast_to(column.reshape(column.shape + (1,) * value.ndim), column.shape + value.shape)
+            return widened.copy(), value
+        raise ValueError(f"{prop} can not be shown with the shape {value.shape} and {shape}")
+
+    def remove(self, uid):
+        row = self.rows.pop(uid)
+        last = len(self.uids) - 1
+        for prop, column in self.columns.items():
+            self.stats[prop].remove(column[row])
+            column[row] = column[last]
+        self.uids[row] = self.uids[last]
+        self.uids.pop()
+        if row != last:
+            self.rows[self.uids[row]] = row
+
+    def column(self, prop) -> np.ndarray:
+        return self.columns[prop][: len(self.uids)]
+
+
+class ResultsTable:
+    """Measurements of all objects, kept up to date by the ObjectStore.
+
+    The properties of every structure are kept in a PropertyTable per
+    number of points (lines can only be averaged with the same number
+    of points). Objects that were added or changed are measured again
+    on the next `refresh`, so the results are updated with the changed
+    objects only.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.structures = dict()  # structure -> {number of points: PropertyTable}
+        self.entries = dict()  # uid -> (structure, number of points)
+        self.pending = dict()  # uid -> (object, structure)
+
+    # called by the ObjectStore
+
+    def object_added(self, obj, structure):
+        self.pending[obj.uid] = (obj, structure)
+
+    def object_changed(self, obj):
+        if obj.uid in self.entries and obj.uid not in self.pending:
+            self.pending[obj.uid] = (obj, self.entries[obj.uid][0])
+
+    def object_removed(self, obj, structure):
+        self.pending.pop(obj.uid, None)
+        self.drop(obj.uid)
+
+    def structure_renamed(self, structure, new_structure):
+        if structure in self.structures:
+            self.structures[new_structure] = self.structures.pop(structure)
+        for uid, (name, num_points) in self.entries.items():
+            if name == structure:
+                self.entries[uid] = (new_structure, num_points)
+        for uid, (obj, name) in self.pending.items():
+            if name == structure:
+                self.pending[uid] = (obj, new_structure)
+
+    def cleared(self):
+        self.clear()
+
+    # results
+
+    def drop(self, uid):
+        if uid not in self.entries:
+            return
+        structure, num_points = self.entries.pop(uid)
+        tables = self.structures[structure]
+        tables[num_points].remove(uid)
+        if not len(tables[num_points]):
+            del tables[num_points]
+        if not tables:
+            del self.structures[structure]
+
+    def refresh(self):
+        """Measure all objects that were added or changed."""
+        for uid, (obj, structure) in self.pending.items():
+            self.drop(uid)
+            coords = getattr(obj, "coords", None)
+            num_points = None if coords is None else len(coords)
+            tables = self.structures.setdefault(structure, dict())
+            tables.setdefault(num_points, PropertyTable()).add(uid, obj.output_properties())
+            self.entries[uid] = (structure, num_points)
+        self.pending.clear()
+
+    def results(self, scaling_factor=None, length_unit=None) -> dict:
+        """Average and standard error of the properties of each structure,
+        see measurements.calculate_results.
+
+        Returns:
+            dict: {structure_name: {property: (mean, standard error, unit)}}
+        """
+        self.refresh()
+        results = dict()
+        for structure_name, tables in self.structures.items():
+            results[structure_name] = dict()
+            # lines can only be averaged if they have the same number of points
+            if len(tables) > 1:
+                num_points = np.repeat(list(tables), [len(table) for table in tables.values()])
+                results[structure_name]["lines have different number of points: "] = (
+                    np.mean(num_points), np.std(num_points), ""
+                )
+                continue
+
+            table = next(iter(tables.values()))
+            for prop, stats in table.stats.items():
+                mean, unit = measurements.scale_property(
+                    prop, stats.mean, table.units[prop], scaling_factor, length_unit
+                )
+                if stats.count == 1:
+                    results[structure_name][prop] = (mean, None, unit)
+                else:
+                    std, _ = measurements.scale_property(
+                        prop, stats.std, table.units[prop], scaling_factor, length_unit
+                    )
+                    results[structure_name][prop] = (mean, std / np.sqrt(stats.count), unit)
+        return results
@@ -130,7 +130,14 @@ class RightUI(QWidget):
         self.vispy_intensity_plot.intensity_line.set_data([[0, 0], [0, 0]])
         self.vispy_intensity_plot.diagram.camera.set_range(x=(0, 1), y=(0, 1))
 
-    def update_intensity_plot(self, resize=True):
+    def update_intensity_plot(self, resize=True, draft=False):
+        """Recalculate the intensity profile of the selected object.
+
+        Args:
+            resize (bool, optional): fit the axes to the profile. Defaults to True.
+            draft (bool, optional): limit the spline order to 1 for fast
+                updates while dragging. Defaults to False.
+        """
         if self.isHidden():
             return
         
@@ -154,12 +161,14 @@ class RightUI(QWidget):
             self.reset_intensity_plot()
             return 
         
-        image = self.main_window.data_handler.img_data
+        image = self.main_window.data_handler.image_cache
         # get ui settings
         interpolation_factor = (
             int(self.ppx_edit.text()) if self.ppx_edit.text() else 1
         )
         spline_order = int(self.order_dd.currentText())
+        if draft:
+            spline_order = min(spline_order, 1)
         
 
         # calculate intensity profile
@@ -226,7 +235,7 @@ class RightUI(QWidget):
 
         selected_element = self.main_window.vispy_canvas.get_selected_object()
         if isinstance(selected_element, (EditLineVisual, EditRectVisual)):
-            image = self.main_window.data_handler.img_data
+            image = self.main_window.data_handler.image_cache
             interpolation_factor = (
                 int(self.ppx_edit.text()) if self.ppx_edit.text() else 1
             )
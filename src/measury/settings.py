@@ -1,3 +1,4 @@
+from typing import NamedTuple
 from PySide6.QtGui import QColor
 from PySide6.QtCore import QSettings
 
@@ -10,14 +11,49 @@ DEFAULT_SETTINGS = {
     "ui/microscope": "Generic_Microscope",
     "ui/show_both_scaling": False,
     "misc/file_extensions": [".msry", ".measury"],
+    # number of steps kept on the undo stack, 0 is unlimited
+    "misc/undo_limit": 200,
 }
 
 
+def rgba(color: QColor) -> tuple:
+    """Color as RGBA tuple with values from 0 to 1, as used by vispy."""
+    return tuple([value / 255 for value in color.getRgb()])
+
+
+class SettingsSnapshot(NamedTuple):
+    """Copy of the settings that are read for every object or table row,
+    with the types they are used with."""
+
+    object_color: tuple
+    object_border_color: tuple
+    image_rendering: str
+    show_both_scaling: bool
+
+    @classmethod
+    def from_settings(cls, settings: QSettings):
+        return cls(
+            object_color=rgba(settings.value("graphics/object_color")),
+            object_border_color=rgba(settings.value("graphics/object_border_color")),
+            image_rendering=settings.value("graphics/image_rendering"),
+            show_both_scaling=settings.value("ui/show_both_scaling", type=bool),
+        )
+
+
 class Settings(QSettings):
 
     def __init__(self, parent, organization: str, application: str):
         super().__init__(organization, application)
         self.parent = parent
+        self._snapshot = None
+
+    @property
+    def snapshot(self) -> SettingsSnapshot:
+        """The settings that are read often, they are only read
+        again from QSettings after a setting was saved."""
+        if self._snapshot is None:
+            self._snapshot = SettingsSnapshot.from_settings(self)
+        return self._snapshot
 
     def load_defaults(self):
         """Manage loading all the settings."""
@@ -25,6 +61,7 @@ class Settings(QSettings):
         for key, value in DEFAULT_SETTINGS.items():
             self.setValue(key, value)
         self.sync()
+        self._snapshot = None
 
     def load_settings(self):
         """Load all the settings."""
@@ -39,6 +76,7 @@ class Settings(QSettings):
         self.parent.data_handler.logger.info(f"Saving setting: {key}")
         self.setValue(key, value)
         self.sync()
+        self._snapshot = None
 
     @property
     def is_default(self):
@@ -69,6 +107,13 @@ class Settings(QSettings):
                         f"Setting not equal: {key} {self.value(key)} {settings.get(key)}"
                     )
                     return False
+            # integers may be stored as strings
+            elif isinstance(settings.get(key), int):
+                if self.value(key, type=int) != settings.get(key):
+                    self.parent.data_handler.logger.info(
+                        f"Setting not equal: {key} {self.value(key)} {settings.get(key)}"
+                    )
+                    return False
             # otherwise simply compare the values
             elif self.value(key) != settings.get(key):
                 self.parent.data_handler.logger.info(
@@ -0,0 +1,168 @@
+# absolute imports
+import numpy as np
+from vispy.scene.visuals import Line, Mesh
+from vispy.visuals.transforms import linear
+
+# state of every object in a collection
+RECORD_DTYPE = np.dtype(
+    [
+        ("uid", np.int64),
+        ("start", np.int64),  # first point of the outline in the points array
+        ("count", np.int64),  # number of points of the outline
+        ("closed", np.bool_),  # the outline is closed
+        ("shown", np.bool_),  # the object is not hidden by the user
+        ("live", np.bool_),  # the object is selected and draws itself
+    ]
+)
+
+
+def outline_segments(records) -> np.ndarray:
+    """Index pairs of all outline segments of the records."""
+    counts = records["count"]
+    n_segments = np.where(counts > 1, counts - 1 + records["closed"], 0)
+    local = np.arange(n_segments.sum()) - np.repeat(np.cumsum(n_segments) - n_segments, n_segments)
+    first = np.repeat(records["start"], n_segments)
+    second = first + (local + 1) % np.repeat(np.maximum(counts, 1), n_segments)
+    return np.column_stack((first + local, second))
+
+
+def fan_triangles(records) -> np.ndarray:
+    """Index triples that fill the closed, convex outlines of the records."""
+    counts = np.where(records["closed"], records["count"], 0)
+    n_triangles = np.maximum(counts - 2, 0)
+    local = np.arange(n_triangles.sum()) - np.repeat(np.cumsum(n_triangles) - n_triangles, n_triangles)
+    first = np.repeat(records["start"], n_triangles)
+    return np.column_stack((first, first + local + 1, first + local + 2))
+
+
+class ShapeCollection:
+    """Draws all objects of a structure with one outline and one fill visual.
+
+    The outlines of the objects are packed into one array of points, the
+    state of every object is kept in a record array (see RECORD_DTYPE).
+    The objects hide their own visuals while they are in a collection,
+    only the selected object is drawn by itself so that it can be edited.
+    Objects report changes through `EditVisual.collection_changed` and the
+    visuals are updated on the next `refresh`.
+    """
+
+    def __init__(self, parent, settings, filled=True, width=2):
+        self.settings = settings
+        self.filled = filled
+        self.objects = list()
+        self.rows = dict()  # uid -> row in records
+        self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.points = np.zeros((0, 2), dtype=np.float32)
+        self.dirty = set()
+        # version of the structure in the ObjectStore
+        self.version = None
+
+        self.fill = Mesh(parent=parent)
+        self.fill.set_gl_state("translucent", depth_test=False, cull_face=False)
+        self.outline = Line(parent=parent, width=width, method="gl", antialias=True)
+        for visual in (self.fill, self.outline):
+            visual.transform = linear.STTransform(translate=(0, 0, -1))
+        self.update_colors()
+
+    def __len__(self):
+        return len(self.objects)
+
+    def set_objects(self, objects):
+        """Pack a new list of objects, objects that are no longer part
+        of the collection draw themselves again."""
+        uids = {obj.uid for obj in objects}
+        for obj in self.objects:
+            if obj.uid not in uids:
+                obj.collection = None
+                obj.visible = obj.shown
+                obj.update_visuals()
+
+        self.objects = list(objects)
+        self.rows = {obj.uid: row for row, obj in enumerate(self.objects)}
+        outlines = [np.asarray(obj.outline(), dtype=np.float32) for obj in self.objects]
+        counts = np.array([len(outline) for outline in outlines], dtype=np.int64)
+
+        self.records = np.zeros(len(self.objects), dtype=RECORD_DTYPE)
+        self.records["uid"] = [obj.uid for obj in self.objects]
+        self.records["count"] = counts
+        self.records["start"] = np.cumsum(counts) - counts
+        self.points = (
+            np.concatenate(outlines) if outlines else np.zeros((0, 2), dtype=np.float32)
+        )
+        for row, obj in enumerate(self.objects):
+            obj.collection = self
+            self.records["closed"][row] = obj.closed
+            self.update_state(row, obj)
+        self.dirty.clear()
+        self.upload()
+
+    def clear(self):
+        """Unpack all objects and remove the visuals from the scene."""
+        self.set_objects([])
+        self.fill.parent = None
+        self.outline.parent = None
+
+    def mark_dirty(self, obj):
+        self.dirty.add(obj.uid)
+        # request a redraw, the visuals are refreshed before drawing
+        self.outline.update()
+
+    def update_state(self, row, obj):
+        self.records["shown"][row] = obj.shown
+        self.records["live"][row] = obj.selected
+        obj.visible = obj.shown and obj.selected
+
+    def refresh(self):
+        """Write the outlines of all changed objects into the visuals."""
+        if not self.dirty:
+            return
+        new_outlines = dict()
+        for uid in self.dirty:
+            row = self.rows.get(uid)
+            if row is None:
+                continue
+            obj = self.objects[row]
+            self.update_state(row, obj)
+            start, count = self.records["start"][row], self.records["count"][row]
+            outline = np.asarray(obj.outline(), dtype=np.float32)
+            if len(outline) == count:
+                self.points[start : start + count] = outline
+            else:
+                new_outlines[row] = outline
+        self.dirty.clear()
+
+        # the number of points of an object changed, repack all points
+        if new_outlines:
+            outlines = [
+                new_outlines.get(row, self.points[start : start + count])
+                for row, (start, count) in enumerate(self.records[["start", "count"]].tolist())
+            ]
+            counts = np.array([len(outline) for outline in outlines], dtype=np.int64)
+            self.records["count"] = counts
+            self.records["start"] = np.cumsum(counts) - counts
+            self.points = np.concatenate(outlines)
+        self.upload()
+
+    def transform(self, matrix):
+        """Apply an affine transform to the outlines of all objects,
+        like ObjectStore.transform_all does to the objects."""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        self.points = (self.points @ matrix[:2, :2].T + matrix[:2, 2]).astype(np.float32)
+        self.upload()
+
+    def upload(self):
+        drawn = self.records[self.records["shown"] & ~self.records["live"]]
+        segments = outline_segments(drawn)
+        self.outline.visible = len(segments) > 0
+        if self.outline.visible:
+            self.outline.set_data(pos=self.points, connect=segments, color=self.border_color)
+
+        triangles = fan_triangles(drawn) if self.filled else np.zeros((0, 3))
+        self.fill.visible = len(triangles) > 0
+        if self.fill.visible:
+            self.fill.set_data(vertices=self.points, faces=triangles, color=self.color)
+
+    def update_colors(self):
+        self.color = self.settings.snapshot.object_color
+        self.border_color = self.settings.snapshot.object_border_color
+        self.upload()
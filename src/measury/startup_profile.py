@@ -0,0 +1,82 @@
+"""
+Time the startup of Measury
+
+    measury --profile-startup
+
+imports the dependencies and the modules of Measury one after the other
+and then creates the main window. Every step is only timed for what was
+not imported before, so the times add up to the time until the window
+is shown.
+"""
+
+# absolute imports
+import importlib
+import sys
+import time
+
+# in the order they are imported at startup
+STARTUP_MODULES = [
+    "numpy",
+    "cv2",
+    "PySide6.QtCore",
+    "PySide6.QtGui",
+    "PySide6.QtWidgets",
+    "PySide6.QtOpenGLWidgets",
+    "vispy.scene",
+    "measury.measurements",
+    "measury.drawable_objects",
+    "measury.data_handler",
+    "measury.vispy_canvas",
+    "measury.main_ui",
+    "measury.main_window",
+    "measury.app",
+]
+# only imported once they are used, they should not show up at startup
+DEFERRED_MODULES = ["scipy.ndimage", "xml.etree.ElementTree"]
+
+
+def time_imports(modules) -> list[tuple[str, float]]:
+    """Import the modules one after the other.
+
+    Returns:
+        list[tuple[str, float]]: module and seconds it took to import
+    """
+    times = list()
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        times.append((name, time.perf_counter() - start))
+    return times
+
+
+def profile_startup(file=None) -> list[tuple[str, float]]:
+    """Print the import times and the time to show the main window.
+
+    Args:
+        file (file object, optional): where to print to. Defaults to sys.stdout.
+
+    Returns:
+        list[tuple[str, float]]: step and seconds it took
+    """
+    if file is None:
+        file = sys.stdout
+
+    times = time_imports(STARTUP_MODULES)
+
+    from .app import App
+
+    start = time.perf_counter()
+    app = App()
+    app.main_window.show()
+    app.vispy_app.process_events()
+    times.append(("main window", time.perf_counter() - start))
+    app.close()
+
+    for name, seconds in times:
+        print(f"{name:<30}{seconds * 1000:10.1f} ms", file=file)
+    print(f"{'total':<30}{sum(seconds for _, seconds in times) * 1000:10.1f} ms", file=file)
+
+    imported = [name for name in DEFERRED_MODULES if name in sys.modules]
+    if imported:
+        print(f"imported at startup: {', '.join(imported)}", file=file)
+    return times
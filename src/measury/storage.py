@@ -0,0 +1,207 @@
+"""
+A .msry storage file is a zip container with the members
+
+    manifest.json   scaling, origin, rotation and all measurements
+    image           the original image file, stored uncompressed
+
+The manifest is small, so measurements can be listed or aggregated
+without reading the image. Objects are stored by their class name and
+their save() state, no classes are imported when loading.
+"""
+
+# absolute imports
+from pathlib import Path
+import json
+import mmap
+import os
+import struct
+import zipfile
+import numpy as np
+
+FORMAT_NAME = "measury"
+FORMAT_VERSION = 1
+MANIFEST_MEMBER = "manifest.json"
+IMAGE_MEMBER = "image"
+
+
+def to_json(value):
+    """Convert NumPy values for json.dumps, arrays keep their dtype."""
+    if isinstance(value, np.ndarray):
+        return {"__ndarray__": value.tolist(), "dtype": str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def from_json(value: dict):
+    """object_hook for json.loads that restores NumPy arrays."""
+    if "__ndarray__" in value:
+        return np.array(value["__ndarray__"], dtype=value["dtype"])
+    return value
+
+
+def is_storage_container(file_path: Path) -> bool:
+    """Check if a file uses the container format and not the old pickle format."""
+    return zipfile.is_zipfile(file_path)
+
+
+def write_storage_file(
+    file_path: Path,
+    structure_data: dict,
+    img_byte_stream=None,
+    scaling=None,
+    origin=None,
+    img_rotation=0,
+    image_name=None,
+    source=None,
+):
+    """Write measurements and optionally the image into a storage container.
+
+    Args:
+        file_path (Path): path of the .msry file
+        structure_data (dict): {structure_name: [(object type name, state), ...]}
+        img_byte_stream (bytes-like, optional): the image file content
+        scaling (tuple, optional): pixel, length, unit and scale bar parameters
+        origin (np.ndarray, optional): origin of the image
+        img_rotation (int, optional): rotation of the image in degrees
+        image_name (str, optional): file name of the image
+        source (StorageFile, optional): the storage file the image is mapped
+            from, it is closed before it is replaced by the new file, so
+            arrays that view its image need to be dropped before
+    """
+    manifest = dict(
+        format=FORMAT_NAME,
+        version=FORMAT_VERSION,
+        image=None,
+        scaling=scaling,
+        origin=origin,
+        rotation=img_rotation,
+        structures={
+            name: [dict(type=obj_type, state=state) for obj_type, state in objects]
+            for name, objects in structure_data.items()
+        },
+    )
+    if img_byte_stream is not None:
+        manifest["image"] = dict(
+            member=IMAGE_MEMBER, name=image_name, size=len(img_byte_stream)
+        )
+
+    # the image may be mapped from the file that is overwritten, so the
+    # container is written next to it and replaces it once it is complete,
+    # the map is closed before as mapped files can not be replaced on Windows
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(file_path.name + ".tmp")
+    with zipfile.ZipFile(temp_path, "w") as container:
+        container.writestr(
+            MANIFEST_MEMBER,
+            json.dumps(manifest, default=to_json, ensure_ascii=False),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        if img_byte_stream is not None:
+            # stored uncompressed so that it can be mapped from the container
+            info = zipfile.ZipInfo(IMAGE_MEMBER)
+            info.compress_type = zipfile.ZIP_STORED
+            with container.open(info, "w", force_zip64=True) as image_file:
+                image_file.write(memoryview(img_byte_stream))
+    if source is not None:
+        source.close()
+    os.replace(temp_path, file_path)
+
+
+class StorageFile:
+    """Read access to a storage container. Only the manifest is read
+    on construction, the image is read when it is requested. The image is
+    mapped until the storage file is closed, it can be used as a context
+    manager."""
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self._mapped_file = None
+        self._image_view = None
+        with zipfile.ZipFile(self.file_path) as container:
+            self.manifest = json.loads(
+                container.read(MANIFEST_MEMBER).decode("utf-8"), object_hook=from_json
+            )
+            if self.manifest.get("format") != FORMAT_NAME:
+                raise ValueError(f"{self.file_path} is not a measury storage file")
+            if self.manifest.get("version", 0) > FORMAT_VERSION:
+                raise ValueError(
+                    f"{self.file_path} was written by a newer version of measury "
+                    f"(format version {self.manifest['version']})"
+                )
+            self._image_info = None
+            if self.manifest.get("image") is not None:
+                self._image_info = container.getinfo(self.manifest["image"]["member"])
+
+    @property
+    def has_image(self) -> bool:
+        return self._image_info is not None
+
+    @property
+    def structures(self) -> dict:
+        """{structure_name: [(object type name, state), ...]}"""
+        return {
+            name: [(obj["type"], obj["state"]) for obj in objects]
+            for name, objects in self.manifest["structures"].items()
+        }
+
+    @property
+    def scaling(self):
+        scaling = self.manifest.get("scaling")
+        if scaling is not None and len(scaling) > 3 and scaling[3] is not None:
+            scaling = (*scaling[:3], tuple(scaling[3]))
+        return None if scaling is None else tuple(scaling)
+
+    @property
+    def origin(self) -> np.ndarray:
+        origin = self.manifest.get("origin")
+        return np.zeros(2) if origin is None else np.asarray(origin, dtype=np.float64)
+
+    @property
+    def img_rotation(self) -> int:
+        return self.manifest.get("rotation", 0)
+
+    def read_image(self):
+        """Return the image file content. Uncompressed members are mapped
+        from the container instead of being read into memory."""
+        if self._image_info is None:
+            return None
+        info = self._image_info
+        if info.compress_type != zipfile.ZIP_STORED or info.file_size == 0:
+            with zipfile.ZipFile(self.file_path) as container:
+                return container.read(info)
+
+        if self._image_view is None:
+            with open(self.file_path, "rb") as file:
+                # the data follows the local file header of the member
+                file.seek(info.header_offset)
+                header = file.read(30)
+                name_length, extra_length = struct.unpack("<HH", header[26:30])
+                data_offset = info.header_offset + 30 + name_length + extra_length
+                self._mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._image_view = memoryview(self._mapped_file)[
+                data_offset : data_offset + info.file_size
+            ]
+        return self._image_view
+
+    def close(self):
+        """Unmap the image, the byte stream returned by read_image can not
+        be used anymore. Arrays that view the image need to be dropped
+        before, otherwise a BufferError is raised and the file stays mapped."""
+        if self._image_view is not None:
+            self._image_view.release()
+        if self._mapped_file is not None:
+            self._mapped_file.close()
+        self._image_view = self._mapped_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_manifest(file_path: Path) -> dict:
+    """Read only the manifest of a storage container."""
+    with StorageFile(file_path) as storage_file:
+        return storage_file.manifest
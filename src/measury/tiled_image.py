@@ -0,0 +1,142 @@
+# absolute imports
+from collections import OrderedDict
+import numpy as np
+import cv2
+from vispy.scene import Node, visuals
+from vispy.visuals.transforms import linear
+
+
+class TiledImage(Node):
+    """Renders a large image as tiles of a downsampled image pyramid.
+
+    Level 0 is the full resolution image, every further level is created
+    with cv2.pyrDown from the previous one when it is first needed.
+    Only the tiles of the level that matches the current zoom are
+    uploaded to the GPU. Uploaded tiles are kept in an LRU cache.
+    """
+
+    def __init__(self, tile_size=1024, cache_size=48, interpolation="nearest", parent=None):
+        Node.__init__(self, parent=parent)
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self._interpolation = interpolation
+        self.levels = []
+        self.tiles = OrderedDict()
+        self.current_level = None
+
+    @property
+    def interpolation(self):
+        return self._interpolation
+
+    @interpolation.setter
+    def interpolation(self, val):
+        self._interpolation = val
+        for tile in self.tiles.values():
+            tile.interpolation = val
+
+    def set_data(self, img_data):
+        """Set a new image, this drops the pyramid and all cached tiles."""
+        self.clear()
+        self.levels = [img_data]
+
+    def clear(self):
+        for tile in self.tiles.values():
+            tile.parent = None
+        self.tiles.clear()
+        self.levels = []
+        self.current_level = None
+
+    @property
+    def num_levels(self):
+        """Number of pyramid levels, the coarsest one fits into a single tile."""
+        if not self.levels:
+            return 0
+        size = max(self.levels[0].shape[:2])
+        return max(1, int(np.ceil(np.log2(max(size / self.tile_size, 1)))) + 1)
+
+    def get_level(self, level):
+        """Return the pixel data of a pyramid level, building it if necessary."""
+        while len(self.levels) <= level:
+            self.levels.append(cv2.pyrDown(np.ascontiguousarray(self.levels[-1])))
+        return self.levels[level]
+
+    def level_for_scale(self, scale):
+        """Pick the pyramid level for a given number of image pixels per screen pixel."""
+        if scale <= 1:
+            return 0
+        return int(min(np.floor(np.log2(scale)), self.num_levels - 1))
+
+    def visible_tiles(self, level, x_range, y_range):
+        """Return the keys of all tiles of a level that intersect a region
+        given in full resolution image pixels."""
+        img = self.get_level(level)
+        factor = 2**level
+        span = self.tile_size * factor
+        n_y = int(np.ceil(img.shape[0] / self.tile_size))
+        n_x = int(np.ceil(img.shape[1] / self.tile_size))
+        x_start = int(np.clip(np.floor(x_range[0] / span), 0, n_x))
+        x_stop = int(np.clip(np.ceil(x_range[1] / span), 0, n_x))
+        y_start = int(np.clip(np.floor(y_range[0] / span), 0, n_y))
+        y_stop = int(np.clip(np.ceil(y_range[1] / span), 0, n_y))
+        return [
+            (level, t_y, t_x)
+            for t_y in range(y_start, y_stop)
+            for t_x in range(x_start, x_stop)
+        ]
+
+    def update_view(self, x_range, y_range, scale):
+        """Show the tiles needed for the visible region.
+
+        Args:
+            x_range (tuple): visible x range in image pixels
+            y_range (tuple): visible y range in image pixels
+            scale (float): image pixels per screen pixel
+        """
+        if not self.levels:
+            return
+        level = self.level_for_scale(scale)
+        keys = self.visible_tiles(level, x_range, y_range)
+
+        # tiles of other levels or outside of the view are only hidden
+        # so that they can be reused when the view moves back
+        for key, tile in self.tiles.items():
+            tile.visible = False
+        for key in keys:
+            self.load_tile(key).visible = True
+        self.current_level = level
+
+        self.evict(keep=set(keys))
+
+    def load_tile(self, key):
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        level, t_y, t_x = key
+        img = self.get_level(level)
+        factor = 2**level
+        data = img[
+            t_y * self.tile_size : (t_y + 1) * self.tile_size,
+            t_x * self.tile_size : (t_x + 1) * self.tile_size,
+        ]
+        tile = visuals.Image(
+            data=np.ascontiguousarray(data),
+            texture_format="auto",
+            interpolation=self._interpolation,
+            cmap="viridis",
+            parent=self,
+        )
+        tile.transform = linear.STTransform(
+            scale=(factor, factor),
+            translate=(t_x * self.tile_size * factor, t_y * self.tile_size * factor),
+        )
+        self.tiles[key] = tile
+        return tile
+
+    def evict(self, keep=()):
+        """Remove the least recently used tiles that exceed the cache size."""
+        for key in list(self.tiles.keys()):
+            if len(self.tiles) <= self.cache_size:
+                break
+            if key not in keep:
+                self.tiles.pop(key).parent = None
@@ -1,10 +1,13 @@
 # absolute imports
+import copy
 import numpy as np
 import cv2
-from vispy.scene import SceneCanvas, visuals, AxisWidget, Label
+from vispy.scene import SceneCanvas, Node, visuals, AxisWidget, Label
 from vispy.visuals.transforms import linear
+from vispy.gloo import gl
 from PySide6.QtWidgets import QInputDialog
 from PySide6.QtGui import QUndoCommand
+from PySide6.QtCore import QThreadPool, QTimer
 
 # relative imports
 from .drawable_objects import (
@@ -14,8 +17,13 @@ from .drawable_objects import (
     EditLineVisual,
     LineControlPoints,
     EditPolygonVisual,
-    Markers,
+    OBJECT_TYPES,
 )
+from .image_io import decode_image, ImageDecodeWorker
+from .particle_detection import ParticleDetectionWorker
+from .tiled_image import TiledImage
+from .shape_collection import ShapeCollection
+from . import measurements
 
 class VispyCanvas(SceneCanvas):
     """Canvas for displaying the vispy instance"""
@@ -27,6 +35,17 @@ class VispyCanvas(SceneCanvas):
     text_color = "black"
     current_move = None
     origin = np.zeros(2)
+    # images with larger byte streams are decoded on a worker thread
+    ASYNC_DECODE_MIN_BYTES = 8 * 1024**2
+    # images with a larger side are rendered as tiles of an image pyramid
+    TILED_IMAGE_MIN_SIZE = 8192
+    tiled = False
+    max_texture_size = None
+    # the ui is updated at most once per frame while objects are dragged
+    UPDATE_INTERVAL = 16 # ms
+    # structures with more objects are drawn as one ShapeCollection
+    COLLECTION_MIN_OBJECTS = 100
+    COLLECTION_TYPES = (EditRectVisual, EditEllipseVisual, EditLineVisual)
 
     def __init__(self, main_window):
 
@@ -47,13 +66,27 @@ class VispyCanvas(SceneCanvas):
 
         self.view = self.grid.add_view(row=1, col=1, bgcolor="black")
 
+        # pixel coordinates of the image as it is shown, shifted by the origin
+        self.image_frame = Node(parent=self.view.scene)
+        # the decoded image is never rotated, it is shown
+        # rotated by the transform of the image visuals
         self.image = visuals.Image(
             data=None,
             texture_format="auto",
-            interpolation=self.main_window.settings.value("graphics/image_rendering"),
+            interpolation=self.main_window.settings.snapshot.image_rendering,
             cmap="viridis",
-            parent=self.view.scene,
+            parent=self.image_frame,
         )
+        self.tiled_image = TiledImage(
+            interpolation=self.main_window.settings.snapshot.image_rendering,
+            parent=self.image_frame,
+        )
+        # the filled scale bar is drawn on top of the image
+        self.scale_bar_overlay = visuals.Image(data=None, parent=self.image_frame)
+        self.scale_bar_overlay.order = 1
+        self.scale_bar_overlay.visible = False
+        # load the tiles matching the camera whenever the view changes
+        self.view.scene.events.transform_change.connect(self.update_tiles)
 
         # title
         self.title_label = Label(
@@ -105,6 +138,30 @@ class VispyCanvas(SceneCanvas):
         self.selected_object = None
         self.selected_point = None
 
+        # for decoding images in the background
+        self.decode_generation = 0
+        self.decode_worker = None
+        self.on_image_loaded = None
+
+        # for detecting particles in the background
+        self.detection_generation = 0
+        self.detection_worker = None
+        self.detection_structure = None
+
+        # coalesces the ui updates of mouse move events
+        self.update_timer = QTimer(self.main_window)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(self.UPDATE_INTERVAL)
+        self.update_timer.timeout.connect(lambda: self.selection_update(draft=True))
+        self.precise_update_pending = False
+
+        # structure name -> ShapeCollection, updated before every draw
+        self.collections = dict()
+        # colors of the objects, new objects take them from the settings snapshot
+        snapshot = self.main_window.settings.snapshot
+        self.object_colors = (snapshot.object_color, snapshot.object_border_color)
+        self.events.draw.connect(self.update_collections, position="first")
+
         self.freeze()
         
     def update_file_path(self, file_path=None):
@@ -118,61 +175,184 @@ class VispyCanvas(SceneCanvas):
         if file_path is not None:
             self.title_label.text = file_path.name
 
-    def update_image(self):
+    def update_image(self, on_loaded=None):
         """Update the image in the vispy canvas and also the 
-        file path shown above the image"""
+        file path shown above the image.
+
+        Large images are decoded on a worker thread and only uploaded
+        to the GPU once the decoded array is ready.
+
+        Args:
+            on_loaded (callable, optional): called after the new image is shown.
+        """
 
         # if there is no image loaded, do nothing
         if self.data_handler.file_path is not None:
-            try:
-                # opencv reads images in BGR format,
-                # so we need to convert it to RGB
-                self.data_handler.logger.debug(
-                    f"update data_handler.file_path = {self.data_handler.file_path}"
-                )
-                BGR_img = cv2.imdecode(
-                    np.frombuffer(self.data_handler.img_byte_stream, dtype=np.uint8),
-                    cv2.IMREAD_UNCHANGED,
-                )
-                self.data_handler.img_data = cv2.cvtColor(BGR_img, cv2.COLOR_BGR2RGB)
+            self.data_handler.logger.debug(
+                f"update data_handler.file_path = {self.data_handler.file_path}"
+            )
+            # a new image replaces any image that is still being decoded
+            self.cancel_image_decoding()
+
+            byte_stream = self.data_handler.img_byte_stream
+            if len(byte_stream) < self.ASYNC_DECODE_MIN_BYTES:
+                try:
+                    img_data = decode_image(byte_stream)
+                except Exception as error:
+                    # handle the exception
+                    if self.main_window is not None:
+                        self.main_window.raise_error(f"Image could not be loaded: {error}")
+                    return
+                self.set_image(img_data, on_loaded)
+                return
 
-                self.draw_image()
+            self.decode_generation += 1
+            self.on_image_loaded = on_loaded
+            self.decode_worker = ImageDecodeWorker(byte_stream, self.decode_generation)
+            self.decode_worker.signals.finished.connect(self.image_decoded)
+            self.decode_worker.signals.failed.connect(self.image_decoding_failed)
+            self.main_window.show_progress(f"Decoding {self.data_handler.file_path.name}")
+            QThreadPool.globalInstance().start(self.decode_worker)
+
+    def image_decoded(self, generation, img_data):
+        """Slot for the decode worker, runs on the GUI thread."""
+        # drop results of cancelled decodings
+        if generation != self.decode_generation:
+            return
+        self.decode_worker = None
+        self.main_window.hide_progress()
+        self.set_image(img_data, self.on_image_loaded)
 
-                self.view.camera = "panzoom"
-                self.center_image()
-                self.view.camera.aspect = 1
-                self.view.camera.flip = (0, 1, 0)
+    def image_decoding_failed(self, generation, error):
+        if generation != self.decode_generation:
+            return
+        self.decode_worker = None
+        self.main_window.hide_progress()
+        self.main_window.raise_error(f"Image could not be loaded: {error}")
+
+    def cancel_image_decoding(self):
+        """Cancel the image that is currently being decoded, e.g. because
+        another file was dropped onto the canvas."""
+        if self.decode_worker is None:
+            return
+        self.data_handler.logger.info("cancel image decoding")
+        # not yet started workers can be removed from the pool,
+        # results of running ones are ignored via the generation
+        QThreadPool.globalInstance().tryTake(self.decode_worker)
+        self.decode_generation += 1
+        self.decode_worker = None
+        self.on_image_loaded = None
+        self.main_window.hide_progress()
+
+    def wait_for_image(self):
+        """Block until the image that is being decoded is shown."""
+        while self.decode_worker is not None:
+            QThreadPool.globalInstance().waitForDone(50)
+            self.app.process_events()
+
+    def set_image(self, img_data, on_loaded=None):
+        """Show decoded image data in the canvas."""
+        try:
+            self.data_handler.img_data = img_data
 
-                self.xaxis.link_view(self.view)
-                self.yaxis.link_view(self.view)
+            self.draw_image()
 
-                self.update_file_path()
+            self.view.camera = "panzoom"
+            self.center_image()
+            self.view.camera.aspect = 1
+            self.view.camera.flip = (0, 1, 0)
 
-            except Exception as error:
-                # handle the exception
-                if self.main_window is not None:
-                    self.main_window.raise_error(f"Image could not be loaded: {error}")
-                    return
+            self.xaxis.link_view(self.view)
+            self.yaxis.link_view(self.view)
+
+            self.update_file_path()
+
+        except Exception as error:
+            # handle the exception
+            if self.main_window is not None:
+                self.main_window.raise_error(f"Image could not be loaded: {error}")
+                return
 
-            self.start_state = False
-            self.remove_load_text()
+        self.start_state = False
+        self.remove_load_text()
+
+        if on_loaded is not None:
+            on_loaded()
 
     def draw_image(self, img_data=None):
+        """Upload the decoded image, it is rotated by the transform of the visuals."""
         if img_data is None:
-            img_data = self.data_handler.img_data
+            img_data = self.data_handler.raw_img_data
         self.data_handler.logger.debug("setting vispy image data")
+        interpolation = self.main_window.settings.snapshot.image_rendering
+        self.scale_bar_overlay.visible = False
         if img_data is not None:
-            self.image.set_data(img_data)
-        self.image.interpolation = self.main_window.settings.value(
-            "graphics/image_rendering"
+            self.tiled = self.use_tiling(img_data)
+            if self.tiled:
+                self.data_handler.logger.info("using tiled rendering for large image")
+                # free the texture of the single image
+                self.image.set_data(np.zeros((1, 1, 3), dtype=np.uint8))
+                self.image.visible = False
+                self.tiled_image.set_data(img_data)
+                self.update_tiles()
+            else:
+                self.tiled_image.clear()
+                self.image.visible = True
+                self.image.set_data(img_data)
+        else:
+            # free the pixels of the previous image
+            self.image.set_data(np.zeros((1, 1, 3), dtype=np.uint8))
+            self.tiled_image.clear()
+        self.image.interpolation = interpolation
+        self.tiled_image.interpolation = interpolation
+        self.update_image_transform()
+
+    def update_image_transform(self):
+        """Rotate the image visuals by the rotation of the image."""
+        if self.data_handler.raw_img_data is None:
+            return
+        matrix = measurements.rotation_matrix(
+            self.data_handler.img_rotation, self.data_handler.raw_img_data.shape
+        )
+        transform = linear.MatrixTransform()
+        # vispy maps row vectors, the matrix is transposed
+        transform.matrix[:2, :2] = matrix[:2, :2].T
+        transform.matrix[3, :2] = matrix[:2, 2]
+        self.image.transform = transform
+        self.tiled_image.transform = transform
+
+    def use_tiling(self, img_data):
+        """Check if an image is too large to be uploaded as a single texture."""
+        if self.max_texture_size is None:
+            try:
+                self.context.set_current()
+                self.max_texture_size = int(gl.glGetParameter(gl.GL_MAX_TEXTURE_SIZE))
+            except Exception:
+                self.max_texture_size = self.TILED_IMAGE_MIN_SIZE
+        return max(img_data.shape[:2]) > min(self.TILED_IMAGE_MIN_SIZE, self.max_texture_size)
+
+    def update_tiles(self, event=None):
+        """Load the tiles of the pyramid level that matches the
+        visible region of the camera."""
+        if not self.tiled:
+            return
+        width, height = self.view.size
+        tr = self.view.node_transform(self.tiled_image)
+        corners = tr.map(np.array([[0, 0], [width, 0], [0, height], [width, height]]))[:, :2]
+        scale = np.linalg.norm(corners[1] - corners[0]) / max(width, 1)
+        self.tiled_image.update_view(
+            (np.min(corners[:, 0]), np.max(corners[:, 0])),
+            (np.min(corners[:, 1]), np.max(corners[:, 1])),
+            scale,
         )
 
     def center_image(self):
         try:
-            if self.data_handler.img_data is not None:
+            if self.data_handler.raw_img_data is not None:
+                height, width = self.data_handler.img_shape
                 self.view.camera.set_range(
-                    x=(0-self.origin[0], self.data_handler.img_data.shape[1]-self.origin[0]),
-                    y=(0-self.origin[1], self.data_handler.img_data.shape[0]-self.origin[1]),
+                    x=(0-self.origin[0], width-self.origin[0]),
+                    y=(0-self.origin[1], height-self.origin[1]),
                     margin=0,
                 )
         except Exception as error:
@@ -180,73 +360,63 @@ class VispyCanvas(SceneCanvas):
             
     def rotate_image(self, direction="clockwise", rotate_objects=True):
         self.data_handler.logger.debug(f"rotate image")
-        if self.data_handler.img_data is not None:
+        if self.data_handler.raw_img_data is not None:
+            height, width = self.data_handler.img_shape
             if direction == "clockwise":
-                new_origin = np.array([self.data_handler.img_data.shape[0]-self.origin[1], 
-                                    self.origin[0]])
-
-                self.data_handler.img_rotation += 90
-                direction_hint = cv2.ROTATE_90_CLOCKWISE
+                new_origin = np.array([height-self.origin[1], self.origin[0]])
+                rotation = 90
             else:
                 # rotate counter clockwise
-                new_origin = np.array([self.origin[1],
-                                        self.data_handler.img_data.shape[1] - self.origin[0]])
-                self.data_handler.img_rotation -= 90
-                direction_hint = cv2.ROTATE_90_COUNTERCLOCKWISE
+                new_origin = np.array([self.origin[1], width - self.origin[0]])
+                rotation = -90
             
             # updating objects  
             if rotate_objects:
-                self.move_all_objects(self.origin)
+                # from the old origin to the image, rotate and to the new origin
+                matrix = (measurements.translation_matrix(-new_origin)
+                          @ measurements.rotation_matrix(rotation, (height, width))
+                          @ measurements.translation_matrix(self.origin))
                 self.set_origin(new_origin, move_objects=False)
-                self.rotate_all_objects(direction)
-                self.move_all_objects(-new_origin)
+                self.transform_all_objects(matrix)
             else:
                 self.set_origin(new_origin, move_objects=False)
-            self.data_handler.img_data = cv2.rotate(self.data_handler.img_data, direction_hint)
-            self.draw_image()
-            self.center_image()
-            
-    def rotate_coordinates_90(self, coords, direction="clockwise"):
-        """Rotate coordinates by 90 degrees in the given direction, 
-
-        Args:
-            coords (np.ndarray): coordinates to rotate
-            direction (cv2.rotation_type, optional): direction of rotation. Defaults to cv2.ROTATE_90_CLOCKWISE.
+            self.set_image_rotation(self.data_handler.img_rotation + rotation)
+
+    def set_image_rotation(self, img_rotation):
+        """Show the image rotated clockwise by a multiple of 90 degrees. Only
+        the transform of the image changes, the pixel data is not touched."""
+        self.data_handler.set_img_rotation(img_rotation)
+        # the scale bar was found in the image before the rotation
+        self.scale_bar_overlay.visible = False
+        self.update_image_transform()
+        self.update_tiles()
+        self.center_image()
 
-        Returns:
-            np.ndarray: rotated coordinates
-        """
-        new_coords = np.empty_like(coords)
-        self.data_handler.logger.debug("rotate coordinates " + direction)
-        if direction == "clockwise":
-            new_coords[:,0] = self.data_handler.img_data.shape[0] - coords[:,1]
-            new_coords[:,1] = coords[:,0]
-        else:
-            new_coords[:,0] = coords[:,1]
-            new_coords[:,1] = self.data_handler.img_data.shape[1] - coords[:,0]
-        return new_coords
-            
     def rotate_all_objects(self, direction="clockwise"):
-        """Rotate all objects by a given angle"""
+        """Rotate all objects by 90 degrees with the image"""
         self.data_handler.logger.debug("rotate all objects")
-        for structure in self.data_handler.drawing_data.keys():
-            for obj in self.data_handler.drawing_data[structure]:
-                # show object
-                if isinstance(obj, EditLineVisual):
-                    new_coords = self.rotate_coordinates_90(obj.coords, direction)
-                    obj.coords = new_coords
-                    obj.update_from_controlpoints()
-                else:
-                    if direction == 'clockwise':
-                        obj.angle += np.pi/2
-                    else:
-                        obj.angle -= np.pi/2
-                    
-                    obj.center = self.rotate_coordinates_90(obj.center[np.newaxis, :], 
-                                                            direction)[0]
-                    obj.update_from_controlpoints()
-                    
-        self.scene.update()  
+        rotation = 90 if direction == "clockwise" else 270
+        self.transform_all_objects(
+            measurements.rotation_matrix(rotation, self.data_handler.img_shape)
+        )
+
+    def transform_all_objects(self, matrix:np.ndarray):
+        """Apply an affine transform to all objects at once.
+
+        The geometry of all objects and the collections that draw them
+        are transformed in one go. Objects that draw themselves are
+        updated right away, the others once they are drawn by themselves.
+
+        Args:
+            matrix (np.ndarray): 3x3 matrix for homogeneous column vectors (x, y, 1)
+        """
+        self.data_handler.object_store.transform_all(matrix)
+        for collection in self.collections.values():
+            collection.transform(matrix)
+        for obj in self.data_handler.object_store:
+            if obj.collection is None or obj.visible:
+                obj.update_visuals()
+        self.scene.update()
             
         
     def rotate_image_w_undo(self):
@@ -262,6 +432,9 @@ class VispyCanvas(SceneCanvas):
         self.load_image_label.visible = False
 
     def on_mouse_release(self, event):
+        # the ui was only drafted while dragging
+        self.flush_selection_update()
+
         # transform so that coordinates start at 0 in self.view window
         tr = self.scene.node_transform(self.view)
         # only activate when over self.view by looking
@@ -366,9 +539,7 @@ class VispyCanvas(SceneCanvas):
 
                         tr = self.scene.node_transform(self.view.scene)
                         pos = tr.map(event.pos)
-                        self.view.interactive = False
-                        selected = self.visual_at(event.pos)
-                        self.view.interactive = True
+                        selected = self.object_at(event.pos, radius=1)
 
                         if event.button == 1:
 
@@ -396,21 +567,9 @@ class VispyCanvas(SceneCanvas):
 
                         tr = self.scene.node_transform(self.view.scene)
                         pos = tr.map(event.pos)
-                        self.view.interactive = False
                         # selected is what we clicked on 
                         # 6 as the markers are 8 wide and have a 1 pixel border 8+2*1=10 < 13=2*6+1 
-                        selected_list = self.visuals_at(event.pos, 6)
-                        selected = None
-                        if selected_list:
-                            # check if a marker is in the list, we want the last one, 
-                            # so we iterate from the back
-                            for selected in reversed(selected_list):
-                                if isinstance(selected, Markers):
-                                    break
-                            else:
-                                selected = selected_list[0]
-                        
-                        self.view.interactive = True
+                        selected = self.object_at(event.pos, radius=6)
 
                         match event.button:
                             case 1:
@@ -495,7 +654,7 @@ class VispyCanvas(SceneCanvas):
                                         self.selection_update(object=new_object)
                                         # if linecontrolpoint to get automatic line creation without draggin
                                         if isinstance(self.selected_object, LineControlPoints):
-                                            last_cp = self.selected_object.control_points[-1]
+                                            last_cp = self.selected_object.control_point(-1)
                                             self.selected_object.select(True, last_cp)
                                     else:
                                         new_object.delete()
@@ -524,8 +683,8 @@ class VispyCanvas(SceneCanvas):
 
                         if event.button == 1:
 
-                            # transform to get image pixel coordinates
-                            tr_image = self.scene.node_transform(self.image)
+                            # transform to get pixel coordinates of the shown image
+                            tr_image = self.scene.node_transform(self.image_frame)
                             mouse_image_coords = tr_image.map(event.pos)[:2]
                             # mouse_click_coordinates
                             m_i_x, m_i_y = np.floor(mouse_image_coords).astype(int)
@@ -540,7 +699,7 @@ class VispyCanvas(SceneCanvas):
 
                         # right click to delete scaling identification
                         if event.button == 2:
-                            self.draw_image(self.data_handler.img_data)
+                            self.draw_scale_bar(None)
                             self.main_ui.pixel_edit.setText(None)
 
     def create_new_object(
@@ -576,30 +735,106 @@ class VispyCanvas(SceneCanvas):
         command = CreateObjectCommand(self, new_object, pos, selected, structure_name)
         self.main_window.undo_stack.push(command)
 
+    def create_objects(self, objects, structure_name):
+        """Add many objects to a structure at once. Unlike create_new_object
+        the ui is only updated once for all objects."""
+        self.add_to_scene(objects)
+        structure_name = self.data_handler.save_objects(structure_name, objects)
+        self.main_ui.add_to_structure_dd(structure_name)
+        self.main_ui.update_object_list()
+
+    def add_to_scene(self, objects):
+        """Show new objects unselected, objects are built without a parent
+        so that they are only put into the scene once they are complete."""
+        for obj in objects:
+            obj.select(False)
+            if obj.parent is None:
+                obj.parent = self.view.scene
+
+    def delete_objects(self, objects):
+        """Delete many objects at once, see create_objects."""
+        selected = self.get_selected_object()
+        if any(obj is selected for obj in objects):
+            self.unselect()
+        self.data_handler.delete_objects(objects)
+        for obj in objects:
+            obj.delete()
+        self.main_ui.update_object_list()
+        self.main_window.right_ui.update_intensity_plot()
+
+    def detect_particles(self, shape="ellipse"):
+        """Detect particles in the image, or inside of the selected rectangle,
+        on a worker thread. All particles are added as one undo step.
+
+        Args:
+            shape (str, optional): "ellipse" or "polygon". Defaults to "ellipse".
+        """
+        if self.data_handler.raw_img_data is None:
+            self.main_window.raise_error("No image loaded")
+            return
+
+        roi = None
+        selected = self.get_selected_object()
+        if isinstance(selected, EditRectVisual):
+            corners = selected.control_points.get_coords() + self.origin
+            lower, upper = corners.min(axis=0), corners.max(axis=0)
+            roi = (*lower, *(upper - lower))
+
+        # particles go into the current structure if it has the same type
+        object_type = EditEllipseVisual if shape == "ellipse" else EditPolygonVisual
+        structure_name = self.main_ui.structure_dd.currentText()
+        objects = self.data_handler.drawing_data.get(structure_name)
+        if structure_name == "" or (objects and type(objects[0]) is not object_type):
+            structure_name = self.data_handler.generate_output_name()
+
+        self.detection_generation += 1
+        self.detection_structure = structure_name
+        self.detection_worker = ParticleDetectionWorker(
+            self.data_handler.img_data, self.detection_generation, roi=roi, shape=shape
+        )
+        self.detection_worker.signals.finished.connect(self.particles_detected)
+        self.detection_worker.signals.failed.connect(self.particle_detection_failed)
+        self.main_window.show_progress("Detecting particles")
+        QThreadPool.globalInstance().start(self.detection_worker)
+
+    def particles_detected(self, generation, particles):
+        """Slot for the detection worker, runs on the GUI thread."""
+        if generation != self.detection_generation:
+            return
+        self.detection_worker = None
+        self.main_window.hide_progress()
+        if not particles:
+            self.main_window.raise_error("No particles found")
+            return
+        self.data_handler.logger.info(f"detected {len(particles)} particles")
+        command = CreateObjectsCommand(self, particles, self.detection_structure)
+        self.main_window.undo_stack.push(command)
+
+    def particle_detection_failed(self, generation, error):
+        if generation != self.detection_generation:
+            return
+        self.detection_worker = None
+        self.main_window.hide_progress()
+        self.main_window.raise_error(f"Particles could not be detected: {error}")
+
     def update_object_colors(self):
         """
         Update the colors of the objects in the canvas.
-        This method iterates over the drawing data stored in the data handler and updates the colors of each object.
-        The colors are retrieved from the graphics settings in the main window.
+        The colors are taken from the settings snapshot and applied to all
+        objects in one pass, nothing is done if they did not change.
         Returns:
             None
         """
-        for name in self.data_handler.drawing_data.keys():
-            for obj in self.data_handler.drawing_data[name]:
-                color = self.main_window.settings.value(
-                    "graphics/object_color"
-                ).getRgb()
-                color = tuple([value / 255 for value in color])
-                border_color = self.main_window.settings.value(
-                    "graphics/object_border_color"
-                ).getRgb()
-                border_color = tuple([value / 255 for value in border_color])
-
-                if isinstance(obj, (EditLineVisual)):
-                    obj.line_color = border_color
-                    obj.update_from_controlpoints()
-                else:
-                    obj.update_colors(color=color, border_color=border_color)
+        snapshot = self.main_window.settings.snapshot
+        colors = (snapshot.object_color, snapshot.object_border_color)
+        # the objects already have these colors
+        if colors == self.object_colors:
+            return
+        self.object_colors = colors
+        for obj in self.data_handler.object_store:
+            obj.update_colors(*colors)
+        for collection in self.collections.values():
+            collection.update_colors()
         self.scene.update()
 
     def update_background_color(self, color=None):
@@ -689,46 +924,39 @@ class VispyCanvas(SceneCanvas):
         self.main_ui.scaling_direction_dd.setCurrentText(direction)
 
         if seed_points is None:
-            self.draw_image()
+            self.draw_scale_bar(None)
             scale_px = ""
         else:
-            # create copy of image which can be modified
-            img_data_modified = self.data_handler.img_data.copy()
-            if relative:
-                seed_point_x = round(seed_points[0] * img_data_modified.shape[1])
-                seed_point_y = round(seed_points[1] * img_data_modified.shape[0])
-            else:
-                seed_point_x, seed_point_y = seed_points
-            self.data_handler.logger.debug(
-                f"seed_point_x = {seed_point_x}, seed_point_y = {seed_point_y}"
-            )
-
-            cv2.floodFill(
-                img_data_modified,
-                None,
-                (seed_point_x, seed_point_y),
-                newVal=self.main_window.settings.value(
-                    "graphics/scale_bar_color"
-                ).getRgb(),
-                loDiff=[threshold] * 3,
-                upDiff=[threshold] * 3,
+            self.data_handler.logger.debug(f"scale bar seed points = {seed_points}")
+            scale_px, mask, (x, y, _, _) = measurements.find_scale_bar_width(
+                self.data_handler.img_data,
+                seed_points,
+                relative=relative,
+                threshold=threshold,
+                direction=direction,
             )
-
-            self.draw_image(img_data=img_data_modified)
-
-            non_zero_indices = np.nonzero(
-                np.sum(self.data_handler.img_data - img_data_modified, axis=2)
-            )
-
-            # plus one to account for the start pixel
-            if direction == "horizontal":
-                scale_px = np.max(non_zero_indices[1]) - np.min(non_zero_indices[1]) + 1
-            else:
-                scale_px = np.max(non_zero_indices[0]) - np.min(non_zero_indices[0]) + 1
+            self.draw_scale_bar(mask, offset=(x, y))
 
         self.main_ui.pixel_edit.setText(str(scale_px))
         self.scene.update()
 
+    def draw_scale_bar(self, mask, offset=(0, 0)):
+        """Show the filled scale bar on top of the image.
+
+        Args:
+            mask (np.ndarray | None): mask of the scale bar, None hides it
+            offset (tuple, optional): position of the mask in the image. Defaults to (0, 0).
+        """
+        if mask is None:
+            self.scale_bar_overlay.visible = False
+            return
+        color = self.main_window.settings.value("graphics/scale_bar_color").getRgb()
+        overlay = np.zeros(mask.shape + (4,), dtype=np.uint8)
+        overlay[mask] = (*color[:3], 255)
+        self.scale_bar_overlay.set_data(overlay)
+        self.scale_bar_overlay.transform = linear.STTransform(translate=offset)
+        self.scale_bar_overlay.visible = True
+
     def find_scale_bar_width_w_undo(self, seed_point_percentage, relative=True, threshold=None, direction=None):
         command = FindScalingBarWidthCommand(
             self, seed_point_percentage, relative, threshold, direction
@@ -813,8 +1041,7 @@ class VispyCanvas(SceneCanvas):
                                 self.selected_object.move(pos[0:2], modifiers=modifiers)
 
                             # update ui to display properties of selected object
-                            self.selection_update()
-                            self.main_window.right_ui.update_intensity_plot()
+                            self.schedule_selection_update()
 
                 case 3:
                     if event.is_dragging:
@@ -833,21 +1060,79 @@ class VispyCanvas(SceneCanvas):
                             pos = tr.map(event.pos)
 
                             self.selected_object.move(pos[:2], modifiers=modifiers)
-                            self.selection_update()
-                            self.main_window.right_ui.update_intensity_plot()
+                            self.schedule_selection_update()
                         
+    def object_at(self, pos, radius=6):
+        """Find the visual under the mouse with the spatial index of the
+        object store instead of picking through OpenGL.
+
+        Args:
+            pos (array_like): position of the mouse in canvas pixels
+            radius (int, optional): tolerance in screen pixels. Defaults to 6.
+
+        Returns:
+            ControlPoint | Visual | None: a control point of a selected object
+                or else the form of the topmost object at the position
+        """
+        tr = self.scene.node_transform(self.view.scene)
+        scene_pos = tr.map(pos)[:2]
+        # size of a screen pixel in scene coordinates
+        pixel_size = np.linalg.norm(tr.map(np.add(pos, (1, 0)))[:2] - scene_pos)
+        tolerance = radius * pixel_size
+
+        candidates = [
+            obj for obj in self.data_handler.object_store.hit_test(scene_pos, tolerance)
+            if obj.shown
+        ]
+        # control points are on top of all forms
+        for obj in candidates:
+            marker = obj.control_points.control_point_at(scene_pos, tolerance)
+            if marker is not None:
+                return marker
+        for obj in candidates:
+            if obj.contains(scene_pos, tolerance):
+                return obj.form
+        return None
+
+    def update_collections(self, event=None):
+        """Pack large structures into collections and bring the
+        collections up to date with their objects."""
+        store = self.data_handler.object_store
+        for structure in list(self.collections):
+            objects = store.structures.get(structure, [])
+            if (len(objects) < self.COLLECTION_MIN_OBJECTS
+                or type(objects[0]) not in self.COLLECTION_TYPES):
+                self.collections.pop(structure).clear()
+
+        for structure, objects in store.structures.items():
+            if (len(objects) < self.COLLECTION_MIN_OBJECTS
+                or type(objects[0]) not in self.COLLECTION_TYPES):
+                continue
+            collection = self.collections.get(structure)
+            if collection is None:
+                line = isinstance(objects[0], EditLineVisual)
+                collection = ShapeCollection(
+                    self.view.scene,
+                    self.main_window.settings,
+                    filled=not line,
+                    width=objects[0].line_width if line else 2,
+                )
+                self.collections[structure] = collection
+            if collection.version != store.versions[structure]:
+                collection.set_objects(objects)
+                collection.version = store.versions[structure]
+            collection.refresh()
+
     def hide_arrows(self):
-        for name in self.data_handler.drawing_data.keys():
-            for obj in self.data_handler.drawing_data[name]:
-                if isinstance(obj, EditRectVisual):
-                    obj.hide_arrow()
+        # only the rectangles that show their arrow are touched
+        for obj in list(EditRectVisual.shown_arrows):
+            obj.hide_arrow()
         self.scene.update()
         
     def show_arrows(self):
-        for name in self.data_handler.drawing_data.keys():
-            for obj in self.data_handler.drawing_data[name]:
-                if isinstance(obj, EditRectVisual):
-                    obj.show_arrow()
+        # only the rectangles are touched, they are kept by the object store
+        for obj in self.data_handler.object_store.objects_of_type(EditRectVisual):
+            obj.show_arrow()
         self.scene.update()
 
     def move_object_w_undo(self, object):
@@ -873,7 +1158,22 @@ class VispyCanvas(SceneCanvas):
             command = AddPointCommand(self, object, point)
             self.main_window.undo_stack.push(command)
 
-    def selection_update(self, object=None):
+    def schedule_selection_update(self):
+        """Update the ui with the next tick of the update timer. Multiple
+        calls in between are collapsed into a single update. The intensity
+        profile is only drafted, the precise one follows on mouse release."""
+        self.precise_update_pending = True
+        if not self.update_timer.isActive():
+            self.update_timer.start()
+
+    def flush_selection_update(self):
+        """Run a scheduled update immediately with the precise intensity profile."""
+        if self.precise_update_pending:
+            self.update_timer.stop()
+            self.precise_update_pending = False
+            self.selection_update()
+
+    def selection_update(self, object=None, draft=False):
 
         if object is None:
             object = self.get_selected_object()
@@ -881,7 +1181,7 @@ class VispyCanvas(SceneCanvas):
             self.main_ui.clear_object_table()
             return
 
-        self.main_window.right_ui.update_intensity_plot()
+        self.main_window.right_ui.update_intensity_plot(draft=draft)
 
         found_object = self.data_handler.find_object(object)
         if found_object:
@@ -925,6 +1225,43 @@ class VispyCanvas(SceneCanvas):
             return obj.parent
         return obj
 
+    def objects_from_states(self, states):
+        """Create objects from their saved states.
+
+        Args:
+            states (list[tuple[str, dict]]): class name and state (`save()`)
+                of every object, relative to the origin
+
+        Returns:
+            list[EditVisual]: the new objects
+        """
+        return [
+            OBJECT_TYPES[type_name](
+                settings=self.main_window.settings, parent=self.view.scene, **state
+            )
+            for type_name, state in states
+        ]
+
+    def saved_states(self, objects) -> list:
+        """uid, class name and a copy of the state of every object. Undo
+        commands keep these instead of the objects, which hold GPU visuals.
+
+        Returns:
+            list[tuple[int, str, dict]]: the states for restore_objects
+        """
+        return [(obj.uid, type(obj).__name__, copy.deepcopy(obj.save())) for obj in objects]
+
+    def restore_objects(self, states) -> list:
+        """Create deleted objects again from their saved_states, with their
+        uids so that the commands on the undo stack, which only keep the
+        uids, still find them."""
+        objects = self.objects_from_states(
+            [(type_name, copy.deepcopy(state)) for _, type_name, state in states]
+        )
+        for obj, (uid, _, _) in zip(objects, states):
+            obj.uid = uid
+        return objects
+
     def delete_object(self, object=None):
         # delete selected object if no other is given
         if object is None:
@@ -953,18 +1290,14 @@ class VispyCanvas(SceneCanvas):
         if move_objects:
             self.move_all_objects(-(point-self.origin))
         self.origin = point 
-        self.image.transform = linear.STTransform(translate=-self.origin)
+        self.image_frame.transform = linear.STTransform(translate=-self.origin)
+        self.update_tiles()
         self.center_image()
 
     def move_all_objects(self, vector:np.ndarray):
         """Move all objects by a relative vector"""
         self.data_handler.logger.debug("move all objects")
-        for structure in self.data_handler.drawing_data.keys():
-            for obj in self.data_handler.drawing_data[structure]:
-                # show object
-                obj.set_center(obj.center + vector)
-                obj.update_from_controlpoints()
-        self.scene.update()        
+        self.transform_all_objects(measurements.translation_matrix(vector))
 
     def set_origin_w_undo(self, pos):
         command = SetOriginCommand(self, pos)
@@ -1009,6 +1342,9 @@ class VispyCanvas(SceneCanvas):
 
 
 class DeleteObjectCommand(QUndoCommand):
+    """Deletes an object, it is kept as its saved state and created
+    again on undo (see VispyCanvas.saved_states)."""
+
     def __init__(self, data_handler, object=None):
         super().__init__()
         self.data_handler = data_handler
@@ -1019,43 +1355,45 @@ class DeleteObjectCommand(QUndoCommand):
 
         object = self.vispy_canvas.get_full_object(object)
 
-        self.object = object
-        self.structure, self.index = data_handler.find_object(self.object)
+        self.uid = object.uid
+        self.structure, self.index = data_handler.find_object(object)
+        self.states = self.vispy_canvas.saved_states([object])
 
     def undo(self):
         # Restore the old state
         self.data_handler.logger.info("Undoing delete object")
-        if self.structure in self.data_handler.drawing_data.keys():
-            self.data_handler.drawing_data[self.structure].insert(
-                self.index, self.object
-            )
-        else:
-            self.data_handler.drawing_data[self.structure] = [self.object]
+        object, = self.vispy_canvas.restore_objects(self.states)
+        object.select(False)
+        self.data_handler.save_object(self.structure, object, index=self.index)
         self.main_window.main_ui.update_structure_dd()
-        self.object.parent = self.vispy_canvas.view.scene
+        self.main_window.main_ui.update_object_list()
 
         self.data_handler.logger.info("Restored object")
 
     def redo(self):
         # Delete object
-        self.vispy_canvas.delete_object(self.object)
+        self.vispy_canvas.delete_object(self.data_handler.object_store.objects[self.uid])
         self.data_handler.logger.info("Deleted object")
 
 
 class MoveObjectCommand(QUndoCommand):
+    # consecutive moves of the same object are merged by the undo stack
+    MERGE_ID = 1
+
     def __init__(self, vispy_instance, object):
         super().__init__()
         # make a copy of the object to be able to restore the old state
         self.vispy_instance = vispy_instance
 
-        # if object is a control point, get the whole object
-        self.object = vispy_instance.get_full_object(object)
+        # if object is a control point, get the whole object, only its uid
+        # is kept as it is created again when 'delete all objects' is undone
+        self.uid = vispy_instance.get_full_object(object).uid
 
         # for redoing
         self.redoing = False
         if isinstance(self.object, (EditLineVisual, EditPolygonVisual)):
             self.coords = None
-            self.old_coords = object.coords.copy()
+            self.old_coords = self.object.coords.copy()
         elif isinstance(self.object, (EditEllipseVisual, EditRectVisual)):
             
             self.center = None
@@ -1068,6 +1406,28 @@ class MoveObjectCommand(QUndoCommand):
             self.old_angle = self.object.angle
         # for undoing
 
+    @property
+    def object(self):
+        return self.vispy_instance.data_handler.object_store.objects[self.uid]
+
+    def id(self):
+        return self.MERGE_ID
+
+    def mergeWith(self, other):
+        """Take over the end state of a following move of the same object."""
+        if other.uid != self.uid:
+            return False
+        if isinstance(self.object, (EditLineVisual, EditPolygonVisual)):
+            self.coords = other.coords
+        elif isinstance(self.object, (EditEllipseVisual, EditRectVisual)):
+            self.center = other.center
+            self.height = other.height
+            self.width = other.width
+            self.angle = other.angle
+        # the object was moved back to where it started
+        self.setObsolete(not self.check_movement())
+        return True
+
     def undo(self):
         self.vispy_instance.data_handler.logger.info("Undoing move object")
 
@@ -1180,6 +1540,9 @@ class FindScalingBarWidthCommand(QUndoCommand):
 
 
 class CreateObjectCommand(QUndoCommand):
+    """Creates an object. Only its uid is kept while it exists and its
+    saved state once it is undone, it is created again from the state."""
+
     def __init__(self, vispy_canvas, new_object, pos, selected, structure_name):
         super().__init__()
         self.vispy_canvas = vispy_canvas
@@ -1187,33 +1550,82 @@ class CreateObjectCommand(QUndoCommand):
         self.pos = pos
         self.selected = selected
         self.structure_name = structure_name
-        self.parent = new_object.parent
+        self.uid = None
+        self.states = None
 
     def undo(self):
         # Delete object
         self.vispy_canvas.data_handler.logger.info("Undoing create object")
-        self.vispy_canvas.delete_object(self.new_object)
+        object = self.vispy_canvas.data_handler.object_store.objects[self.uid]
+        self.states = self.vispy_canvas.saved_states([object])
+        self.vispy_canvas.delete_object(object)
 
     def redo(self):
 
-        # when it is an undo->redo operation some parameters are set
-        if self.new_object and self.new_object.parent is None:
+        # when it is an undo->redo operation the object is created again
+        if self.new_object is None:
+            self.new_object, = self.vispy_canvas.restore_objects(self.states)
             self.selected = False
-            self.new_object.parent = self.parent
             self.pos = None
 
         # Create object
         self.structure_name = self.vispy_canvas.create_new_object(
             self.new_object, self.pos, self.selected, self.structure_name
         )
+        self.uid = self.new_object.uid
+        self.new_object = None
+
+
+class CreateObjectsCommand(QUndoCommand):
+    """Creates many objects of a structure as one undo step.
+
+    Args:
+        vispy_canvas (VispyCanvas): the canvas
+        states (list[tuple[str, dict]]): class name and state in image
+            pixel coordinates of every object
+        structure_name (str): name of the structure
+    """
+
+    def __init__(self, vispy_canvas, states, structure_name):
+        super().__init__()
+        self.vispy_canvas = vispy_canvas
+        self.structure_name = structure_name
+
+        origin = self.vispy_canvas.origin
+        object_states = list()
+        for type_name, state in states:
+            state = dict(state)
+            # objects are placed relative to the origin of the image
+            for key in ("center", "coords"):
+                if key in state:
+                    state[key] = np.asarray(state[key], dtype=np.float64) - origin
+            object_states.append((None, type_name, state))
+        # the objects are only kept as their states, see DeleteObjectCommand
+        self.states = object_states
+
+    def undo(self):
+        self.vispy_canvas.data_handler.logger.info(f"Undoing create {len(self.states)} objects")
+        objects = self.vispy_canvas.data_handler.object_store.objects
+        objects = [objects[uid] for uid, _, _ in self.states]
+        self.states = self.vispy_canvas.saved_states(objects)
+        self.vispy_canvas.delete_objects(objects)
+
+    def redo(self):
+        objects = self.vispy_canvas.restore_objects(self.states)
+        self.vispy_canvas.create_objects(objects, self.structure_name)
+        self.states = [(obj.uid, type_name, state) for obj, (_, type_name, state) in zip(objects, self.states)]
 
 
 class UpdateObjectCommand(QUndoCommand):
+    # consecutive edits of a property of the same object are merged
+    MERGE_ID = 2
+
     def __init__(self, vispy_canvas, obj, prop, value, scaling_factor, old_value):
         super().__init__()
 
         self.vispy_canvas = vispy_canvas
-        self.obj = obj
+        # only the uid is kept, see MoveObjectCommand
+        self.uid = obj.uid
         self.prop = prop
         self.value = value
         self.scaling_factor = scaling_factor
@@ -1221,6 +1633,24 @@ class UpdateObjectCommand(QUndoCommand):
 
         if scaling_factor is None:
             self.scaling_factor = 1
+
+    @property
+    def obj(self):
+        return self.vispy_canvas.data_handler.object_store.objects[self.uid]
+
+    def id(self):
+        return self.MERGE_ID
+
+    def mergeWith(self, other):
+        """Take over the value of a following edit of the same property."""
+        if (
+            other.uid != self.uid
+            or other.prop != self.prop
+            or other.scaling_factor != self.scaling_factor
+        ):
+            return False
+        self.value = other.value
+        return True
     
     def undo(self):
         
@@ -1258,12 +1688,18 @@ class RemovePointCommand(QUndoCommand):
 
     def __init__(self, vispy_canvas, object):
         super().__init__()
-        self.object = object
-        self.delete_index = object.control_points.index(object.selected_cp)
+        # only the uid is kept, see MoveObjectCommand
+        self.uid = vispy_canvas.get_full_object(object).uid
+        self.delete_index = object.get_selected_index()
         self.old_point = None
         self.vispy_canvas = vispy_canvas
         self.continue_adding_points = object.continue_adding_points
 
+    @property
+    def object(self):
+        """The control points the points are added to and removed from."""
+        return self.vispy_canvas.data_handler.object_store.objects[self.uid].control_points
+
     def undo(self):
         # Show the object
         self.vispy_canvas.data_handler.logger.debug(
@@ -1278,19 +1714,25 @@ class RemovePointCommand(QUndoCommand):
         self.vispy_canvas.data_handler.logger.debug(
             f"Redoing remove point at index {self.delete_index}"
         )
-        self.old_point = self.object.coords[self.delete_index]
+        self.old_point = self.object.coords[self.delete_index].copy()
         self.object.remove_point(self.delete_index)
 
 class AddPointCommand(QUndoCommand):
 
     def __init__(self, vispy_canvas, object, point):
         super().__init__()
-        self.object = object
+        # only the uid is kept, see MoveObjectCommand
+        self.uid = vispy_canvas.get_full_object(object).uid
         self.add_index = object.get_selected_index() + 1
         self.point = point
         self.vispy_canvas = vispy_canvas
         self.redoing = False
 
+    @property
+    def object(self):
+        """The control points the points are added to and removed from."""
+        return self.vispy_canvas.data_handler.object_store.objects[self.uid].control_points
+
     def undo(self):
         # remove movable point on undo
         self.object.continue_adding_points = False
@@ -1298,7 +1740,7 @@ class AddPointCommand(QUndoCommand):
             f"Undoing adding point at index {self.add_index}"
         )
         if self.add_index < len(self.object.coords):
-            self.point = self.object.coords[self.add_index]
+            self.point = self.object.coords[self.add_index].copy()
             self.object.remove_point(self.add_index)
 
     def redo(self):
@@ -10,10 +10,12 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QColorDialog,
     QComboBox,
+    QSpinBox,
     QTabWidget,
     QPlainTextEdit,
     QStyleFactory,
     QDialog,
+    QMessageBox,
 )
 from PySide6.QtGui import QIcon, QGuiApplication, QColor, QTextCursor, QImage, QPixmap,\
     qRed, qGreen, qBlue, qAlpha, qRgba
@@ -318,6 +320,16 @@ class SettingsWindow(MeasuryWindow):
         self.clearUndoHistButton.clicked.connect(self.parent.reset_undo_stack)
         self.misc_layout.addWidget(self.clearUndoHistButton)
 
+        self.undo_limit_layout = QHBoxLayout()
+        self.undo_limit_label = QLabel("Undo Steps (0 = unlimited)", self)
+        self.undo_limit_layout.addWidget(self.undo_limit_label)
+        self.undo_limit_sb = QSpinBox(self)
+        self.undo_limit_sb.setRange(0, 100000)
+        self.undo_limit_sb.setValue(self.settings.value("misc/undo_limit", type=int))
+        self.undo_limit_sb.valueChanged.connect(self.update_window)
+        self.undo_limit_layout.addWidget(self.undo_limit_sb)
+        self.misc_layout.addLayout(self.undo_limit_layout)
+
         self.file_extensions_layout = QHBoxLayout()
         self.file_extensions_label = QLabel("File Extensions", self)
         self.file_extensions_layout.addWidget(self.file_extensions_label)
@@ -454,6 +466,7 @@ class SettingsWindow(MeasuryWindow):
         
         file_ext_string = ";".join(settings.get("misc/file_extensions"))
         self.file_extensions.setText(file_ext_string)
+        self.undo_limit_sb.setValue(settings.get("misc/undo_limit"))
         self.update_window()
 
     def reset_to_defaults(self):
@@ -479,6 +492,7 @@ class SettingsWindow(MeasuryWindow):
             "ui/microscope": self.default_microscope_dd.currentText(),
             "ui/show_both_scaling": self.show_both_scaling_cb.isChecked(),
             "misc/file_extensions": self.file_extensions.text().split(";"),
+            "misc/undo_limit": self.undo_limit_sb.value(),
         }
 
     def save(self):
@@ -489,6 +503,18 @@ class SettingsWindow(MeasuryWindow):
 
         # update the window and the color palette
         self.parent.update_style()
+        if not self.parent.update_undo_limit():
+            reply = QMessageBox.question(
+                self,
+                "Undo Steps",
+                "The number of undo steps can only be changed together with "
+                "clearing the undo history.\n\nDo you want to clear it now? "
+                "Otherwise the new number is used once the history is cleared.",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No,
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self.parent.reset_undo_stack()
 
         self.update_window()
         # update color of the scalebar if it has been drawn
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def sessions_dir(tmp_path, monkeypatch):
+    """Keep the journal sessions of the tests out of the home directory."""
+    from measury import journal
+
+    monkeypatch.setattr(journal, "SESSIONS_DIR", tmp_path/"sessions")
+    return journal.SESSIONS_DIR
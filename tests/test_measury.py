@@ -1,7 +1,10 @@
 from measury.app import App
+from measury.vispy_canvas import VispyCanvas
 from pathlib import Path
 import pytest
 from numpy import __version__ as np_version
+import numpy as np
+import cv2
 
 if np_version[0] == "2":
     test_files = ["test_image.tif", "test_file.msry", "test_file_2.msry"]
@@ -36,6 +39,469 @@ def test_open_file(file):
     app.data_handler.open_file(Path(__file__).parent/"test_data"/file)
     app.close()
 
+def test_open_file_in_background(monkeypatch):
+
+    monkeypatch.setattr(VispyCanvas, "ASYNC_DECODE_MIN_BYTES", 0)
+    app = App()
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    app.data_handler.open_file(Path(__file__).parent/"test_data"/test_files[-1])
+    app.main_window.vispy_canvas.wait_for_image()
+    assert app.data_handler.img_data is not None
+    assert not app.main_window.vispy_canvas.start_state
+    app.close()
+
+def test_tiled_image(monkeypatch):
+
+    monkeypatch.setattr(VispyCanvas, "TILED_IMAGE_MIN_SIZE", 512)
+    app = App(file_path=Path(__file__).parent/"test_data"/"test_image.tif")
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    assert canvas.tiled
+    tiled_image = canvas.tiled_image
+    tiled_image.tile_size = 256
+    tiled_image.update_view((0, 1280), (0, 1024), scale=4)
+    assert tiled_image.current_level == 2
+    assert all(key[0] == 2 for key, tile in tiled_image.tiles.items() if tile.visible)
+    tiled_image.update_view((0, 300), (0, 300), scale=1)
+    assert tiled_image.tiles[(0, 0, 0)].visible
+    app.close()
+
+def test_open_mapped_image(tmp_path):
+
+    img = (np.arange(300*400).reshape(300, 400) % 256).astype(np.uint8)
+    cv2.imwrite(str(tmp_path/"image.tif"), img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    app = App(file_path=tmp_path/"image.tif")
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    assert not app.data_handler.img_data.flags.writeable
+    assert app.data_handler.img_data.shape == (300, 400, 3)
+    app.main_window.vispy_canvas.rotate_image()
+    app.vispy_app.process_events()
+    app.close()
+
+def test_storage_file_round_trip(tmp_path):
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    drawing_data = app.data_handler.drawing_data
+    counts = {key: len(val) for key, val in drawing_data.items()}
+    states = {key: [obj.save() for obj in val] for key, val in drawing_data.items()}
+    app.data_handler.write_storage_file(tmp_path/"stored.msry")
+    app.data_handler.drawing_data = dict()
+    app.data_handler.open_file(tmp_path/"stored.msry")
+    app.vispy_app.process_events()
+    drawing_data = app.data_handler.drawing_data
+    assert {key: len(val) for key, val in drawing_data.items()} == counts
+    for key, val in drawing_data.items():
+        for obj, state in zip(val, states[key]):
+            for name, value in obj.save().items():
+                assert np.allclose(value, state[name])
+
+    # saving to the open file replaces the file the image is mapped from
+    image = bytes(app.data_handler.img_byte_stream)
+    old_storage_file = app.data_handler.storage_file
+    app.data_handler.write_storage_file(tmp_path/"stored.msry")
+    assert app.data_handler.storage_file is not old_storage_file
+    assert bytes(app.data_handler.img_byte_stream) == image
+    app.close()
+
+def test_save_mapped_storage_file(tmp_path, monkeypatch):
+
+    from PySide6.QtWidgets import QMessageBox
+    from measury.image_io import is_mapped
+
+    monkeypatch.setattr(QMessageBox, "warning", lambda *args: QMessageBox.StandardButton.Yes)
+    img_data = np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    np.save(tmp_path/"image.npy", img_data)
+    app = App(file_path=tmp_path/"image.npy")
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    data_handler = app.data_handler
+    data_handler.write_storage_file(tmp_path/"image.msry")
+    data_handler.open_file(tmp_path/"image.msry")
+    app.vispy_app.process_events()
+    assert is_mapped(data_handler.raw_img_data)
+
+    # the pixels are mapped from the new file once the old one is closed
+    storage_file = data_handler.storage_file
+    data_handler.write_storage_file(tmp_path/"image.msry")
+    assert storage_file._mapped_file is None
+    assert is_mapped(data_handler.raw_img_data)
+    assert np.array_equal(data_handler.raw_img_data, img_data)
+
+    # the pixels of the previous file are dropped before it is closed
+    storage_file = data_handler.storage_file
+    data_handler.open_file(tmp_path/"image.npy")
+    app.vispy_app.process_events()
+    assert storage_file._mapped_file is None
+    assert np.array_equal(data_handler.raw_img_data, img_data)
+
+    # the image is kept when it is not stored anymore
+    data_handler.open_file(tmp_path/"image.msry")
+    app.vispy_app.process_events()
+    storage_file = data_handler.storage_file
+    data_handler.write_storage_file(tmp_path/"image.msry", save_image=False)
+    assert storage_file._mapped_file is None
+    assert data_handler.storage_file is None
+    assert np.array_equal(data_handler.raw_img_data, img_data)
+    app.close()
+
+def test_load_many_objects(tmp_path, monkeypatch):
+
+    from measury.drawable_objects import EditEllipseVisual
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    canvas.create_objects(
+        [EditEllipseVisual(settings=app.main_window.settings, center=center, radius=np.array([5., 3.]))
+         for center in np.random.default_rng(0).uniform(0, 500, (50, 2))],
+        "particles")
+    counts = {key: len(val) for key, val in app.data_handler.drawing_data.items()}
+    app.data_handler.write_storage_file(tmp_path/"many.msry")
+
+    # the objects are not added one by one
+    monkeypatch.setattr(canvas, "create_new_object", None)
+    messages = []
+    monkeypatch.setattr(app.data_handler.logger, "info", messages.append)
+    app.data_handler.drawing_data = dict()
+    app.data_handler.open_file(tmp_path/"many.msry")
+    app.vispy_app.process_events()
+    assert {key: len(val) for key, val in app.data_handler.drawing_data.items()} == counts
+    assert any("objects/s" in message for message in messages)
+    assert not any(obj.selected for obj in app.data_handler.object_store)
+
+    # structures without a name get one like objects that are drawn
+    state = dict(center=np.array([5., 5.]), radius=np.array([2., 1.]))
+    app.data_handler.drawing_data = dict()
+    app.data_handler.load_objects({"": [(EditEllipseVisual, state)], " ": [(EditEllipseVisual, state)]})
+    assert list(app.data_handler.drawing_data) == ["structure_001", "structure_002"]
+    app.close()
+
+def test_coalesced_selection_update(monkeypatch):
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    canvas.select(next(iter(app.data_handler.drawing_data.values()))[0])
+
+    calls = []
+    monkeypatch.setattr(app.main_window.right_ui, "update_intensity_plot", lambda resize=True, draft=False: calls.append(draft))
+    for _ in range(10):
+        canvas.schedule_selection_update()
+    while canvas.update_timer.isActive():
+        app.vispy_app.process_events()
+    assert calls == [True]
+    canvas.flush_selection_update()
+    assert calls == [True, False]
+    canvas.flush_selection_update()
+    assert calls == [True, False]
+    app.close()
+
+def test_object_at():
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    tr = canvas.scene.node_transform(canvas.view.scene)
+    for structure, objects in app.data_handler.drawing_data.items():
+        for index, obj in enumerate(objects):
+            assert app.data_handler.find_object(obj) == (structure, index)
+            pos = tr.imap(obj.control_points.get_center())[:2]
+            assert canvas.object_at(pos) in [o.form for o in app.data_handler.object_store]
+
+    obj = app.data_handler.drawing_data["line"][0]
+    canvas.select(obj)
+    pos = tr.imap(obj.control_points.coords[0])[:2]
+    assert canvas.object_at(pos) == obj.control_points.control_point(0)
+
+    # the moved control point is picked at its new position
+    obj.control_points.coords[1] += 5
+    obj.control_points.update_points()
+    pos = tr.imap(obj.control_points.coords[1])[:2]
+    assert canvas.object_at(pos) == obj.control_points.control_point(1)
+    app.close()
+
+def test_shape_collection():
+
+    from measury.drawable_objects import EditEllipseVisual
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    n = canvas.COLLECTION_MIN_OBJECTS
+    for center in np.random.default_rng(0).uniform(0, 500, (n, 2)):
+        canvas.create_new_object(
+            EditEllipseVisual(parent=canvas.view.scene, settings=app.main_window.settings,
+                              center=center, radius=np.array([5., 3.])),
+            structure_name="particles")
+    canvas.update_collections()
+    collection = canvas.collections["particles"]
+    objects = app.data_handler.drawing_data["particles"]
+    assert len(collection) == n and not any(obj.visible for obj in objects)
+    assert "line" not in canvas.collections
+
+    # the selected object is drawn by itself
+    canvas.select(objects[0])
+    canvas.update_collections()
+    assert objects[0].visible and collection.records["live"].sum() == 1
+    objects[0].set_center(np.array([1., 1.]))
+    canvas.unselect()
+    canvas.update_collections()
+    assert not objects[0].visible
+    assert np.allclose(collection.points[:64].mean(axis=0), [1, 1], atol=1e-3)
+
+    canvas.delete_object(objects[0])
+    canvas.update_collections()
+    assert "particles" not in canvas.collections and all(obj.visible for obj in objects)
+    app.close()
+
+def test_transform_all_objects():
+
+    from measury.drawable_objects import EditEllipseVisual, EditRectVisual
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    for center in np.random.default_rng(0).uniform(0, 500, (canvas.COLLECTION_MIN_OBJECTS, 2)):
+        canvas.create_new_object(
+            EditEllipseVisual(parent=canvas.view.scene, settings=app.main_window.settings,
+                              center=center, radius=np.array([5., 3.])),
+            structure_name="particles")
+    canvas.update_collections()
+    objects = list(app.data_handler.object_store)
+    states = [obj.save() for obj in objects]
+
+    canvas.move_all_objects(np.array([10., -20.]))
+    particles = app.data_handler.drawing_data["particles"]
+    assert np.allclose(particles[0].save()["center"], states[-len(particles)]["center"] + [10, -20])
+    # objects drawn by a collection update their visuals once they are selected
+    assert particles[0].visuals_outdated
+    canvas.select(particles[0])
+    assert not particles[0].visuals_outdated
+    assert np.allclose(particles[0].form.center, particles[0].center)
+    canvas.unselect()
+
+    canvas.move_all_objects(np.array([-10., 20.]))
+
+    # one rotation turns the outline of every object with the image
+    from measury import measurements
+    from measury.drawable_objects import box_corners
+
+    def outline(obj):
+        state = obj.save()
+        if "coords" in state:
+            return np.asarray(state["coords"], dtype=np.float64)
+        size = 2 * state["radius"] if "radius" in state else (state["width"], state["height"])
+        # the corners are compared in any order
+        return np.array(sorted(map(tuple, box_corners(state["center"], *size, state["angle"]).round(6))))
+
+    matrix = measurements.rotation_matrix(90, app.data_handler.img_shape)
+    origin = canvas.origin
+    outlines = [outline(obj) + origin for obj in objects]
+    canvas.rotate_image()
+    for obj, old_outline in zip(objects, outlines):
+        expected = old_outline @ matrix[:2, :2].T + matrix[:2, 2] - canvas.origin
+        if "coords" not in obj.save():
+            expected = np.array(sorted(map(tuple, expected.round(6))))
+        assert np.allclose(outline(obj), expected, atol=1e-5)
+
+    for _ in range(3):
+        canvas.rotate_image()
+    for obj, state in zip(objects, states):
+        for name, value in obj.save().items():
+            if name == "angle":
+                assert np.isclose(np.cos(value - state[name]), 1)
+            else:
+                assert np.allclose(value, state[name])
+
+    # hiding the arrows only touches the rectangles that show one
+    rect = next(obj for obj in objects if isinstance(obj, EditRectVisual))
+    rect.show_arrow()
+    assert set(EditRectVisual.shown_arrows) == {rect}
+    canvas.hide_arrows()
+    assert not rect.arrow.visible and not EditRectVisual.shown_arrows
+    # showing them only looks at the rectangles
+    rects = [obj for obj in objects if isinstance(obj, EditRectVisual)]
+    assert sorted(app.data_handler.object_store.objects_of_type(EditRectVisual), key=id) == sorted(rects, key=id)
+    canvas.show_arrows()
+    assert set(EditRectVisual.shown_arrows) == set(rects)
+    canvas.hide_arrows()
+    app.close()
+
+def test_export_measurements_table(tmp_path, monkeypatch):
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    monkeypatch.setattr(app.data_handler, "save_file_dialog", lambda **kwargs: tmp_path/"table.csv")
+    app.data_handler.export_measurements_table()
+    with open(tmp_path/"table.csv", encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    assert len(lines) == 1 + sum(len(objects) for objects in app.data_handler.drawing_data.values())
+    app.close()
+
+@pytest.mark.parametrize("shape", ["ellipse", "polygon"])
+def test_detect_particles(tmp_path, shape):
+
+    from PySide6.QtCore import QThreadPool
+
+    img = np.zeros((300, 400, 3), dtype=np.uint8)
+    centers = [(60, 60), (200, 150), (320, 220)]
+    for center in centers:
+        cv2.circle(img, center, 15, (255, 255, 255), -1)
+    cv2.imwrite(str(tmp_path/"particles.png"), img)
+
+    app = App(file_path=tmp_path/"particles.png")
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    canvas.detect_particles(shape=shape)
+    QThreadPool.globalInstance().waitForDone()
+    app.vispy_app.process_events()
+
+    objects = app.data_handler.drawing_data[canvas.detection_structure]
+    assert len(objects) == len(centers)
+    found = sorted(tuple(np.mean(obj.extent(), axis=0) + canvas.origin) for obj in objects)
+    assert np.allclose(found, centers, atol=2)
+    app.main_window.undo_stack.undo()
+    assert canvas.detection_structure not in app.data_handler.drawing_data
+    app.main_window.undo_stack.redo()
+    assert len(app.data_handler.drawing_data[canvas.detection_structure]) == len(centers)
+    app.close()
+
+def test_undo_merge_and_delete_all():
+
+    from measury.vispy_canvas import MoveObjectCommand
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    canvas = app.main_window.vispy_canvas
+    undo_stack = app.main_window.undo_stack
+    undo_stack.clear()
+    obj = next(iter(app.data_handler.object_store))
+    center = np.array(obj.center, dtype=np.float64)
+
+    # consecutive moves of the same object are one undo step
+    for shift in ([5, 0], [0, 5]):
+        command = MoveObjectCommand(canvas, obj)
+        obj.set_center(np.array(obj.center) + shift)
+        obj.update_from_controlpoints()
+        undo_stack.push(command)
+    assert undo_stack.count() == 1
+    undo_stack.undo()
+    assert np.allclose(obj.center, center)
+    undo_stack.redo()
+    assert np.allclose(obj.center, center + 5)
+
+    # deleted objects are created again from their states
+    import gc, weakref
+    states = {
+        name: [obj.save() for obj in objects]
+        for name, objects in app.data_handler.drawing_data.items()
+    }
+    uid, deleted = obj.uid, weakref.ref(obj)
+    del obj, command
+    app.data_handler.delete_all_objects_w_undo()
+    assert not app.data_handler.drawing_data
+    # the move on the stack does not keep the deleted visual alive
+    assert isinstance(undo_stack.command(0), MoveObjectCommand)
+    gc.collect()
+    assert deleted() is None
+    undo_stack.undo()
+    assert list(app.data_handler.drawing_data) == list(states)
+    for name, objects in app.data_handler.drawing_data.items():
+        for new_obj, state in zip(objects, states[name]):
+            for key, value in state.items():
+                assert np.allclose(new_obj.save()[key], value)
+
+    # the move before deleting acts on the new object
+    undo_stack.undo()
+    assert np.allclose(app.data_handler.object_store.objects[uid].center, center)
+
+    # deleting and creating objects works with the uids of the objects
+    from measury.drawable_objects import EditRectVisual
+    canvas.delete_object_w_undo(app.data_handler.object_store.objects[uid])
+    rect = EditRectVisual(settings=app.main_window.settings, parent=canvas.view.scene, center=np.array([50., 50.]), width=20, height=10)
+    canvas.create_new_object_w_undo(rect)
+    created = undo_stack.command(undo_stack.count() - 1).uid
+    undo_stack.undo()
+    assert created not in app.data_handler.object_store.objects
+    undo_stack.undo()
+    assert np.allclose(app.data_handler.object_store.objects[uid].center, center)
+    undo_stack.redo()
+    undo_stack.redo()
+    assert uid not in app.data_handler.object_store.objects
+    assert created in app.data_handler.object_store.objects
+    app.close()
+
+def test_undo_limit(monkeypatch):
+
+    from PySide6.QtWidgets import QMessageBox
+    from measury.windows import SettingsWindow
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    main_window = app.main_window
+    settings = main_window.settings
+    # the settings are not written to the settings of the user
+    value = settings.value
+    monkeypatch.setattr(settings, "save", lambda key, new_value: None)
+    monkeypatch.setattr(settings, "value", lambda key, *args, **kwargs: 3 if key == "misc/undo_limit" else value(key, *args, **kwargs))
+    settings_window = SettingsWindow(parent=main_window)
+    main_window.undo_stack.clear()
+    main_window.vispy_canvas.rotate_image_w_undo()
+    assert main_window.undo_stack.count() == 1
+
+    # the user is asked to clear the history for the new limit
+    replies = [QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes]
+    monkeypatch.setattr(QMessageBox, "question", lambda *args: replies.pop(0))
+    settings_window.save()
+    assert main_window.undo_stack.undoLimit() != 3 and main_window.undo_stack.count() == 1
+    settings_window.save()
+    assert main_window.undo_stack.undoLimit() == 3 and main_window.undo_stack.count() == 0
+    app.close()
+
+def test_profile_startup():
+
+    import io
+    from measury.startup_profile import profile_startup, STARTUP_MODULES
+
+    output = io.StringIO()
+    times = profile_startup(file=output)
+    assert [name for name, _ in times] == STARTUP_MODULES + ["main window"]
+    assert "total" in output.getvalue()
+
+def test_scaling_from_metadata(tmp_path):
+
+    img = np.zeros((100, 200, 3), dtype=np.uint8)
+    _, encoded = cv2.imencode(".png", img)
+    footer = b"\n<ImageTags><Scan><PixelSize>2.5 nm</PixelSize></Scan></ImageTags>\x00\n"
+    (tmp_path/"orion.png").write_bytes(encoded.tobytes() + footer)
+
+    app = App(file_path=tmp_path/"orion.png")
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    main_ui = app.main_window.main_ui
+    assert main_ui.dd_select_micop.currentText() == "Zeiss_Orion_Nanofab"
+    assert main_ui.units_dd.currentText() == "nm"
+    assert main_ui.scaling_factor == pytest.approx(2.5)
+    # no scale bar is searched when the metadata gives the pixel size
+    main_ui.reset_scaling()
+    main_ui.automatic_scaling()
+    assert main_ui.scaling_factor == pytest.approx(2.5)
+    app.close()
+
 def test_identify_scaling():
 
     app = App()
@@ -72,6 +538,32 @@ def test_settings_page():
     app.main_window.open_settings_page()
     app.vispy_app.process_events()
     app.close()
+
+def test_settings_snapshot():
+
+    from PySide6.QtGui import QColor
+    from measury.drawable_objects import EditEllipseVisual
+
+    app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    settings = app.main_window.settings
+    assert settings.snapshot is settings.snapshot
+    app.main_window.open_settings_page()
+    window = app.main_window.about_window
+    previous = window.current_selection
+    try:
+        window.color_picker.selectedColor = QColor(0, 0, 255, 51)
+        window.save()
+        # the snapshot is read again after saving and the objects are recolored
+        assert settings.snapshot.object_color == (0, 0, 1, 0.2)
+        assert app.main_window.vispy_canvas.object_colors[0] == (0, 0, 1, 0.2)
+        ellipse = next(obj for obj in app.data_handler.object_store if isinstance(obj, EditEllipseVisual))
+        assert np.allclose(ellipse.form.color.rgba, (0, 0, 1, 0.2))
+    finally:
+        window.set_settings(previous)
+        window.save()
+    app.close()
     
 def test_data_page():
 
@@ -87,9 +579,110 @@ def test_image_rotation():
     app = App(file_path=Path(__file__).parent/"test_data"/test_files[-1])
     app.run(run_vispy=False)
     app.vispy_app.process_events()
+    shape = app.data_handler.image_cache.gray.shape
+    raw_img_data = app.data_handler.raw_img_data
     app.main_window.vispy_canvas.rotate_image()
     app.vispy_app.process_events()
+    # only the view is rotated, the rotated pixels are created on first use
+    assert app.data_handler.raw_img_data is raw_img_data
+    assert app.data_handler._img_data is None
+    assert app.data_handler.img_shape == shape[::-1]
+    # the cached grayscale image follows the rotation
+    assert app.data_handler.image_cache.gray.shape == shape[::-1]
     app.main_window.vispy_canvas.rotate_image(direction="counterclockwise")
     app.vispy_app.process_events()
     app.close()
-    
\ No newline at end of file
+    
+def test_journal(tmp_path, monkeypatch):
+
+    import shutil
+    from measury import journal
+    from measury.vispy_canvas import MoveObjectCommand
+
+    file_path = tmp_path/test_files[-1]
+    shutil.copy(Path(__file__).parent/"test_data"/test_files[-1], file_path)
+    app = App(file_path=file_path)
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    app.main_window.vispy_canvas.wait_for_image()
+    canvas = app.main_window.vispy_canvas
+    data_handler = app.data_handler
+    path = data_handler.object_journal.path
+    assert path.exists()
+
+    def states(structures):
+        return {name: [obj.save() for obj in objects] for name, objects in structures.items()}
+
+    def assert_equal(structures, expected):
+        assert list(structures) == list(expected)
+        for name, objects in structures.items():
+            for state, expected_state in zip(objects, expected[name], strict=True):
+                for key, value in state.items():
+                    assert np.allclose(value, expected_state[key])
+
+    # every command is written to the journal
+    obj = next(iter(data_handler.object_store))
+    command = MoveObjectCommand(canvas, obj)
+    obj.set_center(np.array(obj.center) + 5)
+    obj.update_from_controlpoints()
+    app.main_window.undo_stack.push(command)
+    canvas.delete_object_w_undo(next(iter(data_handler.drawing_data.values()))[-1])
+    expected = states(data_handler.drawing_data)
+    recovered = journal.read_journal(path)
+    assert_equal({name: [state for _, state in objects] for name, objects in recovered.structures.items()}, expected)
+
+    # the measurements of a crashed session are offered to be restored
+    offered = []
+    monkeypatch.setattr(journal, "process_alive", lambda pid: False)
+    monkeypatch.setattr(app.main_window, "offer_recovery", offered.append)
+    data_handler.object_journal.close(remove=False)
+    data_handler.object_journal = None
+    crashed = path.read_text()
+    data_handler.start_journal()
+    assert len(offered) == 1
+    # the journal is kept until the user decided
+    assert data_handler.object_journal is None
+    assert path.read_text() == crashed
+    broken = offered[0]._replace(structures={"s": [("UnknownVisual", {})]})
+    with pytest.raises(Exception):
+        data_handler.restore_journal(broken)
+    assert path.read_text() == crashed
+    data_handler.delete_all_objects()
+    data_handler.restore_journal(offered[0])
+    assert_equal(states(data_handler.drawing_data), expected)
+    assert data_handler.object_journal is not None
+    assert_equal(
+        {name: [state for _, state in objects] for name, objects in journal.read_journal(path).structures.items()},
+        expected,
+    )
+
+    app.close()
+    assert not path.exists()
+
+def test_offer_crashed_sessions(monkeypatch):
+
+    import os
+    from PySide6.QtWidgets import QMessageBox
+    from measury import journal
+    from measury.object_store import ObjectStore
+
+    app = App()
+    app.run(run_vispy=False)
+    app.vispy_app.process_events()
+    sessions = journal.SESSIONS_DIR
+    journals = []
+    for name in ("old.tif", "new.tif"):
+        log = journal.Journal(ObjectStore(), sessions.parent/name)
+        log.close(remove=False)
+        journals.append(log.path)
+    os.utime(journals[0], (0, 0))
+    monkeypatch.setattr(journal, "process_alive", lambda pid: False)
+
+    # only the offered session is removed when it is declined
+    app.main_window.offer_crashed_sessions()
+    assert "new.tif" in app.main_window.recovery_box.text()
+    app.main_window.recovery_box.done(QMessageBox.StandardButton.No)
+    app.vispy_app.process_events()
+    assert not journals[1].exists() and not journal.pointer_path(journals[1]).exists()
+    assert journal.crashed_sessions() == [journals[0]]
+    app.close()
@@ -1,5 +1,511 @@
 import measury.data.microscopes as mscop
+from measury import image_io, storage
+import numpy as np
+import cv2
+import pytest
+from pathlib import Path
+
+
+class Line:
+    """A line for the ObjectStore and its observers, without a visual."""
+    uid = None
+    on_geometry_change = None
+    def __init__(self, coords):
+        self.coords = np.array(coords, dtype=np.float64)
+    def extent(self):
+        return self.coords.min(axis=0), self.coords.max(axis=0)
+    def output_properties(self):
+        from measury import measurements
+        return measurements.line_properties(self.coords)
+    def save(self):
+        return dict(coords=self.coords)
+    def move(self, offset):
+        self.coords = self.coords + offset
+        self.on_geometry_change(self)
 
 def test_microscope():
     
-    mscop.load_microscopes()
\ No newline at end of file
+    mscop.load_microscopes()
+
+def test_microscope_profiles(tmp_path, monkeypatch):
+
+    (tmp_path/"lab.toml").write_text(
+        '[Hitachi_SU8230]\nseed_points = [0.05, 0.95]\norientation = "vertical"\nthreshold = 7\n',
+        encoding="utf-8",
+    )
+    (tmp_path/"orion.json").write_text(
+        '{"Orion_Copy": {"seed_points": [0.7, 0.9], "metadata": "xml_footer"}}', encoding="utf-8"
+    )
+    monkeypatch.setattr(mscop, "PROFILE_DIRS", [tmp_path])
+    mscop.load_microscopes.cache_clear()
+    try:
+        microscopes = mscop.load_microscopes()
+        # the profiles are only found once
+        assert mscop.load_microscopes() is microscopes
+        assert "Zeiss_Orion_Nanofab" in microscopes
+        hitachi = microscopes["Hitachi_SU8230"]()
+        assert (hitachi.seed_points, hitachi.orientation, hitachi.threshold) == ((0.05, 0.95), "vertical", 7)
+        footer = b"\n<Root><a>1</a></Root>\x00\n"
+        assert '"a": "1"' in microscopes["Orion_Copy"]().get_metadata(footer)
+
+        # unchanged files are not parsed again
+        hits = mscop.read_profile_file.cache_info().hits
+        mscop.load_microscopes.cache_clear()
+        mscop.load_microscopes()
+        assert mscop.read_profile_file.cache_info().hits == hits + 2
+    finally:
+        mscop.load_microscopes.cache_clear()
+
+def test_microscope_footer():
+
+    items = "".join(f"<item{i}>{i}</item{i}>" for i in range(20000))
+    byte_stream = b"\x89PNG\r\n" + bytes(range(256)) * 100 + f"\n<Root>{items}</Root>\x00\n".encode()
+    microscope = mscop.Zeiss_Orion_Nanofab()
+    values = microscope.get_xml(byte_stream)
+    assert values["item19999"] == "19999"
+    # the footer of the same image is only parsed once
+    hits = mscop.parse_xml.cache_info().hits
+    assert microscope.get_xml(bytearray(byte_stream)) is values
+    assert mscop.parse_xml.cache_info().hits == hits + 1
+
+def test_last_line(monkeypatch):
+
+    footer = b"<Root><a>1</a></Root>\x00\n"
+    byte_stream = bytes(range(256)) * 1000 + b"\n" + footer
+    # memory views are searched without copying them
+    assert mscop.get_last_line(memoryview(byte_stream)[10:]) == "<Root><a>1</a></Root>"
+    assert mscop.get_last_line(footer) == "<Root><a>1</a></Root>"
+    assert mscop.get_last_line(b"") == ""
+    # the footer is searched in chunks
+    monkeypatch.setattr(mscop, "FOOTER_CHUNK_BYTES", 7)
+    assert mscop.get_last_line(byte_stream) == "<Root><a>1</a></Root>"
+    # a file without a line break has no footer
+    monkeypatch.setattr(mscop, "MAX_FOOTER_BYTES", 1000)
+    assert mscop.get_last_line(b"\x00" * 5000 + footer) == ""
+
+def test_read_metadata():
+
+    import struct
+    from measury import metadata
+
+    # ImageJ: 4 pixels per micron
+    description = b"ImageJ=1.53\nunit=micron\n\0"
+    header = b"II*\x00" + struct.pack("<I", 8)
+    entries_end = 8 + 2 + 2 * 12 + 4
+    tiff = header + struct.pack("<H", 2)
+    tiff += struct.pack("<HHII", 270, 2, len(description), entries_end)
+    tiff += struct.pack("<HHII", 282, 5, 1, entries_end + len(description))
+    tiff += struct.pack("<I", 0) + description + struct.pack("<II", 4, 1)
+    result = metadata.read_metadata(tiff)
+    assert result.pixel_size == pytest.approx(0.25e-6)
+    assert result.source == "detect_imagej"
+
+    # FEI
+    tags = {metadata.FEI_HELIOS: "[Scan]\r\nPixelWidth=2.5e-09\r\n[System]\r\nSystemType=Helios G4\r\n"}
+    assert metadata.detect_fei(b"", tags) == (("Helios G4", 2.5e-9))
+
+    # XML footer of Zeiss Orion files
+    footer = b"\n<ImageTags><Scan><PixelSize>0.5 nm</PixelSize></Scan></ImageTags>\x00\n"
+    result = metadata.read_metadata(b"\x89PNG\r\n" + bytes(range(256)) + footer)
+    assert result.pixel_size == pytest.approx(0.5e-9)
+    assert metadata.match_microscope(result.instrument, mscop.load_microscopes()) == "Zeiss_Orion_Nanofab"
+    # the generic profile is not matched, the longest model wins
+    names = ["Generic_Microscope", "Zeiss_Orion", "Zeiss_Orion_Nanofab"]
+    assert metadata.match_microscope("Zeiss Orion NanoFab Microscope", names) == "Zeiss_Orion_Nanofab"
+    assert metadata.match_microscope("Some Microscope", names) is None
+
+    assert metadata.read_metadata(b"no metadata") == metadata.ImageMetadata(tags={})
+    assert metadata.pixel_size_in_unit(2.5e-9) == (pytest.approx(2.5), "nm")
+    assert metadata.pixel_size_in_unit(5e-7) == (pytest.approx(500), "nm")
+
+@pytest.mark.parametrize("shape, dtype", [((60, 80), np.uint8), ((50, 70, 3), np.uint8), ((50, 70, 3), np.uint16)])
+def test_map_uncompressed_tiff(tmp_path, shape, dtype):
+
+    img = (np.arange(np.prod(shape)).reshape(shape) % 251).astype(dtype)
+    cv2.imwrite(str(tmp_path/"image.tif"), img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    byte_stream = image_io.map_file(tmp_path/"image.tif")
+
+    mapped = image_io.map_image(byte_stream)
+    decoded = cv2.cvtColor(cv2.imdecode(np.frombuffer(byte_stream, np.uint8), cv2.IMREAD_UNCHANGED), cv2.COLOR_BGR2RGB)
+    assert not mapped.flags.writeable
+    assert np.array_equal(mapped, decoded)
+
+def test_storage_container(tmp_path):
+
+    img = (np.arange(60*80).reshape(60, 80) % 251).astype(np.uint8)
+    _, encoded = cv2.imencode(".tif", img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    structure_data = {"lines": [("EditLineVisual", dict(coords=np.array([[0., 1.], [2., 3.]]), num_points=2))]}
+    scaling = ("100", "1", "µm", ((0.1, 0.9), True, 10, "horizontal"))
+    storage.write_storage_file(tmp_path/"file.msry", structure_data, encoded.tobytes(), scaling, np.array([5., 7.]), 90)
+
+    manifest = storage.read_manifest(tmp_path/"file.msry")
+    assert manifest["version"] == storage.FORMAT_VERSION
+    storage_file = storage.StorageFile(tmp_path/"file.msry")
+    (obj_type, state), = storage_file.structures["lines"]
+    assert obj_type == "EditLineVisual"
+    assert state["coords"].dtype == np.float64
+    assert np.array_equal(state["coords"], [[0, 1], [2, 3]])
+    assert storage_file.scaling == ("100", "1", "µm", ([0.1, 0.9], True, 10, "horizontal"))
+    assert np.array_equal(storage_file.origin, [5, 7])
+    assert storage_file.img_rotation == 90
+    byte_stream = storage_file.read_image()
+    assert bytes(byte_stream) == encoded.tobytes()
+    assert np.array_equal(image_io.decode_image(byte_stream)[:, :, 0], img)
+
+    # the mapped file is closed before it is replaced
+    storage.write_storage_file(tmp_path/"file.msry", {}, byte_stream, source=storage_file)
+    with pytest.raises(ValueError):
+        bytes(byte_stream)
+    with storage.StorageFile(tmp_path/"file.msry") as storage_file:
+        assert not storage_file.structures
+        assert bytes(storage_file.read_image()) == encoded.tobytes()
+
+    # arrays that view the image keep the file from being unmapped
+    storage_file = storage.StorageFile(tmp_path/"file.msry")
+    view = np.frombuffer(storage_file.read_image(), dtype=np.uint8)
+    with pytest.raises(BufferError):
+        storage_file.close()
+    del view
+    storage_file.close()
+
+def test_lazy_imports():
+
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, measury, measury.measurements; "
+        "print(any(name in sys.modules for name in ('PySide6', 'vispy', 'scipy.ndimage')))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch(tmp_path, workers):
+
+    from measury import batch
+    import csv
+
+    # images with scale bars of 100 and 50 pixels
+    for name, bar_width in [("a.png", 100), ("b.png", 50)]:
+        img = np.zeros((100, 200, 3), dtype=np.uint8)
+        img[90:95, 10:10 + bar_width] = 255
+        cv2.imwrite(str(tmp_path/name), img)
+    (tmp_path/"c.png").write_bytes(b"no image")
+
+    structure_data = {"lines": [("EditLineVisual", dict(coords=np.array([[0., 0.], [30., 40.]]), num_points=2))]}
+    scaling = ("100", "10", "µm", ((20, 92), False, 10, "horizontal"))
+    storage.write_storage_file(tmp_path/"template.msry", structure_data, scaling=scaling)
+
+    assert batch.main([str(tmp_path), "-t", str(tmp_path/"template.msry"),
+                       "-o", str(tmp_path/"results.csv"), "-w", str(workers)]) == 1
+    with open(tmp_path/"results.csv", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    lengths = {Path(row["image"]).name: float(row["value"]) for row in rows if row["property"] == "length"}
+    assert lengths == pytest.approx({"a.png": 5.0, "b.png": 10.0})
+    assert any(Path(row["image"]).name == "c.png" and row["error"] for row in rows)
+
+@pytest.mark.parametrize("bar_width", [40, 1500])
+def test_fill_scale_bar(bar_width):
+
+    from measury import measurements
+
+    img = np.zeros((400, 2000, 3), dtype=np.uint8)
+    img[300:310, 100:100 + bar_width] = 200
+    img[305, 100] = 195
+
+    scale_px, mask, (x, y, width, height) = measurements.find_scale_bar_width(img, (110, 303), relative=False)
+    assert scale_px == bar_width
+    assert (x, y, width, height) == (100, 300, bar_width, 10)
+
+    # the same as filling the whole image
+    full_mask = np.zeros((402, 2002), dtype=np.uint8)
+    cv2.floodFill(img.copy(), full_mask, (110, 303), (0, 0, 0), [10] * 3, [10] * 3, 4 | cv2.FLOODFILL_MASK_ONLY | (1 << 8))
+    assert np.array_equal(mask, full_mask[1 + y:1 + y + height, 1 + x:1 + x + width].astype(bool))
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270, -90])
+def test_rotation_matrix(rotation):
+
+    from measury import measurements
+
+    img = np.arange(4 * 6).reshape(4, 6)
+    rotated = measurements.rotate_image_data(img, rotation)
+    matrix = measurements.rotation_matrix(rotation, img.shape)
+    y, x = np.indices(img.shape).reshape(2, -1)
+    # the centers of the pixels are mapped to the centers of the rotated pixels
+    new_x, new_y, _ = matrix @ np.stack((x + 0.5, y + 0.5, np.ones_like(x)))
+    assert np.array_equal(rotated[(new_y - 0.5).astype(int), (new_x - 0.5).astype(int)], img[y, x])
+
+@pytest.mark.parametrize("order", [0, 1, 2, 3, 5])
+def test_image_cache(order):
+
+    from measury import measurements
+    from scipy.ndimage import map_coordinates
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    coords = rng.uniform(-2, 62, (2, 500))
+
+    cache = measurements.ImageCache(img)
+    expected = map_coordinates(np.sum(img, axis=2, dtype=np.float64), coords, order=order, mode="constant")
+    assert np.allclose(cache.map_coordinates(coords, order=order), expected)
+    assert cache.spline_coefficients(order) is cache.spline_coefficients(order)
+
+@pytest.mark.parametrize("order", [0, 1])
+@pytest.mark.parametrize("vertical", [False, True])
+def test_axis_aligned_profile(order, vertical):
+
+    from measury import measurements
+
+    rng = np.random.default_rng(1)
+    cache = measurements.ImageCache(rng.integers(0, 256, (70, 70, 3), dtype=np.uint8))
+    starts = np.column_stack((np.full(13, 3.3), np.linspace(2.2, 40.7, 13)))
+    ends = np.column_stack((np.full(13, 61.9), np.linspace(2.2, 40.7, 13)))
+    if vertical:
+        starts, ends = starts[:, ::-1], ends[:, ::-1]
+    grid = measurements.sample_lines(starts, ends, 97)
+
+    profile = measurements.axis_aligned_profile(cache.gray, grid, order)
+    assert profile is not None
+    expected = cache.map_coordinates(grid[..., ::-1].reshape(-1, 2).T, order=order).reshape(13, 97).sum(axis=0)
+    assert np.allclose(profile, expected)
+
+    # rotated grids are sampled point by point
+    assert measurements.axis_aligned_profile(cache.gray, grid + rng.uniform(0, 1, grid.shape), order) is None
+
+def test_object_store():
+
+    from measury.object_store import ObjectStore
+
+    class Box:
+        uid = None
+        on_geometry_change = None
+        def __init__(self, lower, upper):
+            self.bounds = (np.array(lower, float), np.array(upper, float))
+        def extent(self):
+            return self.bounds
+        def move(self, offset):
+            self.bounds = tuple(b + offset for b in self.bounds)
+            self.on_geometry_change(self)
+
+    store = ObjectStore(cell_size=10)
+    a, b, c = Box((0, 0), (5, 5)), Box((3, 3), (25, 25)), Box((100, 100), (110, 110))
+    store.rebuild({"s1": [a, b]})
+    store.add(c, "s2")
+    assert store.locate(c) == ("s2", 0)
+    assert store.hit_test((4, 4)) == [b, a]
+    assert store.query((90, 90), (200, 200)) == [c]
+
+    c.move((-100, -100))
+    assert store.hit_test((4, 4)) == [c, b, a]
+    assert store.remove(a) == ("s1", 0)
+    assert store.locate(b) == ("s1", 0)
+    assert store.hit_test((1, 1)) == [c]
+    with pytest.raises(LookupError):
+        store.locate(a)
+    store.add(a, "s1", index=0)
+    assert store.locate(b) == ("s1", 1)
+    store.remove(c)
+    assert "s2" not in store.structures
+
+def test_collection_indices():
+
+    from measury.shape_collection import RECORD_DTYPE, outline_segments, fan_triangles
+
+    records = np.zeros(3, dtype=RECORD_DTYPE)
+    records["start"], records["count"], records["closed"] = [0, 4, 7], [4, 3, 2], [True, False, True]
+    assert outline_segments(records).tolist() == [[0, 1], [1, 2], [2, 3], [3, 0], [4, 5], [5, 6], [7, 8], [8, 7]]
+    assert fan_triangles(records).tolist() == [[0, 1, 2], [0, 2, 3]]
+
+def test_results_table():
+
+    from measury.object_store import ObjectStore
+    from measury.results_table import ResultsTable
+    from measury import measurements
+
+    rng = np.random.default_rng(2)
+    lines = [Line(rng.uniform(0, 100, (3, 2))) for _ in range(20)]
+    store, table = ObjectStore(), ResultsTable()
+    store.observers.append(table)
+    store.rebuild({"lines": lines[:15]})
+    for line in lines[15:]:
+        store.add(line, "lines")
+
+    def expected():
+        return measurements.calculate_results(
+            {"lines": [line.output_properties() for line in store.structures["lines"]]}, 2.0, "nm")["lines"]
+
+    def check():
+        results = table.results(2.0, "nm")["lines"]
+        for prop, (mean, error, unit) in expected().items():
+            assert np.allclose(results[prop][0], mean) and np.allclose(results[prop][1], error)
+            assert results[prop][2] == unit
+
+    check()
+    lines[3].coords += 5
+    lines[3].coords[0] = [1, 2]
+    store.mark_dirty(lines[3])
+    for line in lines[:10]:
+        store.remove(line)
+    check()
+    store.rename("lines", "segments")
+    assert list(table.results()) == ["segments"]
+
+    # lines with a different number of points are not averaged
+    store.add(Line([[0, 0], [1, 1]]), "segments")
+    assert list(table.results()["segments"]) == ["lines have different number of points: "]
+
+    # a scalar radius is used for both radii
+    from measury.results_table import PropertyTable
+    radii = PropertyTable()
+    radii.add(1, dict(radius=(3.0, "px")))
+    radii.add(2, dict(radius=((1.0, 5.0), "px")))
+    radii.add(3, dict(radius=(2.0, "px")))
+    assert radii.column("radius").tolist() == [[3, 3], [1, 5], [2, 2]]
+    assert np.allclose(radii.stats["radius"].mean, [2, 10 / 3])
+    with pytest.raises(ValueError):
+        radii.add(4, dict(area=(1.0, "px^2"), radius=((1.0, 2.0, 3.0), "px")))
+    # a row that does not fit leaves the table unchanged
+    assert len(radii) == 3 and "area" not in radii.columns
+    assert np.allclose(radii.stats["radius"].mean, [2, 10 / 3])
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".h5"])
+def test_export_measurements(tmp_path, suffix):
+
+    import csv
+    from measury.object_store import ObjectStore
+    from measury.results_table import ResultsTable
+    from measury import export, measurements
+
+    if suffix == ".parquet":
+        pytest.importorskip("pyarrow")
+    if suffix == ".h5":
+        pytest.importorskip("h5py")
+
+    rng = np.random.default_rng(3)
+    lines = [Line(rng.uniform(0, 100, (2, 2))) for _ in range(5)]
+    angles = [Line(rng.uniform(0, 100, (3, 2))) for _ in range(3)]
+    store, table = ObjectStore(), ResultsTable()
+    store.observers.append(table)
+    store.rebuild({"lines": list(lines), "a,b": list(angles)})
+    store.remove(lines[1])
+
+    blocks = export.measurement_blocks(table, store.locations, scaling_factor=0.5, length_unit="nm")
+    export.export_measurements(tmp_path/f"table{suffix}", blocks, image="image.tif")
+    # read the table back as {column: values}
+    if suffix == ".csv":
+        with open(tmp_path/"table.csv", encoding="utf-8") as file:
+            rows = list(csv.DictReader(file))
+        columns = {name: [row[name] for row in rows] for name in rows[0]}
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+        columns = pq.read_table(tmp_path/"table.parquet").to_pydict()
+    else:
+        import h5py
+        with h5py.File(tmp_path/"table.h5") as file:
+            columns = {
+                name: list(file[name].asstr()[()] if name in ("image", "structure") else file[name][()])
+                for name in file
+            }
+    assert len(columns["object"]) == 7
+    assert columns["structure"] == ["lines"] * 4 + ["a,b"] * 3
+    assert [int(index) for index in columns["object"]] == [0, 1, 2, 3, 0, 1, 2]
+    assert columns["image"][1] == "image.tif"
+    length = measurements.line_length(lines[2].coords)
+    assert np.isclose(float(columns["length [px]"][1]), length)
+    assert np.isclose(float(columns["length [nm]"][1]), 0.5 * length)
+    assert np.allclose([float(columns[f"length[{i}] [nm]"][5]) for i in range(2)], 0.5 * measurements.line_length(angles[1].coords))
+    assert np.isnan(float(columns["length [px]"][5]))
+
+def test_detect_particles():
+
+    from measury import measurements
+
+    img = np.full((200, 300), 200, dtype=np.uint8)
+    cv2.ellipse(img, ((150, 100), (60, 30), 30), 20, -1)
+    cv2.circle(img, (40, 40), 8, 20, -1)
+    cv2.circle(img, (0, 150), 10, 20, -1)  # touches the border
+
+    particles = measurements.detect_particles(img)
+    assert len(particles) == 2
+    ellipse = max(particles, key=lambda p: p[1]["radius"].prod())[1]
+    assert np.allclose(ellipse["center"], (150, 100), atol=1)
+    assert np.allclose(sorted(ellipse["radius"]), (15, 30), atol=1.5)
+
+    # the angle turns the axes of the object onto the axes of the particle,
+    # the major axis of the particle is tilted by 30 degrees
+    from measury.drawable_objects import box_corners
+    tilted = np.full((200, 300), 200, dtype=np.uint8)
+    cv2.ellipse(tilted, ((150, 100), (80, 30), 30), 20, -1)
+    (_, state), = measurements.detect_particles(tilted)
+    corners = box_corners(state["center"], *(2 * state["radius"]), state["angle"])
+    axes = (corners[1] - corners[0], corners[1] - corners[2])
+    major = axes[np.argmax(state["radius"])]
+    assert np.isclose(abs(np.dot(major / np.linalg.norm(major), (np.cos(np.pi / 6), np.sin(np.pi / 6)))), 1, atol=1e-3)
+    assert np.allclose(sorted(np.linalg.norm(axes, axis=1)), (30, 80), atol=2)
+
+    # only the particle inside of the roi
+    particles = measurements.detect_particles(img, roi=(100, 50, 120, 110), shape="polygon")
+    assert [p[0] for p in particles] == ["EditPolygonVisual"]
+    assert np.allclose(particles[0][1]["coords"].mean(axis=0), (150, 100), atol=3)
+
+    # a roi that starts outside of the image ends at the same place
+    (_, state), = measurements.detect_particles(img, roi=(-100, -100, 250, 250))
+    assert np.allclose(state["center"], (40, 40), atol=1)
+    assert measurements.detect_particles(img, roi=(-100, -100, 50, 50)) == []
+
+def test_journal(tmp_path, monkeypatch):
+
+    from measury import journal
+    from measury.object_store import ObjectStore
+
+    store = ObjectStore()
+    a, b, c = Line([[0, 0], [1, 1]]), Line([[2, 2], [3, 3]]), Line([[4, 4], [5, 5]])
+    store.rebuild({"s1": [a]})
+    image = tmp_path/"image.tif"
+    log = journal.Journal(store, image, dict(origin=[0.0, 0.0], rotation=0))
+    assert log.path == tmp_path/"image.tif.msry-journal"
+    assert [path.read_text() for path in log.pointer.parent.iterdir()] == [str(log.path.resolve())]
+
+    def replayed():
+        state = journal.read_journal(log.path)
+        return {structure: [obj["coords"].tolist() for _, obj in objects] for structure, objects in state.structures.items()}
+
+    store.add(b, "s1", index=0)
+    store.add(c, "s2")
+    a.move((1, 1))
+    log.flush()
+    assert replayed() == {"s1": [[[2, 2], [3, 3]], [[1, 1], [2, 2]]], "s2": [[[4, 4], [5, 5]]]}
+    # an edit only writes the objects it changed
+    size = log.path.stat().st_size
+    c.move((1, 1))
+    log.flush(dict(origin=[5.0, 0.0], rotation=90))
+    assert log.path.stat().st_size - size < 200
+
+    store.remove(b)
+    store.rename("s2", "s3")
+    log.flush()
+    state = journal.read_journal(log.path)
+    assert replayed() == {"s1": [[[1, 1], [2, 2]]], "s3": [[[5, 5], [6, 6]]]}
+    assert state.file == image and state.rotation == 90 and state.origin.tolist() == [5, 0]
+    # the session is running
+    assert not journal.is_crashed(log.path)
+
+    # the journal is rewritten as one snapshot
+    monkeypatch.setattr(journal, "COMPACT_RECORDS", log.n_records + 3)
+    for _ in range(3):
+        a.move((1, 1))
+        log.flush()
+    assert log.n_records == 0
+    assert len(log.path.read_text().splitlines()) == 3
+    assert replayed() == {"s1": [[[4, 4], [5, 5]]], "s3": [[[5, 5], [6, 6]]]}
+    assert journal.read_journal(log.path).rotation == 90
+
+    # a record cut off by a crash is ignored
+    with open(log.path, "a") as file:
+        file.write('{"op": "remove", "uid"')
+    assert replayed() == {"s1": [[[4, 4], [5, 5]]], "s3": [[[5, 5], [6, 6]]]}
+
+    log.close()
+    assert not log.path.exists() and not log.pointer.exists()
+    assert journal.read_journal(log.path) is None